@@ -4,19 +4,74 @@ API REST para remoção de fundo.
 Recebe pedidos de sites externos via HTTP.
 """
 
-import io
+import asyncio
+import json
 import os
-from fastapi import APIRouter, FastAPI, File, Form, HTTPException, UploadFile
+import time
+from pathlib import PurePosixPath
+from contextlib import asynccontextmanager
+
+from fastapi import APIRouter, FastAPI, File, Form, Header, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from PIL import Image
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from PIL import UnidentifiedImageError
+
+import metricas
+from cache import CacheLRU, chave_resultado, criar_cache_do_ambiente
+from codificadores import CODIFICADORES, NEGOCIAVEIS, negociar
+import core
+from core import MAX_SIZE, remover_fundo
+from executor import FilaCheia, criar_executor_do_ambiente
+from ingestao import ImagemGrandeDemais, abrir_com_dimensoes, abrir_imagem, verificar_dimensoes
+from pacotes import ZipEmFluxo, entradas
+from tarefas import CONCLUIDA, ERRO, FilaTarefas, TrabalhadorTarefas
+from tarefas import config_do_ambiente as config_tarefas
+from uploads import LimiteCorpo, UploadGrandeDemais, entrada_em_disco, ler_upload
+from uploads import config_do_ambiente as config_uploads
+from variantes import variantes
+
+
+class Prontidao:
+    """
+    Estado da carga inicial. O servidor aceita conexões na hora (GET /api/live responde),
+    mas só fica pronto (GET /api/ready = 200) depois que os modelos de REMOVEBG_PRECARREGAR
+    (ou o modelo padrão) foram carregados e aquecidos em segundo plano.
+    """
+
+    def __init__(self):
+        self.pronto = False
+        self.erro: str | None = None
+        self.inicio = time.time()
+        self.duracao_s: float | None = None
+
+    async def carregar(self):
+        try:
+            await asyncio.to_thread(core.pre_carregar)
+            self.pronto = True
+        except Exception as e:
+            self.erro = f"{type(e).__name__}: {e}"
+        finally:
+            self.duracao_s = round(time.time() - self.inicio, 3)
+
+
+prontidao = Prontidao()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    carga = asyncio.create_task(prontidao.carregar())
+    trabalhador.iniciar()
+    yield
+    carga.cancel()
+    await trabalhador.parar()
+    executor.fechar()
 
-from core import remover_fundo
 
 app = FastAPI(
     title="RemoverBG API",
     description="API para remoção de fundo de imagens. Use em seu site ou aplicação.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS - permite requisições de sites externos
@@ -30,6 +85,392 @@ app.add_middleware(
 
 router = APIRouter(prefix="/api")
 MODELOS = ["u2netp", "u2net", "isnet-general-use", "birefnet-general", "bria-rmbg", "u2net_human_seg"]
+# Variantes quantizadas aprovadas (quantizar.py), ex: u2net-int8
+_variantes = variantes()
+MODELOS += list(_variantes)
+# modelo=auto: modelos da cascata (REMOVEBG_AUTO_MODELOS) precisam ser modelos válidos
+_fora = [m for m in core.CASCATA if m not in MODELOS]
+if _fora or not core.CASCATA:
+    raise ValueError(f"REMOVEBG_AUTO_MODELOS com modelos desconhecidos: {', '.join(_fora) or '(vazio)'}")
+# Decisões do modelo=auto por arquivo e max_size: repetir a imagem não roda a avaliação de novo
+_decisoes_auto = CacheLRU(10_000, tamanho=lambda _: 1)
+# Maior tamanho de inferência aceito (lado maior, em pixels)
+MAX_INFERENCIA = 2048
+# Tamanho dos uploads e pixels decodificados por imagem (REMOVEBG_UPLOAD_*, REMOVEBG_MAX_MEGAPIXELS)
+_config_uploads = config_uploads()
+MAX_PIXELS = _config_uploads["max_pixels"]
+
+# Inferência roda fora do event loop, com limite e fila por modelo
+executor = criar_executor_do_ambiente()
+for _nome, _info in _variantes.items():
+    # Sem limite próprio em REMOVEBG_CONCORRENCIA, a variante herda o do modelo base
+    executor.limites.setdefault(_nome, executor.limite(_info["base"]))
+# O limite por modelo vale para as inferências: o agendador roda `limite` lotes do modelo ao mesmo tempo
+core.agendador.paralelos = executor.limite
+# Resultados já calculados, por hash do arquivo + opções
+cache = criar_cache_do_ambiente()
+# Tarefas assíncronas (POST /api/jobs), persistidas em REMOVEBG_TAREFAS_DIR
+_config_tarefas = config_tarefas()
+fila_tarefas = FilaTarefas(_config_tarefas["pasta"], _config_tarefas["prazo_s"], _config_tarefas["max_tentativas"])
+
+
+def _series(dados: dict, campo: str, rotulo: str = "modelo"):
+    """Pares (rótulos, valor) de um campo de estatisticas() por modelo, para os medidores."""
+    return [({rotulo: nome}, valores[campo]) for nome, valores in dados.items()]
+
+
+# GET /api/metrics (Prometheus)
+registro = metricas.Registro()
+m_pedidos = registro.contador(
+    "removebg_pedidos_total", "Pedidos HTTP por rota, método e status", ("rota", "metodo", "status")
+)
+m_latencia = registro.histograma(
+    "removebg_pedido_segundos", "Latência HTTP até os cabeçalhos da resposta", ("rota",)
+)
+m_em_andamento = registro.medidor("removebg_pedidos_em_andamento", "Pedidos HTTP sendo atendidos")
+m_resultados = registro.contador(
+    "removebg_resultados_total", "Resultados entregues por modelo e origem (cache ou calculado)", ("modelo", "origem")
+)
+m_processamento = registro.histograma(
+    "removebg_processamento_segundos", "Tempo de decodificação + remoção + codificação no pool", ("modelo",)
+)
+m_espera = registro.histograma(
+    "removebg_espera_fila_segundos", "Espera pela vez no executor (limite por modelo)", ("modelo",)
+)
+m_etapas = registro.histograma(
+    "removebg_etapa_segundos", "Tempo de cada etapa do pipeline (core.medir_etapa)", ("modelo", "etapa")
+)
+m_megapixels = registro.histograma(
+    "removebg_entrada_megapixels", "Tamanho das imagens enviadas", ("modelo",), metricas.LIMITES_MEGAPIXELS
+)
+m_bytes = registro.histograma(
+    "removebg_resposta_bytes", "Tamanho dos resultados", ("formato",), metricas.LIMITES_BYTES
+)
+m_upload_bytes = registro.histograma(
+    "removebg_upload_bytes", "Tamanho dos arquivos enviados", ("rota",), metricas.LIMITES_BYTES
+)
+m_recusados = registro.contador(
+    "removebg_uploads_recusados_total", "Uploads recusados com 413, por motivo (bytes ou pixels)", ("motivo",)
+)
+m_auto = registro.contador("removebg_auto_total", "Pedidos com modelo=auto, por modelo escolhido", ("modelo",))
+registro.medidor(
+    "removebg_fila_espera", "Pedidos aguardando o executor, por modelo", ("modelo",),
+    lambda: _series(executor.estatisticas(), "na_fila"),
+)
+registro.medidor(
+    "removebg_execucoes_em_andamento", "Pedidos rodando no executor, por modelo", ("modelo",),
+    lambda: _series(executor.estatisticas(), "rodando"),
+)
+registro.medidor(
+    "removebg_tarefas_na_fila", "Tarefas assíncronas aguardando, por modelo", ("modelo",),
+    lambda: _series(fila_tarefas.estatisticas(), "na_fila"),
+)
+registro.contador(
+    "removebg_sessoes_carregamentos_total", "Modelos carregados do disco", ("modelo",),
+    lambda: _series(core._sessions.estatisticas()["modelos"], "carregamentos"),
+)
+registro.contador(
+    "removebg_sessoes_acertos_total", "Pedidos que encontraram o modelo já carregado", ("modelo",),
+    lambda: _series(core._sessions.estatisticas()["modelos"], "acertos"),
+)
+registro.contador(
+    "removebg_sessoes_remocoes_total", "Modelos descarregados pelo orçamento de memória", ("modelo",),
+    lambda: _series(core._sessions.estatisticas()["modelos"], "remocoes"),
+)
+registro.medidor(
+    "removebg_sessoes_memoria_bytes", "Memória estimada dos modelos carregados",
+    coletar=lambda: [({}, core._sessions.estatisticas()["memoria_mb"] * 1024 * 1024)],
+)
+registro.contador(
+    "removebg_cache_acertos_total", "Resultados servidos do cache (memória ou disco)",
+    coletar=lambda: [({}, cache.estatisticas()["acertos"])],
+)
+registro.contador(
+    "removebg_cache_falhas_total", "Resultados calculados por não estarem no cache",
+    coletar=lambda: [({}, cache.estatisticas()["falhas"])],
+)
+registro.medidor(
+    "removebg_cache_memoria_bytes", "Bytes no cache de resultados em memória",
+    coletar=lambda: [({}, cache.estatisticas()["memoria_bytes"])],
+)
+registro.medidor(
+    "process_resident_memory_bytes", "RSS do processo",
+    coletar=lambda: [({}, v) for k, v in metricas.memoria_processo().items() if k == "rss"],
+)
+registro.medidor(
+    "removebg_pico_memoria_bytes", "Maior RSS do processo desde o início",
+    coletar=lambda: [({}, v) for k, v in metricas.memoria_processo().items() if k == "pico_rss"],
+)
+
+
+class ImagemInvalida(Exception):
+    """Arquivo enviado não pôde ser decodificado como imagem."""
+
+
+def _imagem_invalida(e: Exception) -> ImagemInvalida:
+    """ImagemInvalida com uma mensagem para o cliente: a do Pillow cita o stream (`<_io.BytesIO object at 0x...>`)."""
+    if isinstance(e, UnidentifiedImageError):
+        return ImagemInvalida("formato de imagem não reconhecido")
+    return ImagemInvalida(str(e))
+
+
+def _tamanho_leitura(max_size: int, tamanho_saida: int | None) -> int | None:
+    """Decodifica só até o maior tamanho necessário (tamanho_saida=0: resolução original)."""
+    if tamanho_saida == 0:
+        return None
+    return max(max_size, tamanho_saida or 0)
+
+
+def _processar(
+    contents: bytes | str,
+    modelo: str,
+    alpha_matting: bool,
+    bgcolor: tuple[int, int, int, int] | None,
+    max_size: int = MAX_SIZE,
+    tamanho_saida: int | None = None,
+    formato: str = "png",
+    max_pixels: int | None = MAX_PIXELS,
+    margem_objeto: int | None = None,
+) -> tuple[bytearray, dict[str, float], float]:
+    """
+    Decodifica, remove o fundo e codifica no formato pedido (roda no pool do executor).
+    `contents` são os bytes enviados ou o caminho do upload guardado em disco.
+    Devolve (resultado, segundos por etapa, megapixels da imagem enviada); os tempos
+    voltam no resultado porque no executor de processos as métricas ficam no processo principal.
+    """
+    tamanho_leitura = _tamanho_leitura(max_size, tamanho_saida)
+
+    with core.medindo_etapas() as tempos:
+        with core.medir_etapa("decodificacao"):
+            try:
+                img, (largura, altura) = abrir_com_dimensoes(contents, tamanho_leitura, max_pixels)
+                megapixels = largura * altura / 1e6
+                img.load()
+            except ImagemGrandeDemais:
+                raise
+            except Exception as e:
+                raise _imagem_invalida(e) from e
+
+        codificador = CODIFICADORES[formato]
+        output = remover_fundo(
+            img,
+            modelo=modelo,
+            alpha_matting=alpha_matting,
+            bgcolor=None if codificador.so_mascara else bgcolor,
+            max_size=max_size,
+            tamanho_saida=tamanho_saida,
+            margem_objeto=margem_objeto,
+        )
+        with core.medir_etapa("codificacao"):
+            dados = codificador.codificar(output)
+    return dados, tempos, megapixels
+
+
+def _avaliar(
+    contents: bytes | str,
+    modelo: str,
+    max_size: int,
+    tamanho_saida: int | None,
+    max_pixels: int | None = MAX_PIXELS,
+) -> float:
+    """
+    Incerteza da máscara de `modelo` (roda no pool do executor). A imagem é decodificada
+    como em _processar, então o recorte seguinte com o mesmo modelo reaproveita a máscara
+    do cache de etapas.
+    """
+    try:
+        img = abrir_imagem(contents, _tamanho_leitura(max_size, tamanho_saida), max_pixels)
+        img.load()
+    except ImagemGrandeDemais:
+        raise
+    except Exception as e:
+        raise _imagem_invalida(e) from e
+    return core.avaliar_modelo(core.preparar_inferencia(img, max_size), modelo)
+
+
+def _opcoes_auto(max_size: int) -> dict:
+    """Opções que definem a decisão do modelo=auto (chave de _decisoes_auto)."""
+    return {"modelo": core.MODELO_AUTO, "max_size": max_size, "cascata": core.CASCATA, "limiar": core.LIMIAR_AUTO}
+
+
+async def _resolver_modelo(
+    contents: bytes | str, modelo: str, opcoes: dict, chave: str | None = None
+) -> tuple[str, float | None]:
+    """
+    (modelo que processa o pedido, incerteza que levou a ele). Com modelo=auto, mesma regra
+    de core.escolher_modelo, mas cada avaliação roda no executor sob o limite do próprio
+    modelo. Com `contents` sendo um caminho, a `chave` vem de uploads.Entrada.
+    """
+    if modelo != core.MODELO_AUTO:
+        return modelo, None
+    chave = chave or chave_resultado(contents, **_opcoes_auto(opcoes["max_size"]))
+    decisao = _decisoes_auto.get(chave)
+    if decisao is None:
+        nota = None
+        for candidato in core.CASCATA[:-1]:
+            nota = await executor.executar(
+                candidato, _avaliar, contents, candidato, opcoes["max_size"], opcoes["tamanho_saida"]
+            )
+            if nota <= core.LIMIAR_AUTO:
+                break
+        else:
+            candidato = core.CASCATA[-1]
+        decisao = (candidato, nota)
+        _decisoes_auto.put(chave, decisao)
+    m_auto.inc(modelo=decisao[0])
+    return decisao
+
+
+def _validar_opcoes(
+    modelo: str,
+    max_size: int,
+    tamanho_saida: int | None,
+    formato: str | None,
+    accept: str | None,
+    margem: int = 0,
+):
+    """Valida as opções comuns de /api/remove e /api/jobs e devolve o codificador de saída."""
+    if modelo not in MODELOS and modelo != core.MODELO_AUTO:
+        raise HTTPException(400, f"Modelo inválido. Use: {core.MODELO_AUTO}, {', '.join(MODELOS)}")
+    if not 0 < max_size <= MAX_INFERENCIA:
+        raise HTTPException(400, f"max_size deve estar entre 1 e {MAX_INFERENCIA}")
+    if tamanho_saida is not None and tamanho_saida < 0:
+        raise HTTPException(400, "tamanho_saida deve ser >= 0")
+    if margem < 0:
+        raise HTTPException(400, "margem deve ser >= 0")
+    codificador = negociar(formato, accept)
+    if codificador is None:
+        if formato:
+            raise HTTPException(400, f"Formato inválido. Use: {', '.join(CODIFICADORES)}")
+        tipos = ", ".join(CODIFICADORES[nome].media_type for nome in NEGOCIAVEIS)
+        raise HTTPException(406, f"Formatos disponíveis no Accept: {tipos}")
+    return codificador
+
+
+def _opcoes(
+    alpha_matting: bool,
+    bgcolor: str | None,
+    max_size: int,
+    tamanho_saida: int | None,
+    codificador,
+    cortar: bool,
+    margem: int,
+) -> dict:
+    """Opções do processamento (e da chave do cache). Sem corte, as chaves ficam como antes."""
+    opcoes = {
+        "alpha_matting": alpha_matting,
+        "bgcolor": _cor_de_fundo(bgcolor),
+        "max_size": max_size,
+        "tamanho_saida": tamanho_saida,
+        "formato": codificador.nome,
+    }
+    if cortar:
+        opcoes["margem_objeto"] = margem
+    return opcoes
+
+
+def _cor_de_fundo(bgcolor: str | None) -> tuple[int, int, int, int] | None:
+    """Cor hex (ex: FFFFFF) em RGBA; vazio ou inválido = transparente."""
+    if bgcolor and bgcolor.strip():
+        hex_color = bgcolor.strip().lstrip("#")
+        if len(hex_color) == 6:
+            r = int(hex_color[0:2], 16)
+            g = int(hex_color[2:4], 16)
+            b = int(hex_color[4:6], 16)
+            return (r, g, b, 255)
+    return None
+
+
+async def _resultado_em_cache(
+    contents: bytes | str, modelo: str, opcoes: dict, chave: str | None = None
+) -> tuple[bytearray | bytes, str]:
+    """
+    (resultado, origem) pelo cache (memória, disco, cálculo em andamento) ou rodando no executor.
+    Com `contents` sendo o caminho de um upload em disco, a `chave` vem de uploads.Entrada.
+    """
+    chave = chave or chave_resultado(contents, modelo=modelo, **opcoes)
+
+    async def calcular():
+        t0 = time.perf_counter()
+        dados, tempos, megapixels = await executor.executar(modelo, _processar, contents, modelo=modelo, **opcoes)
+        processamento = sum(tempos.values())
+        m_processamento.observar(processamento, modelo=modelo)
+        m_espera.observar(max(time.perf_counter() - t0 - processamento, 0.0), modelo=modelo)
+        for etapa, segundos in tempos.items():
+            m_etapas.observar(segundos, modelo=modelo, etapa=etapa)
+        m_megapixels.observar(megapixels, modelo=modelo)
+        return dados
+
+    dados, origem = await cache.obter_ou_calcular(chave, calcular)
+    m_resultados.inc(modelo=modelo, origem=origem)
+    m_bytes.observar(len(dados), formato=opcoes["formato"])
+    return dados, origem
+
+
+async def _receber(file: UploadFile, rota: str, max_size: int, tamanho_saida: int | None):
+    """
+    Lê o upload em pedaços (uploads.ler_upload) e confere as dimensões pelo cabeçalho,
+    antes de ocupar o executor: 413 se passar do limite de bytes ou de pixels.
+    """
+    try:
+        # Upload grande que o Starlette já pôs em disco é lido de lá, sem outra cópia; o
+        # executor de processos precisa de bytes ou de um caminho
+        entrada = await asyncio.to_thread(
+            ler_upload,
+            file.file,
+            _config_uploads["max_bytes"],
+            _config_uploads["em_memoria"],
+            _config_uploads["pasta"],
+            usar_arquivo=executor.tipo == "thread",
+        )
+    except UploadGrandeDemais as e:
+        m_recusados.inc(motivo="bytes")
+        raise HTTPException(413, str(e))
+    except Exception as e:
+        raise HTTPException(400, f"Imagem inválida: {e}")
+    m_upload_bytes.observar(entrada.tamanho, rota=rota)
+
+    try:
+        await asyncio.to_thread(
+            verificar_dimensoes, entrada.fonte, _tamanho_leitura(max_size, tamanho_saida), MAX_PIXELS
+        )
+    except ImagemGrandeDemais as e:
+        entrada.descartar()
+        m_recusados.inc(motivo="pixels")
+        raise HTTPException(413, f"Imagem grande demais: {e}")
+    except Exception as e:
+        entrada.descartar()
+        raise HTTPException(400, f"Imagem inválida: {_imagem_invalida(e)}")
+    return entrada
+
+
+async def _processar_tarefa(tarefa: dict, caminho: str):
+    """
+    Roda uma tarefa da fila persistente (chamado pelo TrabalhadorTarefas). A imagem fica
+    no arquivo da fila: o executor a decodifica de lá e o hash é lido em pedaços.
+    """
+    opcoes = dict(tarefa["opcoes"])
+    if opcoes["bgcolor"] is not None:
+        opcoes["bgcolor"] = tuple(opcoes["bgcolor"])
+    entrada = await asyncio.to_thread(entrada_em_disco, caminho)
+    chave_auto = entrada.chave(**_opcoes_auto(opcoes["max_size"])) if tarefa["modelo"] == core.MODELO_AUTO else None
+    modelo, _ = await _resolver_modelo(entrada.fonte, tarefa["modelo"], opcoes, chave_auto)
+    dados, _ = await _resultado_em_cache(entrada.fonte, modelo, opcoes, entrada.chave(modelo=modelo, **opcoes))
+    codificador = CODIFICADORES[opcoes["formato"]]
+    return dados, codificador.media_type, codificador.nome_arquivo("removed_bg")
+
+
+trabalhador = TrabalhadorTarefas(
+    fila_tarefas,
+    _processar_tarefa,
+    concorrencia=_config_tarefas["concorrencia"],
+    adiar=(FilaCheia,),
+    espera_adiada=executor.retry_after,
+    ttl_s=_config_tarefas["ttl_s"],
+    url_resultado=lambda tarefa_id: f"/api/jobs/{tarefa_id}/result",
+    callback_hosts=_config_tarefas["callback_hosts"],
+    callback_rede_privada=_config_tarefas["callback_rede_privada"],
+)
 
 
 @router.get("/")
@@ -40,8 +481,16 @@ def root():
         "version": "1.0.0",
         "docs": "/api/docs",
         "endpoints": {
-            "POST /api/remove": "Envie imagem (form-data: file) - retorna PNG sem fundo",
+            "POST /api/remove": "Envie imagem (form-data: file) - retorna PNG/WebP/AVIF sem fundo",
             "GET /api/health": "Status da API",
+            "GET /api/live": "O processo está respondendo (liveness)",
+            "GET /api/ready": "Modelos carregados e aquecidos (readiness): 200 ou 503",
+            "POST /api/remove/batch": "Várias imagens (ou um .zip) - retorna ZIP em fluxo + manifesto",
+            "POST /api/jobs": "Envia imagem para processar em segundo plano - retorna id",
+            "GET /api/jobs/{id}": "Estado da tarefa",
+            "GET /api/jobs/{id}/result": "Resultado da tarefa concluída",
+            "GET /api/stats": "Modelos carregados, filas, tarefas e cache",
+            "GET /api/metrics": "Métricas no formato do Prometheus",
         },
     }
 
@@ -52,24 +501,118 @@ def health():
     return {"status": "ok"}
 
 
+@router.get("/live")
+async def live():
+    """Liveness: o event loop responde. Não depende dos modelos."""
+    return {"status": "ok"}
+
+
+@router.get("/ready", responses={503: {"description": "Ainda carregando os modelos (ou a carga falhou)"}})
+async def ready():
+    """
+    Readiness: 200 só depois que os modelos de REMOVEBG_PRECARREGAR (sem nenhum, o modelo
+    padrão) foram carregados e aquecidos. Com servidor de inferência (REMOVEBG_INFERENCIA),
+    também exige que ele responda com todos os processos prontos.
+    """
+    estado = {
+        "modelos": core.modelos_iniciais(),
+        "carregados": core._sessions.carregados(),
+        "segundos_desde_inicio": round(time.time() - prontidao.inicio, 3),
+    }
+    if prontidao.duracao_s is not None:
+        estado["carga_s"] = prontidao.duracao_s
+    if prontidao.erro:
+        return JSONResponse({"status": "erro", "erro": prontidao.erro, **estado}, status_code=503)
+    if not prontidao.pronto:
+        return JSONResponse({"status": "carregando", **estado}, status_code=503)
+
+    if core.inferencia_remota is not None:
+        servidor = (await asyncio.to_thread(core.inferencia_remota.estatisticas))["servidor"]
+        prontos = [p["pronto"] for p in servidor.get("processos", {}).values()]
+        if "erro" in servidor or not prontos or not all(prontos):
+            return JSONResponse({"status": "inferencia_indisponivel", "inferencia": servidor, **estado}, status_code=503)
+    return {"status": "pronto", **estado}
+
+
+@router.get("/stats")
+def stats():
+    """Estatísticas de modelos (carga/remoção), filas, micro-lotes, tarefas e cache."""
+    return {
+        "modelos": core._sessions.estatisticas(),
+        "filas": executor.estatisticas(),
+        "lotes": core.agendador.estatisticas(),
+        "tarefas": fila_tarefas.estatisticas(),
+        "cache": cache.estatisticas(),
+        **({"inferencia": core.inferencia_remota.estatisticas()} if core.inferencia_remota is not None else {}),
+    }
+
+
+@router.get("/metrics", response_class=Response)
+def metrics():
+    """Contadores, latências (por rota, modelo e etapa), filas, cache, modelos e memória para o Prometheus."""
+    return Response(registro.texto(), media_type=metricas.Registro.TIPO_CONTEUDO)
+
+
 @router.post(
     "/remove",
     response_class=Response,
     responses={
         200: {
-            "content": {"image/png": {}},
-            "description": "Imagem PNG com fundo removido",
-        }
+            "content": {"image/png": {}, "image/webp": {}, "image/avif": {}, "application/json": {}},
+            "description": (
+                "Imagem com fundo removido (só a máscara com formato=mascara;"
+                " caixa + máscara em JSON com formato=rle ou contornos)"
+            ),
+        },
+        304: {"description": "Resultado não mudou (If-None-Match igual ao ETag)"},
+        406: {"description": "O cabeçalho Accept exclui o PNG (q=0) e não aceita outro formato suportado"},
+        413: {"description": "Arquivo acima de REMOVEBG_UPLOAD_MAX_MB ou imagem acima de REMOVEBG_MAX_MEGAPIXELS"},
+        503: {"description": "Fila do modelo cheia - tente de novo após Retry-After segundos"},
     },
 )
 async def remove_background(
     file: UploadFile = File(..., description="Imagem (PNG, JPG, HEIC, etc.)"),
-    modelo: str = Form("u2netp", description="Modelo: u2netp, u2net, birefnet-general, etc."),
-    alpha_matting: bool = Form(False, description="Bordas suaves (mais lento)"),
+    modelo: str = Form(
+        core.MODELO_PADRAO,
+        description="Modelo: u2netp, u2net, birefnet-general, etc. auto = rápido e, se incerto, o preciso",
+    ),
+    alpha_matting: bool = Form(True, description="Bordas suaves (matting na faixa da borda)"),
     bgcolor: str | None = Form(None, description="Cor de fundo hex, ex: FFFFFF"),
+    max_size: int = Form(MAX_SIZE, description="Tamanho da inferência (lado maior, px)"),
+    tamanho_saida: int | None = Form(
+        None, description="Tamanho da saída (lado maior, px). Vazio = igual à inferência, 0 = original"
+    ),
+    formato: str | None = Form(
+        None,
+        description="png, webp, webp-lossy, avif, mascara, rle ou contornos. Vazio = pelo Accept (PNG padrão)",
+    ),
+    cortar: bool = Form(False, description="Corta a saída na caixa do objeto (mais `margem`)"),
+    margem: int = Form(0, description="Margem em px em volta do objeto, com cortar=true"),
+    if_none_match: str | None = Header(None),
+    accept: str | None = Header(None),
 ):
     """
-    Remove o fundo da imagem e retorna PNG com transparência.
+    Remove o fundo da imagem e retorna PNG com transparência (ou WebP/AVIF/máscara).
+
+    O formato vem de `formato` ou, sem ele, do cabeçalho `Accept` (ex: `image/webp`).
+    `formato=mascara` devolve só o alpha, em PNG de um canal. `formato=rle` e
+    `formato=contornos` devolvem JSON com a caixa do objeto e a máscara dentro dela
+    (carreiras do alpha ou polígonos), para compor do lado do cliente.
+
+    `modelo=auto` roda primeiro o modelo rápido e só passa ao preciso quando a máscara
+    sai incerta (REMOVEBG_AUTO_MODELOS, REMOVEBG_AUTO_LIMIAR). O cabeçalho `X-Modelo-Usado`
+    diz qual modelo gerou o resultado e `X-Incerteza` a nota que decidiu.
+
+    `cortar=true` corta a saída na caixa do objeto mais `margem` px: produtos pequenos
+    num fundo grande saem menores e codificam mais rápido.
+
+    `max_size` controla a resolução em que o modelo roda; `tamanho_saida` a da imagem
+    devolvida. Com `tamanho_saida=0` a máscara é ampliada seguindo as bordas da foto e
+    aplicada aos pixels originais: recorte em resolução total pelo custo da inferência
+    em `max_size`.
+
+    A resposta traz um `ETag` derivado do arquivo e das opções. Reenviar o mesmo
+    arquivo com `If-None-Match: <etag>` retorna 304 sem processar de novo.
 
     **Exemplo com cURL:**
     ```bash
@@ -93,48 +636,305 @@ async def remove_background(
     // blob é a imagem PNG
     ```
     """
-    if modelo not in MODELOS:
-        raise HTTPException(400, f"Modelo inválido. Use: {', '.join(MODELOS)}")
+    codificador = _validar_opcoes(modelo, max_size, tamanho_saida, formato, accept, margem)
+    entrada = await _receber(file, "/api/remove", max_size, tamanho_saida)
 
+    opcoes = _opcoes(alpha_matting, bgcolor, max_size, tamanho_saida, codificador, cortar, margem)
     try:
-        contents = await file.read()
-        img = Image.open(io.BytesIO(contents)).convert("RGB")
-    except Exception as e:
+        chave_auto = entrada.chave(**_opcoes_auto(max_size)) if modelo == core.MODELO_AUTO else None
+        modelo_usado, nota = await _resolver_modelo(entrada.fonte, modelo, opcoes, chave_auto)
+        # Mesma chave (e ETag) de um pedido com o modelo escolhido: os dois dividem o cache
+        chave = entrada.chave(modelo=modelo_usado, **opcoes)
+        etag = f'"{chave}"'
+        # O formato pode vir do Accept: caches intermediários precisam separar as variantes
+        cabecalhos = {"ETag": etag, "Vary": "Accept", "X-Modelo-Usado": modelo_usado}
+        if nota is not None:
+            cabecalhos["X-Incerteza"] = f"{nota:.4f}"
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=cabecalhos)
+        dados, origem = await _resultado_em_cache(entrada.fonte, modelo_usado, opcoes, chave)
+    except FilaCheia as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(e.retry_after)})
+    except ImagemGrandeDemais as e:
+        m_recusados.inc(motivo="pixels")
+        raise HTTPException(413, f"Imagem grande demais: {e}")
+    except ImagemInvalida as e:
         raise HTTPException(400, f"Imagem inválida: {e}")
+    except Exception as e:
+        raise HTTPException(500, f"Erro ao processar: {e}")
+    finally:
+        entrada.descartar()
 
-    # Cor de fundo opcional
-    bgcolor_tuple = None
-    if bgcolor and bgcolor.strip():
-        hex_color = bgcolor.strip().lstrip("#")
-        if len(hex_color) == 6:
-            r = int(hex_color[0:2], 16)
-            g = int(hex_color[2:4], 16)
-            b = int(hex_color[4:6], 16)
-            bgcolor_tuple = (r, g, b, 255)
+    return Response(
+        content=memoryview(dados),
+        media_type=codificador.media_type,
+        headers={
+            **cabecalhos,
+            "Content-Disposition": f"attachment; filename={codificador.nome_arquivo('removed_bg')}",
+            "X-Cache": origem,
+        },
+    )
+
+
+async def _zip_lote(arquivos, modelo: str, opcoes: dict, codificador):
+    """
+    Gera o ZIP do lote em pedaços. Até `janela` imagens ficam em andamento (leitura,
+    inferência e codificação se sobrepõem no pool); cada resultado entra no ZIP assim
+    que fica pronto, então a memória não depende do tamanho do lote.
+    """
+    zip_saida = ZipEmFluxo()
+    manifesto = []
+    janela = max(2, 2 * executor.capacidade(modelo))
+    fila = entradas(arquivos, _config_uploads["max_bytes"])
+    pendentes: set[asyncio.Task] = set()
+
+    async def processar(nome: str, ler):
+        t0 = time.perf_counter()
+        try:
+            contents = await asyncio.to_thread(ler)
+            while True:
+                try:
+                    modelo_usado, _ = await _resolver_modelo(contents, modelo, opcoes)
+                    dados, origem = await _resultado_em_cache(contents, modelo_usado, opcoes)
+                    break
+                except FilaCheia as e:
+                    # No lote, fila cheia não é erro: espera e tenta de novo
+                    await asyncio.sleep(e.retry_after)
+            return nome, dados, origem, modelo_usado, None, time.perf_counter() - t0
+        # Mesmas mensagens de /api/remove
+        except ImagemGrandeDemais as e:
+            erro = f"Imagem grande demais: {e}"
+        except (ImagemInvalida, UnidentifiedImageError) as e:
+            erro = f"Imagem inválida: {_imagem_invalida(e)}"
+        except Exception as e:
+            erro = f"Erro ao processar: {e}"
+        return nome, None, None, None, erro, time.perf_counter() - t0
 
     try:
-        output = remover_fundo(
-            img,
-            modelo=modelo,
-            alpha_matting=alpha_matting,
-            bgcolor=bgcolor_tuple,
-        )
-    except Exception as e:
-        raise HTTPException(500, f"Erro ao processar: {e}")
+        esgotado = False
+        while True:
+            while not esgotado and len(pendentes) < janela:
+                proxima = await asyncio.to_thread(next, fila, None)
+                if proxima is None:
+                    esgotado = True
+                else:
+                    pendentes.add(asyncio.create_task(processar(*proxima)))
+            if not pendentes:
+                break
 
-    buffer = io.BytesIO()
-    output.save(buffer, format="PNG")
-    buffer.seek(0)
+            prontas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in prontas:
+                nome, dados, origem, modelo_usado, erro, duracao = tarefa.result()
+                item = {"arquivo": nome, "ms": round(duracao * 1000, 1)}
+                if erro is None:
+                    saida = codificador.nome_arquivo(str(PurePosixPath(nome).with_suffix("")) + "_sem_fundo")
+                    item.update(
+                        status="ok",
+                        saida=await asyncio.to_thread(zip_saida.adicionar, saida, dados),
+                        bytes=len(dados),
+                        cache=origem,
+                        modelo=modelo_usado,
+                    )
+                else:
+                    item.update(status="erro", erro=erro)
+                manifesto.append(item)
+            yield zip_saida.esvaziar()
 
-    return Response(
-        content=buffer.getvalue(),
-        media_type="image/png",
-        headers={"Content-Disposition": "attachment; filename=removed_bg.png"},
+        resumo = {
+            "modelo": modelo,
+            "opcoes": opcoes,
+            "total": len(manifesto),
+            "erros": sum(1 for item in manifesto if item["status"] == "erro"),
+            "arquivos": manifesto,
+        }
+        zip_saida.adicionar("manifesto.json", json.dumps(resumo, ensure_ascii=False, indent=2).encode())
+        yield zip_saida.fechar()
+    finally:
+        # Cliente desconectou: não deixa imagens rodando à toa
+        for tarefa in pendentes:
+            tarefa.cancel()
+
+
+@router.post(
+    "/remove/batch",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/zip": {}}, "description": "ZIP com os resultados e manifesto.json"}},
+)
+async def remove_background_batch(
+    files: list[UploadFile] = File(..., description="Várias imagens e/ou arquivos .zip com imagens"),
+    modelo: str = Form(
+        core.MODELO_PADRAO,
+        description="Modelo: u2netp, u2net, birefnet-general, etc. auto = rápido e, se incerto, o preciso",
+    ),
+    alpha_matting: bool = Form(True, description="Bordas suaves (matting na faixa da borda)"),
+    bgcolor: str | None = Form(None, description="Cor de fundo hex, ex: FFFFFF"),
+    max_size: int = Form(MAX_SIZE, description="Tamanho da inferência (lado maior, px)"),
+    tamanho_saida: int | None = Form(
+        None, description="Tamanho da saída (lado maior, px). Vazio = igual à inferência, 0 = original"
+    ),
+    formato: str | None = Form(
+        None, description="png, webp, webp-lossy, avif, mascara, rle ou contornos (padrão: png)"
+    ),
+    cortar: bool = Form(False, description="Corta cada saída na caixa do objeto (mais `margem`)"),
+    margem: int = Form(0, description="Margem em px em volta do objeto, com cortar=true"),
+):
+    """
+    Remove o fundo de várias imagens num único pedido, com as mesmas opções.
+
+    A resposta é um ZIP enviado em fluxo: cada resultado é escrito assim que fica pronto
+    (na ordem de conclusão). Falhas de um arquivo não derrubam o lote; o `manifesto.json`,
+    última entrada do ZIP, traz status, erro, nome de saída e tempo de cada arquivo.
+
+    ```bash
+    curl -X POST "http://localhost:8000/api/remove/batch" \\
+      -F "files=@a.jpg" -F "files=@b.jpg" -F "files=@mais_fotos.zip" -o resultados.zip
+    ```
+    """
+    # Sem formato explícito o lote sai em PNG (o Accept aqui descreve o ZIP)
+    codificador = _validar_opcoes(modelo, max_size, tamanho_saida, formato or "png", None, margem)
+    opcoes = _opcoes(alpha_matting, bgcolor, max_size, tamanho_saida, codificador, cortar, margem)
+    arquivos = [(f.filename or f"imagem_{i}", f.file) for i, f in enumerate(files, 1)]
+    return StreamingResponse(
+        _zip_lote(arquivos, modelo, opcoes, codificador),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=removed_bg.zip"},
+    )
+
+
+@router.post("/jobs", status_code=202)
+async def criar_tarefa(
+    file: UploadFile = File(..., description="Imagem (PNG, JPG, HEIC, etc.)"),
+    modelo: str = Form(
+        core.MODELO_PADRAO,
+        description="Modelo: u2netp, u2net, birefnet-general, etc. auto = rápido e, se incerto, o preciso",
+    ),
+    alpha_matting: bool = Form(True, description="Bordas suaves (matting na faixa da borda)"),
+    bgcolor: str | None = Form(None, description="Cor de fundo hex, ex: FFFFFF"),
+    max_size: int = Form(MAX_SIZE, description="Tamanho da inferência (lado maior, px)"),
+    tamanho_saida: int | None = Form(
+        None, description="Tamanho da saída (lado maior, px). Vazio = igual à inferência, 0 = original"
+    ),
+    formato: str | None = Form(
+        None,
+        description="png, webp, webp-lossy, avif, mascara, rle ou contornos. Vazio = pelo Accept (PNG padrão)",
+    ),
+    cortar: bool = Form(False, description="Corta a saída na caixa do objeto (mais `margem`)"),
+    margem: int = Form(0, description="Margem em px em volta do objeto, com cortar=true"),
+    callback: str | None = Form(None, description="URL que recebe um POST JSON quando a tarefa terminar"),
+    accept: str | None = Header(None),
+):
+    """
+    Enfileira a remoção de fundo e responde na hora com o id da tarefa (202).
+
+    Mesmas opções de `/api/remove`. Para modelos pesados (birefnet, bria) que passam do
+    timeout do proxy: consulte `GET /api/jobs/{id}` e baixe de `GET /api/jobs/{id}/result`.
+    A fila fica em disco e continua após reinícios do servidor.
+    """
+    codificador = _validar_opcoes(modelo, max_size, tamanho_saida, formato, accept, margem)
+    if callback:
+        try:
+            await asyncio.to_thread(trabalhador.validar_callback, callback)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+
+    entrada = await _receber(file, "/api/jobs", max_size, tamanho_saida)
+
+    opcoes = _opcoes(alpha_matting, bgcolor, max_size, tamanho_saida, codificador, cortar, margem)
+    try:
+        tarefa_id = await asyncio.to_thread(fila_tarefas.enfileirar, modelo, entrada.fonte, opcoes, callback or None)
+    finally:
+        entrada.descartar()
+    trabalhador.avisar()
+    url = f"/api/jobs/{tarefa_id}"
+    return JSONResponse(
+        {"id": tarefa_id, "estado": "na_fila", "status": url, "resultado": f"{url}/result"},
+        status_code=202,
+        headers={"Location": url},
+    )
+
+
+@router.get("/jobs/{tarefa_id}")
+def estado_tarefa(tarefa_id: str):
+    """Estado (na_fila, processando, concluida, erro), posição na fila e tempos da tarefa."""
+    tarefa = fila_tarefas.obter(tarefa_id)
+    if tarefa is None:
+        raise HTTPException(404, "Tarefa não encontrada")
+
+    fim = tarefa["concluida"] or time.time()
+    resposta = {
+        "id": tarefa_id,
+        "estado": tarefa["estado"],
+        "modelo": tarefa["modelo"],
+        "criada": tarefa["criada"],
+        "tentativas": tarefa["tentativas"],
+        "espera_s": round((tarefa["iniciada"] or fim) - tarefa["criada"], 3),
+    }
+    if "posicao" in tarefa:
+        resposta["posicao"] = tarefa["posicao"]
+    if tarefa["iniciada"]:
+        resposta["execucao_s"] = round(fim - tarefa["iniciada"], 3)
+    if tarefa["estado"] == CONCLUIDA:
+        resposta["resultado"] = f"/api/jobs/{tarefa_id}/result"
+    if tarefa["estado"] == ERRO:
+        resposta["erro"] = tarefa["erro"]
+    if tarefa["callback"]:
+        resposta["callback"] = tarefa["callback_estado"] or "pendente"
+    return resposta
+
+
+@router.get(
+    "/jobs/{tarefa_id}/result",
+    response_class=FileResponse,
+    responses={409: {"description": "Tarefa ainda não concluída (ou terminou com erro)"}},
+)
+def resultado_tarefa(tarefa_id: str):
+    """Imagem resultante da tarefa concluída."""
+    tarefa = fila_tarefas.obter(tarefa_id)
+    if tarefa is None:
+        raise HTTPException(404, "Tarefa não encontrada")
+    if tarefa["estado"] == ERRO:
+        raise HTTPException(409, f"Tarefa terminou com erro: {tarefa['erro']}")
+    if tarefa["estado"] != CONCLUIDA:
+        raise HTTPException(409, f"Tarefa ainda não concluída (estado: {tarefa['estado']})")
+    return FileResponse(
+        fila_tarefas.resultado(tarefa_id),
+        media_type=tarefa["media_type"],
+        filename=tarefa["nome_arquivo"],
     )
 
 
 app.include_router(router)
 
+# Corpo do pedido limitado enquanto chega; a folga cobre os campos do formulário
+_FOLGA_FORMULARIO = 64 * 1024
+app.add_middleware(
+    LimiteCorpo,
+    limites={
+        "/api/remove": _config_uploads["max_bytes"] + _FOLGA_FORMULARIO,
+        "/api/jobs": _config_uploads["max_bytes"] + _FOLGA_FORMULARIO,
+        "/api/remove/batch": _config_uploads["max_bytes_lote"],
+    },
+    ao_recusar=lambda: m_recusados.inc(motivo="bytes"),
+)
+
+
+@app.middleware("http")
+async def medir_pedidos(request: Request, call_next):
+    """Contagem, latência e pedidos em andamento por rota (o modelo da rota, não a URL)."""
+    m_em_andamento.somar(1)
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        resposta = await call_next(request)
+        status = resposta.status_code
+        return resposta
+    finally:
+        m_em_andamento.somar(-1)
+        rota = request.scope.get("route")
+        rota = rota.path if rota is not None else "desconhecida"
+        m_pedidos.inc(rota=rota, metodo=request.method, status=status)
+        m_latencia.observar(time.perf_counter() - t0, rota=rota)
+
 
 def main():
     import uvicorn
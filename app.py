@@ -5,13 +5,20 @@ Interface web com Gradio - arraste imagens, visualize antes/depois e baixe.
 Suporta: PNG, JPG, WEBP, HEIC (fotos do iPhone), etc.
 """
 
-import tempfile
+import inspect
+import os
+import zipfile
 from pathlib import Path
 
 import gradio as gr
 from PIL import Image
 
+from armazem import armazem_do_ambiente
+from codificadores import CODIFICADORES
 from core import MAX_SIZE, remover_fundo
+from ingestao import abrir_imagem
+from pipeline import Estagio, Progresso, executar
+from variantes import descricao, variantes
 
 # Modelos disponíveis
 MODELOS = {
@@ -22,6 +29,99 @@ MODELOS = {
     "bria-rmbg": "Máxima qualidade",
     "u2net_human_seg": "Fotos de pessoas",
 }
+MODELOS.update({nome: descricao(nome, info) for nome, info in variantes().items()})
+
+# Fila do Gradio: pedidos rodando ao mesmo tempo (todos os usuários), lotes inteiros
+# ao mesmo tempo e imagens em paralelo dentro de um lote
+CONCORRENCIA = int(os.environ.get("REMOVEBG_APP_CONCORRENCIA", 2))
+LOTES_SIMULTANEOS = int(os.environ.get("REMOVEBG_APP_LOTES", 1))
+LOTE_WORKERS = int(os.environ.get("REMOVEBG_APP_LOTE_WORKERS", 2))
+FILA_MAX = int(os.environ.get("REMOVEBG_APP_FILA", 32))
+
+# Downloads, prévias e ZIPs: apagados pelo TTL ou pelo limite de espaço (REMOVEBG_APP_*)
+armazem = armazem_do_ambiente()
+# Lado maior das prévias mostradas na página (o download continua em resolução cheia)
+PREVIA_PX = int(os.environ.get("REMOVEBG_APP_PREVIA_PX", 768))
+
+
+def _gravar_previa(img: Image.Image, destino: Path) -> Path:
+    """Cópia reduzida em WebP: a página recebe alguns KB em vez da imagem inteira."""
+    previa = img.copy()
+    previa.thumbnail((PREVIA_PX, PREVIA_PX), Image.Resampling.BILINEAR)
+    previa.save(destino, "WEBP", quality=80, method=2)
+    return destino
+
+
+def _caminho_arquivo(f) -> str:
+    return f if isinstance(f, str) else getattr(f, "name", getattr(f, "path", str(f)))
+
+
+def processar_lote(files, modelo: str = "u2netp", alpha_matting: bool = False, formato: str = "png"):
+    """
+    Gerador: a cada imagem concluída devolve ([(prévia, nome)], caminho do ZIP, mensagem).
+
+    Até LOTE_WORKERS imagens do lote em paralelo (leitura, modelo e gravação se sobrepõem).
+    Cada resultado vai direto para o disco e para o ZIP, então só as imagens em processamento
+    ficam em memória, e a galeria recebe só as prévias reduzidas.
+    """
+    paths = [_caminho_arquivo(f) for f in files or []]
+    if not paths:
+        return
+    codificador = CODIFICADORES[formato]
+    pasta = armazem.reservar()
+    (pasta / "previas").mkdir(parents=True)
+    zip_path = pasta / "sem_fundo.zip"
+
+    # Nomes únicos no ZIP mesmo com arquivos de mesmo nome vindos de pastas diferentes
+    nomes, usados = [], set()
+    for path in paths:
+        base, n = f"{Path(path).stem}_sem_fundo", 1
+        while base in usados:
+            n += 1
+            base = f"{Path(path).stem}_sem_fundo_{n}"
+        usados.add(base)
+        nomes.append(codificador.nome_arquivo(base))
+
+    def gravar(item):
+        i, out = item
+        destino = pasta / nomes[i]
+        codificador.salvar(out, destino)
+        previa = _gravar_previa(codificador.preparar(out), pasta / "previas" / f"{destino.stem}.webp")
+        return i, destino, previa
+
+    def remover(item):
+        i, img = item
+        return i, remover_fundo(img, modelo=modelo, alpha_matting=alpha_matting)
+
+    estagios = [
+        Estagio("leitura", lambda i: (i, abrir_imagem(paths[i], MAX_SIZE)), LOTE_WORKERS),
+        Estagio("remocao", remover, LOTE_WORKERS),
+        Estagio("gravacao", gravar, LOTE_WORKERS),
+    ]
+    resultados, erros = [], []
+    progresso = Progresso(len(paths))
+    try:
+        with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as zf:
+            for res in executar(range(len(paths)), estagios):
+                progresso.avancar()
+                if res.erro is not None:
+                    erros.append(f"{Path(paths[res.item]).name}: {res.erro}")
+                else:
+                    _, destino, previa = res.valor
+                    # Imagens já comprimidas: guardar sem recomprimir; o arquivo solto não é mais necessário
+                    zf.write(destino, destino.name)
+                    destino.unlink()
+                    resultados.append((str(previa), destino.name))
+                msg = f"{progresso.concluidos}/{len(paths)} concluída(s) ({progresso.texto()})"
+                if erros:
+                    msg += "\n\n⚠️ " + "\n\n⚠️ ".join(erros)
+                yield resultados, None, msg
+    finally:
+        # Só agora (terminado ou interrompido) o lote entra na contagem e pode ser apagado
+        armazem.registrar(pasta)
+    yield resultados, (str(zip_path) if resultados else None), f"✓ {len(resultados)}/{len(paths)} concluída(s)" + (
+        "\n\n⚠️ " + "\n\n⚠️ ".join(erros) if erros else ""
+    )
 
 
 def processar_imagem(
@@ -29,12 +129,14 @@ def processar_imagem(
     modelo: str = "u2netp",
     alpha_matting: bool = False,
     cor_fundo: str | None = None,
-) -> tuple[Image.Image | None, Image.Image | None, str | None, str]:
+    formato: str = "png",
+) -> tuple[str | None, str | None, str]:
     """
-    Remove fundo da imagem e retorna (original, resultado, caminho_download, mensagem_erro).
+    Remove fundo da imagem e retorna (caminho_previa, caminho_download, mensagem_erro).
+    O download é codificado uma vez, no formato escolhido; a página mostra só a prévia reduzida.
     """
     if img is None:
-        return None, None, None, "Nenhuma imagem carregada."
+        return None, None, "Nenhuma imagem carregada."
 
     try:
         # Converter cor de fundo
@@ -45,25 +147,36 @@ def processar_imagem(
                 r, g, b = int(hex_color[0:2], 16), int(hex_color[2:4], 16), int(hex_color[4:6], 16)
                 bgcolor_tuple = (r, g, b, 255)
 
+        codificador = CODIFICADORES[formato]
         output = remover_fundo(
             img,
             modelo=modelo,
             alpha_matting=alpha_matting,
-            bgcolor=bgcolor_tuple,
+            bgcolor=None if codificador.so_mascara else bgcolor_tuple,
         )
 
-        # Salvar em arquivo temporário para download
-        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
-            output.save(f.name)
-            download_path = f.name
+        # Download e prévia na mesma entrada do armazém (mesmos codificadores da API e da CLI)
+        pasta = armazem.reservar()
+        pasta.mkdir(parents=True)
+        try:
+            download_path = pasta / codificador.nome_arquivo("sem_fundo")
+            codificador.salvar(output, download_path)
+            previa_path = _gravar_previa(codificador.preparar(output), pasta / "previa.webp")
+        finally:
+            armazem.registrar(pasta)
 
-        return img, output, download_path, ""
+        return str(previa_path), str(download_path), ""
     except Exception as e:
-        return img, None, None, f"Erro: {str(e)}"
+        return None, None, f"Erro: {str(e)}"
 
 
 # Interface Gradio
-with gr.Blocks(title="RemoverBG - Remoção de Fundo") as app:
+# O Gradio copia os arquivos servidos para o cache dele: limpa com o mesmo TTL (Gradio >= 4.28)
+_opcoes_blocks = {}
+if "delete_cache" in inspect.signature(gr.Blocks.__init__).parameters:
+    _opcoes_blocks["delete_cache"] = (int(armazem.ttl_s // 2) or 60, int(armazem.ttl_s))
+
+with gr.Blocks(title="RemoverBG - Remoção de Fundo", **_opcoes_blocks) as app:
     gr.Markdown(
         """
         # 🖼️ RemoverBG - Remoção de Fundo com IA
@@ -100,23 +213,23 @@ with gr.Blocks(title="RemoverBG - Remoção de Fundo") as app:
                             label="Cor de fundo (hex, ex: #FFFFFF)",
                             placeholder="#FFFFFF para branco, vazio = transparente",
                         )
+                        formato = gr.Dropdown(
+                            choices=list(CODIFICADORES),
+                            value="png",
+                            label="Formato do download",
+                            info="webp/avif = arquivos menores | mascara = só o alpha | rle/contornos = máscara em JSON",
+                        )
 
                     btn_processar = gr.Button("✨ Remover fundo", variant="primary")
 
                 with gr.Column(scale=1):
-                    with gr.Row():
-                        output_original = gr.Image(
-                            label="Original",
-                            type="pil",
-                            height=250,
-                            interactive=False,
-                        )
-                        output_resultado = gr.Image(
-                            label="Sem fundo",
-                            type="pil",
-                            height=250,
-                            interactive=False,
-                        )
+                    # Prévia reduzida (arquivo já codificado); o original continua à esquerda
+                    output_resultado = gr.Image(
+                        label="Sem fundo (prévia)",
+                        type="filepath",
+                        height=350,
+                        interactive=False,
+                    )
                     download_btn = gr.DownloadButton(
                         "⬇️ Baixar resultado",
                         visible=False,
@@ -130,23 +243,21 @@ with gr.Blocks(title="RemoverBG - Remoção de Fundo") as app:
                 f = file[0] if isinstance(file, list) else file
                 path = getattr(f, "name", getattr(f, "path", f))
                 if path and isinstance(path, str):
-                    return Image.open(path).convert("RGB")
+                    return abrir_imagem(path, MAX_SIZE)
                 return None
 
             input_file.change(fn=carregar_arquivo, inputs=[input_file], outputs=[input_img])
 
-            def processar_e_mostrar(img, mod, alpha, cor):
-                orig, res, path, erro = processar_imagem(img, mod, alpha, cor)
+            def processar_e_mostrar(img, mod, alpha, cor, fmt):
+                previa, path, erro = processar_imagem(img, mod, alpha, cor, fmt)
                 if erro:
-                    return orig, None, gr.update(visible=False), gr.update(value=f"⚠️ {erro}", visible=True)
-                if path:
-                    return orig, res, gr.update(value=path, visible=True), gr.update(visible=False)
-                return orig, res, gr.update(visible=False), gr.update(visible=False)
+                    return None, gr.update(visible=False), gr.update(value=f"⚠️ {erro}", visible=True)
+                return previa, gr.update(value=path, visible=True), gr.update(visible=False)
 
             btn_processar.click(
                 fn=processar_e_mostrar,
-                inputs=[input_img, modelo, alpha_matting, cor_fundo],
-                outputs=[output_original, output_resultado, download_btn, status_msg],
+                inputs=[input_img, modelo, alpha_matting, cor_fundo, formato],
+                outputs=[output_resultado, download_btn, status_msg],
             )
 
         # Aba: Lote
@@ -164,34 +275,34 @@ with gr.Blocks(title="RemoverBG - Remoção de Fundo") as app:
                         label="Modelo",
                     )
                     batch_alpha = gr.Checkbox(value=False, label="Alpha matting (mais lento)")
+                    batch_formato = gr.Dropdown(choices=list(CODIFICADORES), value="png", label="Formato")
                     btn_batch = gr.Button("✨ Processar todas", variant="primary")
 
                 with gr.Column():
+                    batch_status = gr.Markdown()
+                    batch_download = gr.DownloadButton("⬇️ Baixar todas (ZIP)", visible=False)
                     batch_gallery = gr.Gallery(
-                        label="Resultados (antes → depois)",
+                        label="Prévias (aparecem conforme ficam prontas; resolução cheia no ZIP)",
                         columns=2,
                         height="auto",
                         object_fit="contain",
                     )
 
-            def run_batch(files, mod, alpha):
+            def run_batch(files, mod, alpha, fmt):
                 if not files:
-                    return None
-                resultados = []
-                paths = [
-                    f if isinstance(f, str) else getattr(f, "name", getattr(f, "path", str(f)))
-                    for f in files
-                ]
-                for path in paths:
-                    img = Image.open(path).convert("RGB")
-                    out = remover_fundo(img, modelo=mod, alpha_matting=alpha)
-                    resultados.append(out)
-                return resultados
+                    yield None, gr.update(visible=False), "Nenhuma imagem selecionada."
+                    return
+                for resultados, zip_path, msg in processar_lote(files, mod, alpha, fmt):
+                    download = gr.update(value=zip_path, visible=True) if zip_path else gr.update(visible=False)
+                    yield resultados, download, msg
 
+            # Lotes têm fila própria: um lote grande não ocupa as vagas da aba de imagem única
             btn_batch.click(
                 fn=run_batch,
-                inputs=[batch_input, batch_modelo, batch_alpha],
-                outputs=[batch_gallery],
+                inputs=[batch_input, batch_modelo, batch_alpha, batch_formato],
+                outputs=[batch_gallery, batch_download, batch_status],
+                concurrency_limit=LOTES_SIMULTANEOS,
+                concurrency_id="lote",
             )
 
     gr.Markdown(
@@ -202,10 +313,10 @@ with gr.Blocks(title="RemoverBG - Remoção de Fundo") as app:
         """
     )
 
+app.queue(default_concurrency_limit=CONCORRENCIA, max_size=FILA_MAX)
 
-def main():
-    import os
 
+def main():
     # Deploy (HF Spaces, Railway, etc.): PORT e 0.0.0.0 vêm do ambiente
     port = int(os.environ.get("PORT", 7880))
     server_name = "0.0.0.0" if os.environ.get("PORT") else "127.0.0.1"
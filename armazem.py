@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Arquivos temporários do app (downloads, prévias, ZIPs dos lotes) numa pasta só,
+apagados depois de um tempo de vida ou quando o total passa do limite (os mais antigos primeiro).
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+
+def _tamanho(caminho: Path) -> int:
+    try:
+        if caminho.is_dir():
+            return sum(f.stat().st_size for f in caminho.rglob("*") if f.is_file())
+        return caminho.stat().st_size
+    except OSError:
+        return 0
+
+
+def _apagar(caminho: Path):
+    if caminho.is_dir():
+        shutil.rmtree(caminho, ignore_errors=True)
+    else:
+        caminho.unlink(missing_ok=True)
+
+
+class ArmazemArquivos:
+    """
+    Entradas (arquivo ou pasta) criadas com `reservar()` e contabilizadas com `registrar()`
+    quando prontas. Entradas ainda não registradas (um lote em andamento) nunca são apagadas.
+    """
+
+    def __init__(self, pasta: str | Path, ttl_s: float, max_bytes: int):
+        self.pasta = Path(pasta)
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # nome -> (criado em, bytes), do mais antigo ao mais novo; sobras de uma execução anterior entram pelo mtime
+        existentes = sorted(self.pasta.iterdir(), key=lambda f: f.stat().st_mtime)
+        self._entradas: OrderedDict[str, tuple[float, int]] = OrderedDict(
+            (f.name, (f.stat().st_mtime, _tamanho(f))) for f in existentes
+        )
+        self._bytes = sum(n for _, n in self._entradas.values())
+        self.apagados = 0
+
+    def reservar(self, sufixo: str = "") -> Path:
+        """Caminho novo e único dentro do armazém (o chamador cria o arquivo ou a pasta)."""
+        return self.pasta / f"{uuid.uuid4().hex}{sufixo}"
+
+    def registrar(self, caminho: Path) -> Path:
+        """Conta a entrada pronta no total e apaga as vencidas ou excedentes."""
+        caminho = Path(caminho)
+        tamanho = _tamanho(caminho)
+        with self._lock:
+            _, antigo = self._entradas.pop(caminho.name, (0, 0))
+            self._entradas[caminho.name] = (time.time(), tamanho)
+            self._bytes += tamanho - antigo
+        self.limpar(manter=caminho.name)
+        return caminho
+
+    def limpar(self, manter: str | None = None) -> int:
+        """Apaga entradas mais velhas que o TTL e, se ainda passar do limite, as mais antigas."""
+        limite = time.time() - self.ttl_s
+        removidos = []
+        with self._lock:
+            for nome, (criado, tamanho) in list(self._entradas.items()):
+                if nome == manter:
+                    continue
+                if criado >= limite and self._bytes <= self.max_bytes:
+                    break
+                del self._entradas[nome]
+                self._bytes -= tamanho
+                removidos.append(nome)
+        for nome in removidos:
+            _apagar(self.pasta / nome)
+        self.apagados += len(removidos)
+        return len(removidos)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+def armazem_do_ambiente() -> ArmazemArquivos:
+    """REMOVEBG_APP_DIR (pasta temporária do sistema), REMOVEBG_APP_TTL_MIN (60) e REMOVEBG_APP_ARQUIVOS_MB (1024)."""
+    return ArmazemArquivos(
+        os.environ.get("REMOVEBG_APP_DIR", Path(tempfile.gettempdir()) / "removebg_app"),
+        ttl_s=float(os.environ.get("REMOVEBG_APP_TTL_MIN", 60)) * 60,
+        max_bytes=int(float(os.environ.get("REMOVEBG_APP_ARQUIVOS_MB", 1024)) * 1024 * 1024),
+    )
@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+"""
+Benchmarks do pipeline de remoção de fundo.
+
+Uso:
+    python benchmark.py lote -m u2netp --clientes 16 --janelas 0,2,5,10,20
+    python benchmark.py decodificacao --megapixels 12,48
+    python benchmark.py matting --tamanho 1024
+    python benchmark.py estagios --tamanhos 512,1024,2048 --json atual.json --baseline base.json
+    python benchmark.py importacao --orcamento-ms 800
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageOps
+
+import core
+import matting
+from cache import CacheLRU
+from codificadores import CODIFICADORES
+from ingestao import abrir_imagem
+from lotes import AgendadorLotes
+
+
+def _imagens_sinteticas(n: int, tamanho: int = 1024, seed: int = 0) -> list[Image.Image]:
+    """Gera n imagens RGB com um 'objeto' claro sobre fundo ruidoso."""
+    rng = np.random.default_rng(seed)
+    imgs = []
+    for _ in range(n):
+        arr = (rng.random((tamanho, tamanho, 3)) * 120).astype(np.uint8)
+        y0, x0 = rng.integers(0, tamanho // 2, size=2)
+        arr[y0 : y0 + tamanho // 3, x0 : x0 + tamanho // 3] = rng.integers(160, 255, size=3)
+        imgs.append(Image.fromarray(arr))
+    return imgs
+
+
+def bench_lote(
+    modelo: str,
+    clientes: int,
+    janelas_ms: list[float],
+    max_lote: int,
+    duracao: float,
+    tamanho: int,
+) -> list[dict]:
+    """Imagens/s com `clientes` threads concorrentes, para cada janela de espera do lote."""
+    imgs = _imagens_sinteticas(clientes, tamanho)
+    core.get_session(modelo)  # carga do modelo fora da medição
+    original = core.agendador
+    resultados = []
+
+    for janela in janelas_ms:
+        agendador = AgendadorLotes(core._inferir_lote, max_lote=max_lote if janela > 0 else 1, espera_ms=janela)
+        core.agendador = agendador
+        core.prever_mascara(imgs[0], modelo)  # aquecimento
+
+        contagem = [0] * clientes
+        latencias: list[float] = []
+        fim = time.perf_counter() + duracao
+
+        def cliente(i: int):
+            while time.perf_counter() < fim:
+                t0 = time.perf_counter()
+                core.prever_mascara(imgs[i], modelo)
+                latencias.append(time.perf_counter() - t0)
+                contagem[i] += 1
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        total = time.perf_counter() - t0
+
+        stats = agendador.estatisticas()
+        resultados.append({
+            "janela_ms": janela,
+            "imagens_s": round(sum(contagem) / total, 2),
+            "latencia_p50_ms": round(float(np.percentile(latencias, 50)) * 1000, 1),
+            "latencia_p95_ms": round(float(np.percentile(latencias, 95)) * 1000, 1),
+            "media_por_lote": stats["media_por_lote"] if janela > 0 else 1.0,
+        })
+
+    core.agendador = original
+    return resultados
+
+
+def _jpeg_sintetico(caminho: Path, megapixels: float, seed: int = 0):
+    """Foto sintética 4:3 (gradiente + ruído) com orientação EXIF de celular em pé."""
+    w = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    h = int(w * 3 / 4)
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    arr = np.empty((h, w, 3), dtype=np.uint8)
+    arr[..., 0] = (x + y) / 2
+    arr[..., 1] = x[::-1] * 0.7 + 40
+    arr[..., 2] = y * 0.5 + rng.integers(0, 40, size=(h, 1), dtype=np.uint8)
+    img = Image.fromarray(arr)
+    exif = img.getexif()
+    exif[0x0112] = 6
+    img.save(caminho, "JPEG", quality=90, exif=exif)
+
+
+def _zerar_pico_rss():
+    """No Linux, zera o pico de RSS do processo (VmHWM) para medir só o trecho seguinte."""
+    try:
+        Path("/proc/self/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def _pico_rss_kb() -> int:
+    try:
+        for linha in Path("/proc/self/status").read_text().splitlines():
+            if linha.startswith("VmHWM:"):
+                return int(linha.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _rss_atual_kb() -> int:
+    try:
+        for linha in Path("/proc/self/status").read_text().splitlines():
+            if linha.startswith("VmRSS:"):
+                return int(linha.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _decodificar(caminho: str, modo: str, max_size: int) -> dict:
+    """Roda no processo filho: tempo e pico de memória de uma decodificação."""
+    _zerar_pico_rss()
+    rss0 = _rss_atual_kb()
+    t0 = time.perf_counter()
+    if modo == "antigo":
+        # Caminho anterior: decodifica tudo, converte, e o core converte/redimensiona de novo
+        img = Image.open(caminho).convert("RGB")
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        w, h = img.size
+        ratio = max_size / max(w, h)
+        img = img.resize((int(w * ratio), int(h * ratio)), Image.Resampling.LANCZOS)
+    else:
+        img = abrir_imagem(caminho, max_size)
+    ms = (time.perf_counter() - t0) * 1000
+    pico_kb = _pico_rss_kb() - rss0
+    return {"ms": round(ms, 1), "pico_mb": round(pico_kb / 1024, 1), "tamanho": list(img.size)}
+
+
+def bench_decodificacao(megapixels: list[float], max_size: int, repeticoes: int) -> list[dict]:
+    """Compara o caminho antigo (decodificação completa) com ingestao.abrir_imagem."""
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in megapixels:
+            caminho = Path(tmp) / f"{mp:g}mp.jpg"
+            _jpeg_sintetico(caminho, mp)
+            for modo in ("antigo", "novo"):
+                medidas = []
+                for _ in range(repeticoes):
+                    # Processo novo a cada medida para o pico de RSS ser só desta decodificação
+                    saida = subprocess.run(
+                        [sys.executable, __file__, "_decodificar", str(caminho), modo, str(max_size)],
+                        capture_output=True, text=True, check=True,
+                    )
+                    medidas.append(json.loads(saida.stdout))
+                resultados.append({
+                    "megapixels": mp,
+                    "modo": modo,
+                    "ms": round(float(np.median([m["ms"] for m in medidas])), 1),
+                    "pico_mb": max(m["pico_mb"] for m in medidas),
+                    "tamanho": medidas[0]["tamanho"],
+                })
+    return resultados
+
+
+# Dependências pesadas que só podem ser importadas no primeiro uso, nunca na importação dos módulos
+IMPORTS_ADIADOS = ("rembg", "onnxruntime", "pymatting", "numba", "gradio", "cv2", "av")
+
+_MEDIR_IMPORTACAO = """
+import json, sys, time
+t0 = time.perf_counter()
+import {modulo}
+ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({{"ms": ms, "carregados": [m for m in {adiados!r} if m in sys.modules]}}))
+"""
+
+
+def bench_importacao(modulos: list[str], repeticoes: int) -> list[dict]:
+    """Tempo de `import modulo` num interpretador novo e quais dependências pesadas vieram junto."""
+    resultados = []
+    for modulo in modulos:
+        medidas = []
+        for _ in range(repeticoes):
+            saida = subprocess.run(
+                [sys.executable, "-c", _MEDIR_IMPORTACAO.format(modulo=modulo, adiados=IMPORTS_ADIADOS)],
+                capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+            )
+            medidas.append(json.loads(saida.stdout.strip().splitlines()[-1]))
+        resultados.append({
+            "modulo": modulo,
+            "ms": round(float(np.median([m["ms"] for m in medidas])), 1),
+            "carregados": medidas[0]["carregados"],
+        })
+    return resultados
+
+
+def _cena_matting(tamanho: int, seed: int = 0) -> tuple[Image.Image, Image.Image, np.ndarray]:
+    """Objeto com borda suave sobre fundo em degradê: (imagem, máscara binária, alpha verdadeiro)."""
+    rng = np.random.default_rng(seed)
+    w, h = tamanho, tamanho * 3 // 4
+    fundo = (rng.random((h, w, 3)) * 0.3 + np.linspace(0, 0.5, w)[None, :, None]).clip(0, 1)
+    frente = np.array([0.9, 0.5, 0.3]) + rng.random((h, w, 3)) * 0.1
+    forma = Image.new("L", (w, h), 0)
+    ImageDraw.Draw(forma).ellipse((w // 4, h // 5, w * 4 // 5, h * 5 // 6), fill=255)
+    alpha = np.asarray(forma.filter(ImageFilter.GaussianBlur(3)), dtype=np.float64) / 255
+    rgb = alpha[..., None] * frente + (1 - alpha[..., None]) * fundo
+    img = Image.fromarray((rgb * 255).astype(np.uint8))
+    mask = Image.fromarray(((alpha > 0.5) * 255).astype(np.uint8))
+    return img, mask, alpha
+
+
+def bench_matting(tamanho: int, repeticoes: int) -> tuple[list[dict], float]:
+    """
+    Motor por faixa (matting.py) contra o solver global do pymatting no mesmo trimap.
+    Erros: MAE do alpha contra o alpha verdadeiro da cena e contra o resultado do pymatting.
+    """
+    img, mask, verdadeiro = _cena_matting(tamanho)
+    tri = matting.trimap(np.asarray(mask))
+    faixa = tri == 128
+
+    def medir(fn):
+        tempos = []
+        for _ in range(repeticoes):
+            t0 = time.perf_counter()
+            alpha = fn()
+            tempos.append(time.perf_counter() - t0)
+        return alpha, round(float(np.median(tempos)) * 1000, 1)
+
+    motores = {
+        "faixa": lambda: np.asarray(matting.recortar(img, mask))[..., 3] / 255,
+        "faixa (1 thread)": lambda: np.asarray(matting.recortar(img, mask, threads=1))[..., 3] / 255,
+    }
+    try:
+        from pymatting import estimate_alpha_cf, estimate_foreground_ml
+
+        def global_cf():
+            arr = np.asarray(img) / 255
+            alpha = estimate_alpha_cf(arr, tri / 255)
+            estimate_foreground_ml(arr, alpha)
+            return alpha
+
+        motores["pymatting"] = global_cf
+    except ImportError:
+        pass
+
+    alphas, resultados = {}, []
+    for nome, fn in motores.items():
+        alphas[nome], ms = medir(fn)
+        resultados.append({"motor": nome, "ms": ms, "mae": float(np.abs(alphas[nome] - verdadeiro).mean())})
+    for r in resultados:
+        if "pymatting" in alphas:
+            r["mae_faixa_vs_pymatting"] = float(np.abs(alphas[r["motor"]] - alphas["pymatting"])[faixa].mean())
+    return resultados, float(faixa.mean())
+
+
+# Ordem em que as etapas aparecem no relatório ("outros" = hash, cache e o que não está medido)
+ETAPAS = (
+    "decodificacao", "redimensionamento", "pre_processamento", "inferencia", "mascara",
+    "pos_processamento", "recorte", "matting", "ampliacao", "composicao", "codificacao", "outros",
+)
+
+
+def _pesos_disponiveis(modelo: str) -> str | None:
+    """Caminho do .onnx já baixado pelo rembg (ou da variante quantizada), ou None."""
+    from rembg.sessions import sessions
+
+    from variantes import variantes
+
+    variante = variantes().get(modelo)
+    if variante is not None:
+        return variante["caminho"]
+    try:
+        return sessions[modelo].resolve_existing(f"{modelo}.onnx")
+    except (KeyError, TypeError):
+        return None
+
+
+def _modelo_ficticio(caminho: Path, tamanho: tuple[int, int]):
+    """ONNX mínimo com a mesma entrada/saída dos modelos reais (média dos canais)."""
+    from onnx import TensorProto, helper, save
+
+    w, h = tamanho
+    entrada = helper.make_tensor_value_info("input", TensorProto.FLOAT, ["lote", 3, h, w])
+    saida = helper.make_tensor_value_info("saida", TensorProto.FLOAT, ["lote", 1, h, w])
+    no = helper.make_node("ReduceMean", ["input"], ["saida"], keepdims=1, axes=[1])
+    modelo = helper.make_model(
+        helper.make_graph([no], "ficticio", [entrada], [saida]), opset_imports=[helper.make_opsetid("", 13)]
+    )
+    modelo.ir_version = 8
+    save(modelo, str(caminho))
+
+
+def _preparar_modelos(modelos: list[str], baixar: bool, pasta: Path) -> dict[str, bool]:
+    """
+    Modelo -> usa um ONNX fictício. Sem os pesos (e sem --baixar), o modelo roda com um
+    ONNX fictício do mesmo tamanho de entrada: mede tudo em volta da inferência sem baixar
+    centenas de MB. Os pesos que existem são ligados na mesma pasta (U2NET_HOME).
+    """
+    faltando = [m for m in modelos if _pesos_disponiveis(m) is None]
+    if baixar or not faltando:
+        return {m: False for m in modelos}
+    try:
+        import onnx  # noqa: F401
+    except ImportError:
+        print(f"Sem pesos para {', '.join(faltando)} e sem o pacote onnx para o modelo fictício: pulando.")
+        return {m: False for m in modelos if m not in faltando}
+
+    ficticios = {}
+    for modelo in modelos:
+        destino = pasta / f"{modelo}.onnx"
+        existente = _pesos_disponiveis(modelo)
+        if existente is not None:
+            destino.symlink_to(Path(existente).resolve())
+        else:
+            _modelo_ficticio(destino, core.PARAMS_MODELO[modelo][2])
+        ficticios[modelo] = existente is None
+    # O rembg só lê a variável ao criar a sessão, então basta valer antes da primeira carga
+    os.environ["U2NET_HOME"] = str(pasta)
+    return ficticios
+
+
+def _percentis(valores: list[float]) -> dict:
+    return {
+        "p50_ms": round(float(np.percentile(valores, 50)) * 1000, 2),
+        "p95_ms": round(float(np.percentile(valores, 95)) * 1000, 2),
+    }
+
+
+def bench_estagios(
+    modelos: list[str],
+    tamanhos: list[int],
+    repeticoes: int,
+    max_size: int,
+    formato: str,
+    ficticios: dict[str, bool],
+) -> list[dict]:
+    """
+    core.remover_fundo etapa por etapa (core.medindo_etapas), com decodificação e
+    codificação em volta, para cada modelo x tamanho x matting ligado/desligado.
+    Cada repetição usa uma imagem diferente e o cache de etapas fica desligado.
+    """
+    codificador = CODIFICADORES[formato]
+    original_cache, original_agendador = core._cache_etapas, core.agendador
+    # Sem cache e sem janela de micro-lote: a inferência medida é só o session.run
+    core._cache_etapas = CacheLRU(0, tamanho=core._bytes_imagem)
+    core.agendador = AgendadorLotes(core._inferir_lote, max_lote=1, espera_ms=0)
+    resultados = []
+
+    try:
+        for modelo in modelos:
+            core.get_session(modelo)  # carga do modelo fora da medição
+            core.aquecer(modelo)
+            for tamanho in tamanhos:
+                entradas = []
+                for img in _imagens_sinteticas(repeticoes + 1, tamanho, seed=tamanho):
+                    buf = io.BytesIO()
+                    img.save(buf, "JPEG", quality=90)
+                    entradas.append(buf.getvalue())
+
+                for alpha_matting in (False, True):
+                    _zerar_pico_rss()
+                    etapas: dict[str, list[float]] = {e: [] for e in ETAPAS}
+                    totais = []
+                    # A primeira imagem só aquece (pool do matting, buffers do ONNX)
+                    for n, dados in enumerate(entradas):
+                        t0 = time.perf_counter()
+                        with core.medindo_etapas() as tempos:
+                            with core.medir_etapa("decodificacao"):
+                                img = abrir_imagem(dados, max_size)
+                                img.load()  # o Pillow decodifica sob demanda
+                            saida = core.remover_fundo(img, modelo, alpha_matting, max_size=max_size)
+                            with core.medir_etapa("codificacao"):
+                                codificador.codificar(saida)
+                        total = time.perf_counter() - t0
+                        if n == 0:
+                            continue
+                        totais.append(total)
+                        tempos["outros"] = max(total - sum(tempos.values()), 0.0)
+                        for etapa in ETAPAS:
+                            if etapa in tempos:
+                                etapas[etapa].append(tempos[etapa])
+
+                    resultados.append({
+                        "modelo": modelo,
+                        "tamanho": tamanho,
+                        "matting": alpha_matting,
+                        "ficticio": ficticios.get(modelo, False),
+                        "imagens_s": round(len(totais) / sum(totais), 2),
+                        "pico_rss_mb": round(_pico_rss_kb() / 1024, 1),
+                        "total": _percentis(totais),
+                        "etapas": {e: _percentis(v) for e, v in etapas.items() if v},
+                    })
+    finally:
+        core._cache_etapas, core.agendador = original_cache, original_agendador
+    return resultados
+
+
+def _chave_resultado(r: dict) -> tuple:
+    return r["modelo"], r["tamanho"], r["matting"]
+
+
+def comparar_baseline(atual: list[dict], baseline: list[dict], tolerancia: float, minimo_ms: float) -> list[dict]:
+    """
+    Regressões em relação a um relatório salvo: p50 (total e por etapa) e pico de RSS
+    acima de `tolerancia` (fração), ou vazão abaixo. Diferenças de tempo menores que
+    `minimo_ms` são ignoradas, para o ruído das etapas rápidas não virar alarme.
+    """
+    anteriores = {_chave_resultado(r): r for r in baseline}
+    regressoes = []
+
+    def verificar(r: dict, metrica: str, antes: float, agora: float, folga: float, maior_pior: bool = True):
+        piora = (agora - antes) if maior_pior else (antes - agora)
+        if antes > 0 and piora > folga and piora / antes > tolerancia:
+            regressoes.append({
+                "modelo": r["modelo"], "tamanho": r["tamanho"], "matting": r["matting"],
+                "metrica": metrica, "baseline": antes, "atual": agora,
+                "variacao": round((agora - antes) / antes, 3),
+            })
+
+    for r in atual:
+        base = anteriores.get(_chave_resultado(r))
+        if base is None or base.get("ficticio") != r["ficticio"]:
+            continue
+        verificar(r, "total.p50_ms", base["total"]["p50_ms"], r["total"]["p50_ms"], minimo_ms)
+        for etapa, medidas in r["etapas"].items():
+            if etapa in base["etapas"]:
+                verificar(r, f"{etapa}.p50_ms", base["etapas"][etapa]["p50_ms"], medidas["p50_ms"], minimo_ms)
+        verificar(r, "imagens_s", base["imagens_s"], r["imagens_s"], 0.0, maior_pior=False)
+        verificar(r, "pico_rss_mb", base["pico_rss_mb"], r["pico_rss_mb"], 10.0)
+    return regressoes
+
+
+def _ambiente() -> dict:
+    import onnxruntime
+
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "onnxruntime": onnxruntime.__version__,
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks do RemoverBG")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_lote = sub.add_parser("lote", help="Imagens/s em função da janela de micro-lote")
+    p_lote.add_argument("-m", "--modelo", default="u2netp")
+    p_lote.add_argument("--clientes", type=int, default=16, help="Pedidos concorrentes")
+    p_lote.add_argument("--janelas", default="0,2,5,10,20", help="Janelas de espera em ms (0 = sem lote)")
+    p_lote.add_argument("--max-lote", type=int, default=8)
+    p_lote.add_argument("--duracao", type=float, default=10.0, help="Segundos por janela")
+    p_lote.add_argument("--tamanho", type=int, default=1024, help="Lado das imagens sintéticas")
+
+    p_dec = sub.add_parser("decodificacao", help="Tempo e pico de memória da leitura de fotos grandes")
+    p_dec.add_argument("--megapixels", default="12,48")
+    p_dec.add_argument("--max-size", type=int, default=core.MAX_SIZE)
+    p_dec.add_argument("--repeticoes", type=int, default=3)
+
+    p_mat = sub.add_parser("matting", help="Motor de matting por faixa contra o pymatting global")
+    p_mat.add_argument("--tamanho", type=int, default=1024, help="Largura da cena sintética")
+    p_mat.add_argument("--repeticoes", type=int, default=3)
+
+    p_est = sub.add_parser("estagios", help="Latência por etapa do pipeline, por modelo, tamanho e matting")
+    p_est.add_argument("--modelos", default=",".join(core.PARAMS_MODELO), help="Lista separada por vírgula")
+    p_est.add_argument("--tamanhos", default="512,1024,2048", help="Lados das imagens sintéticas")
+    p_est.add_argument("--repeticoes", type=int, default=10, help="Imagens por combinação")
+    p_est.add_argument("--max-size", type=int, default=core.MAX_SIZE)
+    p_est.add_argument("-f", "--formato", default="png", choices=list(CODIFICADORES))
+    p_est.add_argument("--baixar", action="store_true", help="Baixa os pesos que faltam em vez do modelo fictício")
+    p_est.add_argument("--json", help="Grava o relatório neste arquivo ('-' = saída padrão)")
+    p_est.add_argument("--baseline", help="Relatório salvo para comparar; regressões saem com código 1")
+    p_est.add_argument("--tolerancia", type=float, default=0.10, help="Piora relativa aceita (padrão: 0.10)")
+    p_est.add_argument("--minimo-ms", type=float, default=2.0, help="Piora absoluta mínima para contar")
+
+    p_imp = sub.add_parser("importacao", help="Tempo de importação dos pontos de entrada (início a frio)")
+    p_imp.add_argument("--modulos", default="core,api,remove_bg", help="Lista separada por vírgula")
+    p_imp.add_argument("--repeticoes", type=int, default=5)
+    p_imp.add_argument("--orcamento-ms", type=float, help="Acima disso em algum módulo, sai com código 1")
+
+    p_filho = sub.add_parser("_decodificar")
+    p_filho.add_argument("caminho")
+    p_filho.add_argument("modo", choices=["antigo", "novo"])
+    p_filho.add_argument("max_size", type=int)
+
+    args = parser.parse_args()
+
+    if args.comando == "_decodificar":
+        print(json.dumps(_decodificar(args.caminho, args.modo, args.max_size)))
+
+    elif args.comando == "decodificacao":
+        mps = [float(m) for m in args.megapixels.split(",")]
+        print(f"Leitura até {args.max_size} px (mediana de {args.repeticoes})\n")
+        print(f"  {'MP':>4}  {'caminho':>8}  {'tempo (ms)':>10}  {'pico RSS (MB)':>13}  tamanho")
+        for r in bench_decodificacao(mps, args.max_size, args.repeticoes):
+            print(
+                f"  {r['megapixels']:>4g}  {r['modo']:>8}  {r['ms']:>10}  {r['pico_mb']:>13}"
+                f"  {r['tamanho'][0]}x{r['tamanho'][1]}"
+            )
+
+    elif args.comando == "importacao":
+        modulos = [m for m in args.modulos.split(",") if m]
+        print(f"Importação num interpretador novo (mediana de {args.repeticoes})\n")
+        print(f"  {'módulo':>10}  {'tempo (ms)':>10}  dependências pesadas carregadas")
+        falhou = False
+        for r in bench_importacao(modulos, args.repeticoes):
+            acima = args.orcamento_ms is not None and r["ms"] > args.orcamento_ms
+            falhou |= acima or bool(r["carregados"])
+            print(
+                f"  {r['modulo']:>10}  {r['ms']:>10}  {', '.join(r['carregados']) or '-'}"
+                f"{'  ACIMA DO ORÇAMENTO' if acima else ''}"
+            )
+        if falhou:
+            sys.exit(1)
+
+    elif args.comando == "matting":
+        resultados, fracao = bench_matting(args.tamanho, args.repeticoes)
+        print(f"Faixa desconhecida: {fracao:.1%} dos pixels (mediana de {args.repeticoes})\n")
+        print(f"  {'motor':>16}  {'tempo (ms)':>10}  {'MAE alpha':>9}  {'MAE na faixa vs pymatting':>25}")
+        for r in resultados:
+            vs = r.get("mae_faixa_vs_pymatting")
+            print(
+                f"  {r['motor']:>16}  {r['ms']:>10}  {r['mae']:>9.4f}"
+                f"  {'-' if vs is None else f'{vs:.4f}':>25}"
+            )
+
+    elif args.comando == "estagios":
+        modelos = [m for m in args.modelos.split(",") if m]
+        tamanhos = [int(t) for t in args.tamanhos.split(",")]
+        with tempfile.TemporaryDirectory() as tmp:
+            ficticios = _preparar_modelos(modelos, args.baixar, Path(tmp))
+            resultados = bench_estagios(
+                list(ficticios), tamanhos, args.repeticoes, args.max_size, args.formato, ficticios
+            )
+        relatorio = {
+            "ambiente": _ambiente(),
+            "parametros": {"repeticoes": args.repeticoes, "max_size": args.max_size, "formato": args.formato},
+            "resultados": resultados,
+        }
+        if args.baseline:
+            baseline = json.loads(Path(args.baseline).read_text())
+            relatorio["regressoes"] = comparar_baseline(
+                resultados, baseline["resultados"], args.tolerancia, args.minimo_ms
+            )
+
+        texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+        if args.json == "-":
+            print(texto)
+        else:
+            if args.json:
+                Path(args.json).write_text(texto + "\n")
+            for r in resultados:
+                marca = " (modelo fictício)" if r["ficticio"] else ""
+                print(
+                    f"\n{r['modelo']}{marca}, {r['tamanho']} px, matting {'ligado' if r['matting'] else 'desligado'}:"
+                    f" {r['imagens_s']} img/s, p50 {r['total']['p50_ms']} ms, p95 {r['total']['p95_ms']} ms,"
+                    f" pico RSS {r['pico_rss_mb']} MB"
+                )
+                for etapa, m in r["etapas"].items():
+                    print(f"  {etapa:>18}  p50 {m['p50_ms']:>9.2f} ms  p95 {m['p95_ms']:>9.2f} ms")
+            for reg in relatorio.get("regressoes", []):
+                print(
+                    f"REGRESSÃO {reg['modelo']} {reg['tamanho']} px matting={reg['matting']}: {reg['metrica']}"
+                    f" {reg['baseline']} -> {reg['atual']} ({reg['variacao']:+.0%})"
+                )
+        if relatorio.get("regressoes"):
+            sys.exit(1)
+
+    elif args.comando == "lote":
+        janelas = [float(j) for j in args.janelas.split(",")]
+        print(f"Modelo '{args.modelo}', {args.clientes} clientes, lote máximo {args.max_lote}\n")
+        print(f"  {'janela (ms)':>11}  {'img/s':>8}  {'p50 (ms)':>9}  {'p95 (ms)':>9}  {'img/lote':>8}")
+        for r in bench_lote(args.modelo, args.clientes, janelas, args.max_lote, args.duracao, args.tamanho):
+            print(
+                f"  {r['janela_ms']:>11g}  {r['imagens_s']:>8}  {r['latencia_p50_ms']:>9}"
+                f"  {r['latencia_p95_ms']:>9}  {r['media_por_lote']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Cache de resultados endereçado por conteúdo.
+Chave = hash dos bytes enviados + opções. Camada em memória (LRU limitada por bytes)
+e camada opcional em disco, também com remoção dos itens menos usados.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def novo_hash():
+    """Hash do conteúdo para as chaves; recebe o arquivo aos pedaços com update()."""
+    return hashlib.blake2b(digest_size=20)
+
+
+def chave_de_hash(resumo, **opcoes) -> str:
+    """Chave a partir do hash do arquivo já calculado (o hash original não é alterado)."""
+    h = resumo.copy()
+    h.update(json.dumps(opcoes, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def chave_resultado(conteudo: bytes, **opcoes) -> str:
+    """Hash do arquivo enviado combinado com as opções que afetam o resultado."""
+    h = novo_hash()
+    h.update(conteudo)
+    return chave_de_hash(h, **opcoes)
+
+
+class CacheLRU:
+    """
+    Cache em memória limitado pelo total de bytes; descarta o item usado há mais tempo.
+    `tamanho(valor)` dá o custo em bytes de cada item (padrão: len).
+    """
+
+    def __init__(self, max_bytes: int, tamanho=len):
+        self.max_bytes = max_bytes
+        self.tamanho = tamanho
+        self._itens: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def put(self, chave, valor):
+        if self.tamanho(valor) > self.max_bytes:
+            return
+        with self._lock:
+            antigo = self._itens.pop(chave, None)
+            if antigo is not None:
+                self._bytes -= self.tamanho(antigo)
+            self._itens[chave] = valor
+            self._bytes += self.tamanho(valor)
+            while self._bytes > self.max_bytes:
+                _, removido = self._itens.popitem(last=False)
+                self._bytes -= self.tamanho(removido)
+
+    def __len__(self):
+        return len(self._itens)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+
+class CacheDisco:
+    """Cache em disco (um arquivo por chave) limitado pelo total de bytes."""
+
+    def __init__(self, pasta: str | Path, max_bytes: int):
+        self.pasta = Path(pasta)
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Índice em ordem de uso, reconstruído a partir do mtime ao iniciar
+        arquivos = sorted(
+            (f for f in self.pasta.iterdir() if f.is_file() and not f.name.endswith(".tmp")),
+            key=lambda f: f.stat().st_mtime,
+        )
+        self._indice: OrderedDict[str, int] = OrderedDict((f.name, f.stat().st_size) for f in arquivos)
+        self._bytes = sum(self._indice.values())
+
+    def get(self, chave: str) -> bytes | None:
+        with self._lock:
+            if chave not in self._indice:
+                return None
+            self._indice.move_to_end(chave)
+        caminho = self.pasta / chave
+        try:
+            valor = caminho.read_bytes()
+            os.utime(caminho)
+            return valor
+        except FileNotFoundError:
+            with self._lock:
+                self._bytes -= self._indice.pop(chave, 0)
+            return None
+
+    def put(self, chave: str, valor: bytes):
+        if len(valor) > self.max_bytes:
+            return
+        tmp = self.pasta / f"{chave}.{threading.get_ident()}.tmp"
+        tmp.write_bytes(valor)
+        os.replace(tmp, self.pasta / chave)
+        with self._lock:
+            self._bytes -= self._indice.pop(chave, 0)
+            self._indice[chave] = len(valor)
+            self._bytes += len(valor)
+            removidos = []
+            while self._bytes > self.max_bytes:
+                nome, tamanho = self._indice.popitem(last=False)
+                self._bytes -= tamanho
+                removidos.append(nome)
+        for nome in removidos:
+            (self.pasta / nome).unlink(missing_ok=True)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+
+class CacheResultados:
+    """
+    Memória -> disco -> cálculo. Pedidos idênticos em andamento esperam o
+    primeiro cálculo em vez de rodar a inferência de novo.
+    """
+
+    def __init__(self, memoria: CacheLRU, disco: CacheDisco | None = None):
+        self.memoria = memoria
+        self.disco = disco
+        self._em_andamento: dict[str, asyncio.Task] = {}
+        self.acertos = 0
+        self.falhas = 0
+        self.compartilhados = 0
+
+    async def obter_ou_calcular(self, chave: str, calcular) -> tuple[bytes, str]:
+        """
+        Retorna (valor, origem), com origem em "memoria", "disco", "compartilhado" ou "calculado".
+        `calcular` é uma função sem argumentos que devolve uma corrotina produzindo bytes.
+        """
+        valor = self.memoria.get(chave)
+        if valor is not None:
+            self.acertos += 1
+            return valor, "memoria"
+
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is not None:
+            self.compartilhados += 1
+            return (await asyncio.shield(tarefa))[0], "compartilhado"
+
+        # Registrada antes da leitura do disco: um pedido idêntico que chegue durante a
+        # leitura espera esta tarefa em vez de calcular de novo. A tarefa independe do
+        # pedido que a criou: se esse cliente desconectar, os outros não são cancelados
+        tarefa = asyncio.ensure_future(self._obter(chave, calcular))
+        self._em_andamento[chave] = tarefa
+        return await asyncio.shield(tarefa)
+
+    async def _obter(self, chave: str, calcular) -> tuple[bytes, str]:
+        try:
+            if self.disco is not None:
+                valor = await asyncio.to_thread(self.disco.get, chave)
+                if valor is not None:
+                    self.acertos += 1
+                    self.memoria.put(chave, valor)
+                    return valor, "disco"
+
+            self.falhas += 1
+            valor = await calcular()
+            self.memoria.put(chave, valor)
+            if self.disco is not None:
+                try:
+                    await asyncio.to_thread(self.disco.put, chave, valor)
+                except OSError:
+                    # O resultado já está calculado: o pedido não falha por causa do cache
+                    logger.exception("falha ao gravar %s no cache em disco", chave)
+            return valor, "calculado"
+        finally:
+            self._em_andamento.pop(chave, None)
+
+    def estatisticas(self) -> dict:
+        stats = {
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "compartilhados": self.compartilhados,
+            "memoria_itens": len(self.memoria),
+            "memoria_bytes": self.memoria.bytes,
+        }
+        if self.disco is not None:
+            stats["disco_bytes"] = self.disco.bytes
+        return stats
+
+
+def criar_cache_do_ambiente() -> CacheResultados:
+    """REMOVEBG_CACHE_MB (memória), REMOVEBG_CACHE_DIR e REMOVEBG_CACHE_DISCO_MB (disco, opcional)."""
+    memoria = CacheLRU(int(float(os.environ.get("REMOVEBG_CACHE_MB", 256)) * 1024 * 1024))
+    disco = None
+    pasta = os.environ.get("REMOVEBG_CACHE_DIR")
+    if pasta:
+        disco = CacheDisco(pasta, int(float(os.environ.get("REMOVEBG_CACHE_DISCO_MB", 2048)) * 1024 * 1024))
+    return CacheResultados(memoria, disco)
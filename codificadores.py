@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Codificadores de saída compartilhados pela API, CLI e app Gradio.
+
+PNG com nível e estratégia zlib configuráveis, WebP sem perdas e com perdas, AVIF
+(quando o Pillow tem suporte), só a máscara (PNG de um canal) e a caixa do objeto com
+a máscara compacta em JSON (RLE ou contornos). A API escolhe o formato pelo parâmetro
+`formato` ou pelo cabeçalho Accept.
+"""
+
+import io
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import IO
+
+import numpy as np
+from PIL import Image, features
+
+from mascara import descrever_mascara
+
+# Estratégias do zlib para o PNG. "rle" é a mais rápida em recortes (muito fundo
+# transparente e cor uniforme) e gera arquivos do tamanho do nível 6 padrão.
+ESTRATEGIAS_PNG = {
+    "padrao": zlib.Z_DEFAULT_STRATEGY,
+    "filtrada": zlib.Z_FILTERED,
+    "rle": zlib.Z_RLE,
+    "huffman": zlib.Z_HUFFMAN_ONLY,
+}
+
+
+def _suporta_avif() -> bool:
+    try:
+        if features.check("avif"):
+            return True
+    except ValueError:  # Pillow antigo: recurso "avif" desconhecido
+        pass
+    try:
+        import pillow_avif  # noqa: F401  (plugin registra o formato ao importar)
+        return True
+    except ImportError:
+        return False
+
+
+class _Destino(io.RawIOBase):
+    """Stream só de escrita que acumula num bytearray (sem a cópia final do BytesIO.getvalue)."""
+
+    def __init__(self):
+        super().__init__()
+        self.dados = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.dados += b
+        return len(b)
+
+
+class Codificador:
+    """Formato de saída: tipo MIME, extensão e opções do Image.save."""
+
+    def __init__(
+        self,
+        nome: str,
+        media_type: str,
+        extensao: str,
+        formato_pil: str,
+        opcoes: dict | None = None,
+        so_mascara: bool = False,
+    ):
+        self.nome = nome
+        self.media_type = media_type
+        self.extensao = extensao
+        self.formato_pil = formato_pil
+        self.opcoes = opcoes or {}
+        # Saída de um canal (L) com o alpha do recorte; a cor de fundo não se aplica
+        self.so_mascara = so_mascara
+
+    def preparar(self, img: Image.Image) -> Image.Image:
+        if not self.so_mascara:
+            return img
+        return img.getchannel("A") if "A" in img.getbands() else img.convert("L")
+
+    def salvar(self, img: Image.Image, destino: str | Path | IO[bytes]):
+        """Codifica `img` direto no arquivo ou stream de destino."""
+        self.preparar(img).save(destino, format=self.formato_pil, **self.opcoes)
+
+    def codificar(self, img: Image.Image) -> bytearray:
+        """Imagem codificada; o bytearray vai para a resposta via memoryview, sem cópia."""
+        destino = _Destino()
+        self.salvar(img, destino)
+        return destino.dados
+
+    def nome_arquivo(self, base: str) -> str:
+        return f"{base}{self.extensao}"
+
+
+class CodificadorJSON(Codificador):
+    """
+    Caixa do objeto + máscara só dentro dela (mascara.descrever_mascara), para clientes
+    que compõem a imagem do lado deles. `representacao` = "rle" (alpha com `niveis`
+    valores) ou "contornos" (polígonos com `tolerancia` px).
+    """
+
+    def __init__(self, nome: str, representacao: str, tolerancia: float = 1.0, niveis: int = 256):
+        super().__init__(nome, "application/json", ".json", "JSON", so_mascara=True)
+        self.representacao = representacao
+        self.tolerancia = tolerancia
+        self.niveis = niveis
+
+    def salvar(self, img: Image.Image, destino: str | Path | IO[bytes]):
+        alpha = np.asarray(self.preparar(img))
+        descricao = descrever_mascara(alpha, self.representacao, self.tolerancia, self.niveis)
+        dados = json.dumps(descricao, separators=(",", ":")).encode()
+        if isinstance(destino, (str, Path)):
+            Path(destino).write_bytes(dados)
+        else:
+            destino.write(dados)
+
+
+def codificadores_do_ambiente() -> dict[str, Codificador]:
+    """
+    REMOVEBG_PNG_NIVEL (1), REMOVEBG_PNG_ESTRATEGIA (rle), REMOVEBG_WEBP_QUALIDADE (85),
+    REMOVEBG_WEBP_METODO (2), REMOVEBG_AVIF_QUALIDADE (80), REMOVEBG_CONTORNO_TOLERANCIA
+    (1.0 px de simplificação dos polígonos) e REMOVEBG_RLE_NIVEIS (256 = alpha exato no RLE).
+    """
+    nivel_png = int(os.environ.get("REMOVEBG_PNG_NIVEL", 1))
+    estrategia = ESTRATEGIAS_PNG[os.environ.get("REMOVEBG_PNG_ESTRATEGIA", "rle")]
+    qualidade_webp = int(os.environ.get("REMOVEBG_WEBP_QUALIDADE", 85))
+    metodo_webp = int(os.environ.get("REMOVEBG_WEBP_METODO", 2))
+    png = {"compress_level": nivel_png, "compress_type": estrategia}
+
+    codificadores = [
+        Codificador("png", "image/png", ".png", "PNG", png),
+        Codificador("webp", "image/webp", ".webp", "WEBP", {"lossless": True, "method": metodo_webp}),
+        Codificador(
+            "webp-lossy", "image/webp", ".webp", "WEBP", {"quality": qualidade_webp, "method": metodo_webp}
+        ),
+        Codificador("mascara", "image/png", ".png", "PNG", png, so_mascara=True),
+    ]
+    if _suporta_avif():
+        qualidade_avif = int(os.environ.get("REMOVEBG_AVIF_QUALIDADE", 80))
+        codificadores.append(
+            Codificador("avif", "image/avif", ".avif", "AVIF", {"quality": qualidade_avif, "speed": 8})
+        )
+    codificadores += [
+        CodificadorJSON("rle", "rle", niveis=int(os.environ.get("REMOVEBG_RLE_NIVEIS", 256))),
+        CodificadorJSON("contornos", "contornos", float(os.environ.get("REMOVEBG_CONTORNO_TOLERANCIA", 1.0))),
+    ]
+    return {c.nome: c for c in codificadores}
+
+
+CODIFICADORES = codificadores_do_ambiente()
+# Formatos que o Accept pode pedir, em ordem de preferência nos empates (PNG primeiro)
+NEGOCIAVEIS = [nome for nome in ("png", "webp", "avif") if nome in CODIFICADORES]
+
+
+def _qualidades_accept(accept: str) -> list[tuple[str, float]]:
+    """Lista (tipo, q) do cabeçalho Accept."""
+    itens = []
+    for parte in accept.split(","):
+        campos = [c.strip() for c in parte.split(";")]
+        if not campos[0]:
+            continue
+        q = 1.0
+        for campo in campos[1:]:
+            if campo.startswith("q="):
+                try:
+                    q = float(campo[2:])
+                except ValueError:
+                    q = 0.0
+        itens.append((campos[0].lower(), q))
+    return itens
+
+
+def _qualidade(media_type: str, itens: list[tuple[str, float]]) -> float | None:
+    """q do tipo no Accept: o tipo exato vale mais que image/* e */* (RFC 9110). None se não aparece."""
+    exatos = [q for t, q in itens if t == media_type]
+    if exatos:
+        return max(exatos)
+    curingas = [q for t, q in itens if t in ("image/*", "*/*")]
+    return max(curingas) if curingas else None
+
+
+def negociar(formato: str | None, accept: str | None) -> Codificador | None:
+    """
+    Codificador pedido: `formato` explícito tem prioridade; senão o tipo aceito com maior q
+    (PNG nos empates). Sem nenhum tipo de imagem suportado no Accept (ex: `application/json`)
+    volta ao PNG, como antes da negociação; None (406) só quando o Accept exclui o PNG
+    explicitamente com q=0 (`image/*;q=0`, `image/png;q=0`...).
+    """
+    if formato:
+        return CODIFICADORES.get(formato.lower())
+    if not accept:
+        return CODIFICADORES["png"]
+
+    itens = _qualidades_accept(accept)
+    melhor, melhor_q = None, 0.0
+    for nome in NEGOCIAVEIS:
+        q = _qualidade(CODIFICADORES[nome].media_type, itens) or 0.0
+        if q > melhor_q:
+            melhor, melhor_q = CODIFICADORES[nome], q
+    if melhor is None and _qualidade(CODIFICADORES["png"].media_type, itens) != 0.0:
+        return CODIFICADORES["png"]
+    return melhor
@@ -4,50 +4,382 @@ Lógica compartilhada de remoção de fundo.
 Usado pelo app Gradio e pela API REST.
 """
 
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
 from PIL import Image
-from rembg import remove, new_session
 
-# Suporte HEIC
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-except ImportError:
-    pass
+from cache import CacheLRU
+from ingestao import orientar, redimensionar
+from mascara import ampliar_alpha, caixa_objeto, expandir_caixa, incerteza
+from matting import recortar
+from lotes import AgendadorLotes, config_do_ambiente
+from sessoes import GerenciadorSessoes, modelos_para_precarregar
+from sessoes import config_do_ambiente as config_sessoes
+from servidor_inferencia import cliente_do_ambiente
+from variantes import nova_sessao, variantes
+
+# O rembg (e com ele o pymatting/numba) agora é importado sob demanda, muitas vezes numa
+# thread do executor; a camada TBB do numba iniciada fora da thread principal trava a
+# saída do processo. A camada OpenMP não tem esse problema e aceita chamadas de várias threads.
+os.environ.setdefault("NUMBA_THREADING_LAYER", "omp")
 
-_sessions = {}
+# Sessões carregadas sob demanda, dentro do orçamento de memória (REMOVEBG_MEMORIA_MODELOS_MB).
+# nova_sessao também abre as variantes quantizadas (quantizar.py)
+_sessions = GerenciadorSessoes(nova_sessao, **config_sessoes())
 MAX_SIZE = 1024
+# Modelo dos pedidos sem `modelo` (API, remover_fundo)
+MODELO_PADRAO = "u2netp"
+
+# Pré-processamento de cada modelo: (média, desvio, tamanho de entrada, aplica sigmoid).
+# Mesmos valores das sessões do rembg, para que o lote dê o mesmo resultado que session.predict.
+_IMAGENET = ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
+PARAMS_MODELO = {
+    "u2netp": (*_IMAGENET, (320, 320), False),
+    "u2net": (*_IMAGENET, (320, 320), False),
+    "u2net_human_seg": (*_IMAGENET, (320, 320), False),
+    "isnet-general-use": ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024), False),
+    "birefnet-general": (*_IMAGENET, (1024, 1024), True),
+    "bria-rmbg": (*_IMAGENET, (1024, 1024), False),
+}
+# Variantes INT8/FP16 usam o pré-processamento do modelo base
+PARAMS_MODELO.update(
+    {nome: PARAMS_MODELO[info["base"]] for nome, info in variantes().items() if info["base"] in PARAMS_MODELO}
+)
 
 
 def get_session(modelo: str):
-    if modelo not in _sessions:
-        _sessions[modelo] = new_session(modelo)
-    return _sessions[modelo]
+    return _sessions.get(modelo)
+
+
+# Com REMOVEBG_INFERENCIA, a máscara vem do servidor de inferência (servidor_inferencia.py)
+# e este processo não carrega modelo nenhum
+inferencia_remota = cliente_do_ambiente()
+
+
+# Tempo por etapa (benchmark.py estagios). Só mede na thread que abriu `medindo_etapas`;
+# fora disso `medir_etapa` não faz nada além de um getattr.
+_medicao = threading.local()
+
+
+@contextmanager
+def medir_etapa(nome: str):
+    """Soma a duração do bloco na etapa `nome`, se esta thread estiver medindo."""
+    tempos = getattr(_medicao, "tempos", None)
+    if tempos is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tempos[nome] = tempos.get(nome, 0.0) + time.perf_counter() - t0
+
+
+@contextmanager
+def medindo_etapas():
+    """Dentro do bloco, o dicionário devolvido acumula os segundos de cada etapa desta thread."""
+    anterior = getattr(_medicao, "tempos", None)
+    _medicao.tempos = tempos = {}
+    try:
+        yield tempos
+    finally:
+        _medicao.tempos = anterior
+
+
+def _normalizar(img: Image.Image, mean, std, size) -> np.ndarray:
+    """Imagem -> tensor (3, H, W) float32, como BaseSession.normalize."""
+    im = np.asarray(img.convert("RGB").resize(size, Image.Resampling.LANCZOS), dtype=np.float32)
+    im = im / max(float(im.max()), 1e-6)
+    im = (im - np.asarray(mean, dtype=np.float32)) / np.asarray(std, dtype=np.float32)
+    return im.transpose((2, 0, 1))
+
+
+def _inferir_lote(entradas: list[np.ndarray], modelo: str) -> list[np.ndarray]:
+    """Empilha os tensores (3, H, W) e roda o modelo uma única vez; devolve a saída bruta de cada um."""
+    entrada = np.stack(entradas)
+
+    with _sessions.usar(modelo) as session:
+        inp = session.inner_session.get_inputs()[0]
+        if inp.shape and inp.shape[0] == 1 and len(entradas) > 1:
+            # Modelo exportado com lote fixo em 1
+            preds = np.concatenate(
+                [session.inner_session.run(None, {inp.name: entrada[i : i + 1]})[0] for i in range(len(entradas))]
+            )
+        else:
+            preds = session.inner_session.run(None, {inp.name: entrada})[0]
+    return list(preds[:, 0, :, :])
+
+
+def _mascara_de_pred(pred: np.ndarray, sigmoid: bool, size: tuple[int, int]) -> Image.Image:
+    """Saída bruta do modelo -> máscara L no tamanho da imagem."""
+    if sigmoid:
+        pred = 1 / (1 + np.exp(-pred))
+    mi, ma = pred.min(), pred.max()
+    pred = (pred - mi) / max(ma - mi, 1e-6)
+    mask = Image.fromarray((pred.clip(0, 1) * 255).astype(np.uint8), mode="L")
+    return mask.resize(size, Image.Resampling.LANCZOS)
+
+
+def prever_mascaras(imgs: list[Image.Image], modelo: str) -> list[Image.Image]:
+    """Máscaras (L) de várias imagens com uma única execução do modelo."""
+    if inferencia_remota is not None:
+        return [inferencia_remota.prever(img, modelo) for img in imgs]
+
+    params = PARAMS_MODELO.get(modelo)
+    if params is None:
+        with _sessions.usar(modelo) as session:
+            return [session.predict(img)[0] for img in imgs]
+
+    mean, std, size, sigmoid = params
+    preds = _inferir_lote([_normalizar(img, mean, std, size) for img in imgs], modelo)
+    return [_mascara_de_pred(pred, sigmoid, img.size) for img, pred in zip(imgs, preds)]
+
+
+# Pedidos simultâneos do mesmo modelo viram um único session.run.
+# Normalização e redimensionamento da máscara rodam na thread de cada pedido.
+agendador = AgendadorLotes(_inferir_lote, **config_do_ambiente())
+
+
+def prever_mascara(img: Image.Image, modelo: str) -> Image.Image:
+    """Máscara de uma imagem, agrupada em lote com pedidos concorrentes do mesmo modelo."""
+    if inferencia_remota is not None:
+        with medir_etapa("inferencia"):
+            return inferencia_remota.prever(img, modelo)
+
+    params = PARAMS_MODELO.get(modelo)
+    if params is None:
+        with _sessions.usar(modelo) as session:
+            return session.predict(img)[0]
+
+    mean, std, size, sigmoid = params
+    with medir_etapa("pre_processamento"):
+        entrada = _normalizar(img, mean, std, size)
+    with medir_etapa("inferencia"):
+        pred = agendador.prever(modelo, entrada)
+    with medir_etapa("mascara"):
+        return _mascara_de_pred(pred, sigmoid, img.size)
+
+
+def aquecer(modelo: str):
+    """Inferência de teste: aloca os buffers do ONNX antes do primeiro pedido real."""
+    prever_mascaras([Image.new("RGB", (64, 64))], modelo)
+    import rembg.bg  # noqa: F401 - pós-processamento e matting, importados sob demanda
+
+
+def modelos_iniciais() -> list[str]:
+    """Modelos de REMOVEBG_PRECARREGAR ou, sem nenhum, o modelo padrão."""
+    return modelos_para_precarregar() or [MODELO_PADRAO]
+
+
+def pre_carregar(modelos: list[str] | None = None):
+    """
+    Carrega e aquece os modelos (padrão: modelos_iniciais). Eles nunca são removidos da
+    memória.
+    """
+    if inferencia_remota is not None:
+        return  # os modelos ficam nos processos do servidor de inferência (--colocacao)
+    _sessions.pre_carregar(modelos_iniciais() if modelos is None else modelos, aquecer=aquecer)
+
+
+def _bytes_imagem(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+# Resultados intermediários por (hash da imagem, modelo, tamanho[, matting]).
+# Mudar só a cor de fundo ou ligar/desligar o matting não roda o modelo de novo.
+_cache_etapas = CacheLRU(
+    int(float(os.environ.get("REMOVEBG_CACHE_MASCARAS_MB", 128)) * 1024 * 1024), tamanho=_bytes_imagem
+)
+
+
+def hash_imagem(img: Image.Image) -> str:
+    """Hash dos pixels (e do tamanho/modo) de uma imagem já decodificada."""
+    h = hashlib.blake2b(img.tobytes(), digest_size=16)
+    h.update(f"{img.mode}{img.size}".encode())
+    return h.hexdigest()
+
+
+def etapa_mascara(img: Image.Image, modelo: str, chave: str | None = None) -> Image.Image:
+    """Etapa 1: máscara bruta do modelo (em cache)."""
+    chave = ("mascara", chave or hash_imagem(img), modelo, img.size)
+    mask = _cache_etapas.get(chave)
+    if mask is None:
+        mask = prever_mascara(img, modelo)
+        _cache_etapas.put(chave, mask)
+    return mask
+
+
+# modelo="auto": cascata do modelo mais rápido ao mais preciso. Cada modelo, menos o
+# último, só é aceito se a incerteza da máscara (mascara.incerteza) ficar até o limiar
+MODELO_AUTO = "auto"
+CASCATA = [m.strip() for m in os.environ.get("REMOVEBG_AUTO_MODELOS", "u2netp,birefnet-general").split(",") if m.strip()]
+LIMIAR_AUTO = float(os.environ.get("REMOVEBG_AUTO_LIMIAR", 0.15))
+
+
+def _orientada_rgb(img: Image.Image) -> Image.Image:
+    img = orientar(img)
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+
+def preparar_inferencia(img: Image.Image, max_size: int = MAX_SIZE) -> Image.Image:
+    """Imagem orientada, em RGB e com lado maior `max_size`: a mesma que remover_fundo passa ao modelo."""
+    with medir_etapa("redimensionamento"):
+        return redimensionar(_orientada_rgb(img), max_size)
+
+
+def avaliar_modelo(inferencia: Image.Image, modelo: str) -> float:
+    """Incerteza da máscara de `modelo`; a máscara fica no cache de etapas para o recorte."""
+    mask = etapa_mascara(inferencia, modelo)
+    with medir_etapa("incerteza"):
+        return incerteza(np.asarray(mask))
+
+
+def escolher_modelo(
+    inferencia: Image.Image, modelos: list[str] | None = None, limiar: float | None = None
+) -> tuple[str, float | None]:
+    """
+    (modelo, incerteza do último avaliado): o primeiro da cascata com incerteza até o
+    limiar, ou o último da lista, aceito sem avaliar.
+    """
+    modelos = modelos or CASCATA
+    limiar = LIMIAR_AUTO if limiar is None else limiar
+    nota = None
+    for modelo in modelos[:-1]:
+        nota = avaliar_modelo(inferencia, modelo)
+        if nota <= limiar:
+            return modelo, nota
+    return modelos[-1], nota
+
+
+def etapa_recorte(
+    img: Image.Image,
+    modelo: str,
+    alpha_matting: bool = False,
+    chave: str | None = None,
+) -> Image.Image:
+    """Etapa 2: pós-processa a máscara e recorta (com alpha matting opcional). Resultado RGBA em cache."""
+    chave = chave or hash_imagem(img)
+    chave_recorte = ("recorte", chave, modelo, img.size, alpha_matting)
+    output = _cache_etapas.get(chave_recorte)
+    if output is not None:
+        return output
+
+    output = aplicar_mascara(img, etapa_mascara(img, modelo, chave), alpha_matting)
+    _cache_etapas.put(chave_recorte, output)
+    return output
+
+
+def aplicar_mascara(
+    img: Image.Image, mask: Image.Image, alpha_matting: bool = False, pos_processar: bool = True
+) -> Image.Image:
+    """
+    Pós-processa uma máscara bruta e recorta `img` com ela (sem cache; usado também pelo
+    modo sequência e pela CLI em resolução original).
+    """
+    from rembg.bg import naive_cutout, post_process
+
+    if pos_processar:
+        with medir_etapa("pos_processamento"):
+            mask = Image.fromarray(post_process(np.array(mask)))
+
+    if alpha_matting:
+        # Matting só na faixa desconhecida do trimap (matting.py), em blocos
+        with medir_etapa("matting"):
+            return recortar(img, mask, 270, 20, 11)
+    with medir_etapa("recorte"):
+        return naive_cutout(img, mask)
+
+
+def etapa_composicao(recorte: Image.Image, bgcolor: tuple[int, int, int, int] | None = None) -> Image.Image:
+    """Etapa 3: aplica a cor de fundo (ou devolve uma cópia do recorte transparente)."""
+    from rembg.bg import apply_background_color
+
+    with medir_etapa("composicao"):
+        if bgcolor is None:
+            return recorte.copy()
+        return apply_background_color(recorte, bgcolor)
+
+
+def etapa_saida(
+    recorte: Image.Image,
+    inferencia: Image.Image,
+    saida: Image.Image,
+    bgcolor: tuple[int, int, int, int] | None = None,
+) -> Image.Image:
+    """
+    Etapa 3 em resolução maior que a da inferência: o alpha do recorte é ampliado
+    seguindo as bordas de `saida` (filtro guiado) e aplicado aos pixels originais.
+    """
+    with medir_etapa("ampliacao"):
+        alpha = ampliar_alpha(recorte.getchannel("A"), inferencia, saida)
+        output = saida.convert("RGBA")
+        output.putalpha(alpha)
+    if bgcolor is not None:
+        from rembg.bg import apply_background_color
+
+        with medir_etapa("composicao"):
+            output = apply_background_color(output, bgcolor)
+    return output
+
+
+def cortar_ao_objeto(recorte: Image.Image, margem: int = 0) -> Image.Image:
+    """
+    Corta o recorte (RGBA) na caixa do objeto mais `margem` px de cada lado, sem passar
+    da imagem. Sem nenhum pixel do objeto, devolve o recorte inteiro.
+    """
+    with medir_etapa("corte"):
+        caixa = caixa_objeto(np.asarray(recorte.getchannel("A")))
+        if caixa is None:
+            return recorte
+        return recorte.crop(expandir_caixa(caixa, margem, recorte.width, recorte.height))
 
 
 def remover_fundo(
     img: Image.Image,
-    modelo: str = "u2netp",
+    modelo: str = MODELO_PADRAO,
     alpha_matting: bool = False,
     bgcolor: tuple[int, int, int, int] | None = None,
     max_size: int = MAX_SIZE,
+    tamanho_saida: int | None = None,
+    margem_objeto: int | None = None,
 ) -> Image.Image:
-    """Remove fundo e retorna imagem PNG com transparência."""
-    img = img.convert("RGB")
-
-    w, h = img.size
-    if max_size and max(w, h) > max_size:
-        ratio = max_size / max(w, h)
-        img = img.resize((int(w * ratio), int(h * ratio)), Image.Resampling.LANCZOS)
-
-    session = get_session(modelo)
-    output = remove(
-        img,
-        session=session,
-        alpha_matting=alpha_matting,
-        alpha_matting_foreground_threshold=270,
-        alpha_matting_background_threshold=20,
-        alpha_matting_erode_size=11,
-        post_process_mask=True,
-        bgcolor=bgcolor,
-    )
-    return output
+    """
+    Remove fundo e retorna imagem PNG com transparência.
+
+    `max_size` é o tamanho da inferência (lado maior). `tamanho_saida` é o da imagem
+    devolvida: None = igual à inferência, 0 = resolução original. Saídas maiores que a
+    inferência usam a máscara ampliada por filtro guiado sobre os pixels originais.
+    Com `modelo="auto"` roda a cascata (escolher_modelo) e usa o modelo escolhido.
+    Com `margem_objeto` (px) a saída é cortada na caixa do objeto mais essa margem,
+    antes de aplicar a cor de fundo.
+    Imagens vindas de ingestao.abrir_imagem já estão orientadas, em RGB e no tamanho certo.
+    """
+    # Blocos medidos um depois do outro (nunca um dentro do outro): a etapa não conta em dobro
+    with medir_etapa("redimensionamento"):
+        img = _orientada_rgb(img)  # a saída parte da mesma imagem: orienta uma vez só
+    inferencia = preparar_inferencia(img, max_size)
+    if tamanho_saida is None:
+        saida = inferencia
+    else:
+        with medir_etapa("redimensionamento"):
+            saida = redimensionar(img, tamanho_saida or None)
+
+    if modelo == MODELO_AUTO:
+        modelo, _ = escolher_modelo(inferencia)
+    # Cortando, a cor de fundo entra só depois: a caixa sai do alpha do recorte
+    recorte = etapa_recorte(inferencia, modelo, alpha_matting)
+    if saida.width > inferencia.width:
+        recorte = etapa_saida(recorte, inferencia, saida, bgcolor if margem_objeto is None else None)
+        if margem_objeto is None:
+            return recorte
+    elif saida.size != inferencia.size:
+        with medir_etapa("redimensionamento"):
+            recorte = recorte.resize(saida.size, Image.Resampling.LANCZOS)
+    if margem_objeto is not None:
+        recorte = cortar_ao_objeto(recorte, margem_objeto)
+    return etapa_composicao(recorte, bgcolor)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Execução da inferência fora do event loop.
+Cada modelo tem seu próprio limite de concorrência e uma fila de espera limitada,
+para que modelos pesados não travem o servidor nem acumulem pedidos sem fim.
+"""
+
+import asyncio
+import functools
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from lotes import config_do_ambiente as config_lotes
+
+# Quantas inferências (micro-lotes) de cada modelo podem rodar ao mesmo tempo
+LIMITES_PADRAO = {
+    "u2netp": 4,
+    "u2net": 2,
+    "u2net_human_seg": 2,
+    "isnet-general-use": 1,
+    "birefnet-general": 1,
+    "bria-rmbg": 1,
+}
+
+
+class FilaCheia(Exception):
+    """A fila de espera do modelo está cheia; o cliente deve tentar de novo depois."""
+
+    def __init__(self, modelo: str, retry_after: int):
+        super().__init__(f"Fila do modelo '{modelo}' está cheia. Tente novamente em {retry_after}s.")
+        self.modelo = modelo
+        self.retry_after = retry_after
+
+
+def _processo_sem_lotes():
+    """
+    Início de cada processo do pool: ele atende um pedido por vez, então o micro-lote
+    nunca se forma e só somaria a espera de REMOVEBG_LOTE_ESPERA_MS a cada imagem.
+    """
+    os.environ["REMOVEBG_LOTE_MAX"] = "1"
+    core = sys.modules.get("core")
+    if core is not None:  # herdado do processo principal (fork)
+        core.agendador.max_lote = 1
+
+
+def _ler_limites(valor: str | None) -> dict[str, int]:
+    """Converte 'birefnet-general=1,u2netp=4' em dicionário."""
+    limites = {}
+    for item in (valor or "").split(","):
+        if "=" not in item:
+            continue
+        nome, n = item.split("=", 1)
+        limites[nome.strip()] = max(1, int(n))
+    return limites
+
+
+class ExecutorInferencia:
+    """
+    Roda funções síncronas (inferência + codificação) num pool de threads ou processos.
+
+    `limites[modelo]` conta inferências simultâneas do modelo (a API passa `limite` ao
+    lotes.AgendadorLotes, que roda essa quantidade de lotes do modelo ao mesmo tempo) e
+    cada uma junta até `lote` imagens: até `capacidade(modelo)` = limite × lote pedidos
+    rodam ao mesmo tempo, para o lote poder se formar mesmo em modelos pesados com limite 1.
+    Além deles, até `fila_max` pedidos aguardam; acima disso `executar` levanta FilaCheia.
+
+    No pool de processos cada processo atende um pedido por vez, com seu próprio cache de
+    etapas: não há micro-lotes (`lote` > 1 é recusado). Para juntar lotes entre processos
+    use o servidor de inferência compartilhado (servidor_inferencia.py).
+    """
+
+    def __init__(
+        self,
+        tipo: str = "thread",
+        workers: int | None = None,
+        limites: dict[str, int] | None = None,
+        limite_padrao: int = 1,
+        fila_max: int = 8,
+        retry_after: int = 5,
+        lote: int = 1,
+    ):
+        if tipo not in ("thread", "process"):
+            raise ValueError("tipo deve ser 'thread' ou 'process'")
+        if tipo == "process" and lote > 1:
+            raise ValueError(
+                "micro-lotes (REMOVEBG_LOTE_MAX > 1) não funcionam com REMOVEBG_EXECUTOR=process: "
+                "use REMOVEBG_LOTE_MAX=1 ou o servidor de inferência compartilhado"
+            )
+        self.tipo = tipo
+        self.limites = {**LIMITES_PADRAO, **(limites or {})}
+        self.limite_padrao = limite_padrao
+        self.lote = max(1, lote)
+        # Pool grande o bastante para todos os modelos rodarem na capacidade ao mesmo tempo,
+        # assim um modelo leve nunca espera por threads ocupadas por um pesado
+        self.workers = workers or sum(self.capacidade(m) for m in self.limites)
+        self.fila_max = fila_max
+        self.retry_after = retry_after
+        self._pool: Executor | None = None
+        self._semaforos: dict[str, asyncio.Semaphore] = {}
+        self._esperando: dict[str, int] = {}
+        self._rodando: dict[str, int] = {}
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.tipo == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_processo_sem_lotes)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inferencia")
+        return self._pool
+
+    def limite(self, modelo: str) -> int:
+        return self.limites.get(modelo, self.limite_padrao)
+
+    def capacidade(self, modelo: str) -> int:
+        """Pedidos do modelo rodando ao mesmo tempo: `limite` inferências de até `lote` imagens."""
+        return self.limite(modelo) * self.lote
+
+    async def executar(self, modelo: str, fn, /, *args, **kwargs):
+        """Executa fn(*args, **kwargs) no pool respeitando a capacidade do modelo."""
+        sem = self._semaforos.get(modelo)
+        if sem is None:
+            sem = self._semaforos[modelo] = asyncio.Semaphore(self.capacidade(modelo))
+
+        if sem.locked() and self._esperando.get(modelo, 0) >= self.fila_max:
+            raise FilaCheia(modelo, self.retry_after)
+
+        self._esperando[modelo] = self._esperando.get(modelo, 0) + 1
+        try:
+            await sem.acquire()
+        finally:
+            self._esperando[modelo] -= 1
+
+        self._rodando[modelo] = self._rodando.get(modelo, 0) + 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), functools.partial(fn, *args, **kwargs))
+        finally:
+            self._rodando[modelo] -= 1
+            sem.release()
+
+    def estatisticas(self) -> dict:
+        """Execuções em andamento e pedidos na fila, por modelo."""
+        modelos = set(self._rodando) | set(self._esperando)
+        return {
+            m: {
+                "rodando": self._rodando.get(m, 0),
+                "na_fila": self._esperando.get(m, 0),
+                "limite": self.limite(m),
+                "capacidade": self.capacidade(m),
+            }
+            for m in sorted(modelos)
+        }
+
+    def fechar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def criar_executor_do_ambiente() -> ExecutorInferencia:
+    """
+    Cria o executor a partir de variáveis de ambiente:
+    REMOVEBG_EXECUTOR (thread|process), REMOVEBG_WORKERS, REMOVEBG_CONCORRENCIA
+    ("modelo=n,..."), REMOVEBG_FILA e REMOVEBG_RETRY_AFTER. O tamanho do lote vem de
+    REMOVEBG_LOTE_MAX; com processos ele passa a 1, e pedi-lo maior é erro.
+    """
+    workers = os.environ.get("REMOVEBG_WORKERS")
+    tipo = os.environ.get("REMOVEBG_EXECUTOR", "thread")
+    lote = config_lotes()["max_lote"]
+    if tipo == "process" and "REMOVEBG_LOTE_MAX" not in os.environ:
+        lote = 1
+    return ExecutorInferencia(
+        tipo=tipo,
+        workers=int(workers) if workers else None,
+        limites=_ler_limites(os.environ.get("REMOVEBG_CONCORRENCIA")),
+        fila_max=int(os.environ.get("REMOVEBG_FILA", 8)),
+        retry_after=int(os.environ.get("REMOVEBG_RETRY_AFTER", 5)),
+        lote=lote,
+    )
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Leitura de imagens já no tamanho de trabalho.
+Quando o tamanho alvo é conhecido, JPEG e HEIC são decodificados em escala reduzida
+(draft do JPEG, miniaturas embutidas do HEIF), a orientação EXIF é aplicada uma vez
+e o modo de cor é convertido uma única vez.
+"""
+
+import functools
+import io
+from pathlib import Path
+from typing import IO
+
+from PIL import Image, ImageOps
+
+_ORIENTACAO = 0x0112
+
+
+@functools.cache
+def registrar_heif() -> bool:
+    """
+    Suporte HEIC/HEIF no Pillow (pillow-heif, opcional). Feito na primeira imagem aberta,
+    não no import, para não pesar na inicialização; False se não estiver instalado.
+    """
+    try:
+        from pillow_heif import register_heif_opener
+    except ImportError:
+        return False
+    register_heif_opener()
+    return True
+
+
+def tamanho_reduzido(w: int, h: int, max_size: int | None) -> tuple[int, int]:
+    """Tamanho final com o lado maior limitado a max_size (mesmo arredondamento do core)."""
+    if not max_size or max(w, h) <= max_size:
+        return w, h
+    ratio = max_size / max(w, h)
+    return int(w * ratio), int(h * ratio)
+
+
+def orientar(img: Image.Image) -> Image.Image:
+    """Aplica a orientação EXIF só quando existe (evita a cópia do exif_transpose)."""
+    if img.getexif().get(_ORIENTACAO, 1) in (0, 1):
+        return img
+    return ImageOps.exif_transpose(img)
+
+
+def redimensionar(img: Image.Image, max_size: int | None) -> Image.Image:
+    """LANCZOS até max_size; reduções grandes passam antes por uma média em bloco (reduce)."""
+    tamanho = tamanho_reduzido(*img.size, max_size)
+    if tamanho == img.size:
+        return img
+    return img.resize(tamanho, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+class ImagemGrandeDemais(ValueError):
+    """Imagem que, mesmo decodificada em escala reduzida, passaria do limite de pixels."""
+
+
+def _descartar(img: Image.Image, fonte):
+    """Fecha a imagem só lida no cabeçalho; um arquivo aberto de quem chamou continua aberto."""
+    if not hasattr(fonte, "read"):
+        img.close()
+
+
+def _abrir(
+    fonte: bytes | str | Path | IO[bytes], max_size: int | None, max_pixels: int | None
+) -> tuple[Image.Image, tuple[int, int]]:
+    """
+    Só lê o cabeçalho: escolhe a escala de decodificação (draft) e confere os pixels
+    que seriam alocados antes de qualquer decodificação. Devolve (imagem, tamanho original).
+    """
+    registrar_heif()
+    arquivo = io.BytesIO(fonte) if isinstance(fonte, bytes) else fonte
+    if hasattr(arquivo, "seek"):
+        arquivo.seek(0)  # o mesmo arquivo aberto pode ser lido mais de uma vez (cabeçalho, auto, recorte)
+    try:
+        img = Image.open(arquivo)
+    except Image.DecompressionBombError as e:
+        raise ImagemGrandeDemais(str(e)) from e
+    original = img.size
+
+    if max_size:
+        alvo = tamanho_reduzido(*img.size, max_size)
+        if alvo != img.size:
+            img.draft("RGB", alvo)
+
+    if max_pixels and img.width * img.height > max_pixels:
+        w, h = img.size
+        _descartar(img, fonte)
+        raise ImagemGrandeDemais(
+            f"{w}x{h} = {w * h / 1e6:.1f} MP acima do limite de {max_pixels / 1e6:.1f} MP"
+            + (" (sem redução possível na decodificação deste formato)" if max_size else "")
+        )
+    return img, original
+
+
+def verificar_dimensoes(
+    fonte: bytes | str | Path | IO[bytes], max_size: int | None = None, max_pixels: int | None = None
+) -> tuple[int, int]:
+    """(largura, altura) originais lidas do cabeçalho; ImagemGrandeDemais como em abrir_imagem."""
+    img, original = _abrir(fonte, max_size, max_pixels)
+    _descartar(img, fonte)
+    return original
+
+
+def abrir_imagem(
+    fonte: bytes | str | Path | IO[bytes], max_size: int | None = None, max_pixels: int | None = None
+) -> Image.Image:
+    """
+    Abre a imagem em RGB, orientada e com o lado maior <= max_size.
+
+    Com max_size, o decoder já entrega a imagem reduzida (1/2, 1/4 ou 1/8 no JPEG,
+    miniatura embutida no HEIC) quando isso não fica abaixo do tamanho alvo.
+    Com max_pixels, imagens que ainda decodificariam acima disso levantam
+    ImagemGrandeDemais antes de alocar os pixels.
+    """
+    return abrir_com_dimensoes(fonte, max_size, max_pixels)[0]
+
+
+def abrir_com_dimensoes(
+    fonte: bytes | str | Path | IO[bytes], max_size: int | None = None, max_pixels: int | None = None
+) -> tuple[Image.Image, tuple[int, int]]:
+    """abrir_imagem e as dimensões originais do cabeçalho, lendo o cabeçalho uma vez só."""
+    img, original = _abrir(fonte, max_size, max_pixels)
+    img = orientar(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return redimensionar(img, max_size), original
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Micro-lotes dinâmicos: junta pedidos simultâneos do mesmo modelo numa única
+execução do ONNX. Cada modelo tem `paralelos(modelo)` threads; cada uma espera até
+`espera_ms` por mais pedidos (ou até `max_lote` imagens) e roda a inferência uma vez só.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class AgendadorLotes:
+    """
+    Agrupa chamadas de `prever(modelo, entrada)` vindas de várias threads.
+
+    `fn_lote(entradas, modelo)` recebe a lista de entradas e devolve uma saída por
+    entrada, na mesma ordem. `paralelos(modelo)` é quantas inferências do modelo rodam
+    ao mesmo tempo (padrão 1; a API usa o limite do executor, REMOVEBG_CONCORRENCIA).
+    """
+
+    def __init__(self, fn_lote, max_lote: int = 8, espera_ms: float = 5.0, paralelos=None):
+        self.fn_lote = fn_lote
+        self.max_lote = max(1, max_lote)
+        self.espera_ms = max(0.0, espera_ms)
+        self.paralelos = paralelos or (lambda modelo: 1)
+        self._filas: dict[str, queue.Queue] = {}
+        self._lock = threading.Lock()
+        self._lotes = 0
+        self._imagens = 0
+
+    def _fila(self, modelo: str) -> queue.Queue:
+        with self._lock:
+            fila = self._filas.get(modelo)
+            if fila is None:
+                fila = self._filas[modelo] = queue.Queue()
+                for i in range(max(1, self.paralelos(modelo))):
+                    threading.Thread(
+                        target=self._loop, args=(modelo, fila), name=f"lote-{modelo}-{i}", daemon=True
+                    ).start()
+            return fila
+
+    def _loop(self, modelo: str, fila: queue.Queue):
+        while True:
+            itens = [fila.get()]
+            try:
+                prazo = time.monotonic() + self.espera_ms / 1000
+                while len(itens) < self.max_lote:
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        break
+                    try:
+                        itens.append(fila.get(timeout=restante))
+                    except queue.Empty:
+                        break
+
+                saidas = list(self.fn_lote([entrada for entrada, _ in itens], modelo))
+                if len(saidas) != len(itens):
+                    raise RuntimeError(f"{modelo}: {len(saidas)} saídas para um lote de {len(itens)} entradas")
+                with self._lock:
+                    self._lotes += 1
+                    self._imagens += len(itens)
+                for (_, fut), saida in zip(itens, saidas):
+                    fut.set_result(saida)
+            except Exception as e:
+                # Nenhum pedido do lote fica esperando para sempre
+                for _, fut in itens:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def prever(self, modelo: str, entrada):
+        """Enfileira a entrada e bloqueia até a saída do lote ficar pronta."""
+        if self.max_lote == 1:
+            return self.fn_lote([entrada], modelo)[0]
+        fut: Future = Future()
+        self._fila(modelo).put((entrada, fut))
+        return fut.result()
+
+    def estatisticas(self) -> dict:
+        """Lotes executados e tamanho médio do lote."""
+        with self._lock:
+            lotes, imagens = self._lotes, self._imagens
+        return {
+            "lotes": lotes,
+            "imagens": imagens,
+            "media_por_lote": round(imagens / lotes, 2) if lotes else 0.0,
+        }
+
+
+def config_do_ambiente() -> dict:
+    """Lê REMOVEBG_LOTE_MAX e REMOVEBG_LOTE_ESPERA_MS."""
+    return {
+        "max_lote": int(os.environ.get("REMOVEBG_LOTE_MAX", 8)),
+        "espera_ms": float(os.environ.get("REMOVEBG_LOTE_ESPERA_MS", 5)),
+    }
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Manifesto de processamento em lote, gravado na pasta de saída.
+Uma linha JSON por arquivo concluído (caminho, tamanho, mtime, hash, modelo e opções):
+reexecuções pulam o que não mudou e execuções interrompidas continuam de onde pararam.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+NOME_ARQUIVO = ".removebg-manifesto.jsonl"
+
+
+def hash_arquivo(dados: bytes) -> str:
+    return hashlib.blake2b(dados, digest_size=20).hexdigest()
+
+
+def ler_arquivo(arquivo: Path) -> tuple[bytes, tuple[int, int]]:
+    """
+    Bytes do arquivo e a assinatura (tamanho, mtime_ns) de quando foram lidos. É essa
+    assinatura que vai para `Manifesto.registrar`: um stat no fim do lote pegaria uma
+    versão mais nova que a processada, e a próxima execução a pularia.
+    """
+    with open(arquivo, "rb") as f:
+        st = os.fstat(f.fileno())
+        return f.read(), (st.st_size, st.st_mtime_ns)
+
+
+class Manifesto:
+    """
+    Registro append-only (JSONL) dos arquivos processados; a última linha de cada
+    entrada vale. Cada linha é gravada assim que o arquivo de saída fica pronto.
+    """
+
+    def __init__(self, pasta_saida: str | Path, opcoes: dict):
+        self.caminho = Path(pasta_saida) / NOME_ARQUIVO
+        # Modelo e opções que mudam o resultado: trocar qualquer um reprocessa tudo
+        self.opcoes = opcoes
+        self._registros: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        linhas = 0
+        if self.caminho.exists():
+            with open(self.caminho, encoding="utf-8") as f:
+                for linha in f:
+                    linhas += 1
+                    try:
+                        registro = json.loads(linha)
+                    except json.JSONDecodeError:
+                        continue  # última linha cortada por uma interrupção
+                    self._registros[registro["entrada"]] = registro
+        if linhas > 2 * len(self._registros) + 100:
+            self._compactar()
+
+    def _compactar(self):
+        """Reescreve só a linha mais recente de cada entrada."""
+        tmp = self.caminho.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for registro in self._registros.values():
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.caminho)
+
+    def __len__(self) -> int:
+        return len(self._registros)
+
+    def _valido(self, registro: dict | None, pasta_saida: Path) -> bool:
+        return (
+            registro is not None
+            and registro.get("opcoes") == self.opcoes
+            and (pasta_saida / registro["saida"]).exists()
+        )
+
+    def inalterado(self, chave: str, arquivo: Path) -> bool:
+        """Pula sem ler o arquivo: mesmo tamanho, mtime e opções, e a saída ainda existe."""
+        registro = self._registros.get(chave)
+        if not self._valido(registro, self.caminho.parent):
+            return False
+        st = arquivo.stat()
+        return registro["tamanho"] == st.st_size and registro["mtime_ns"] == st.st_mtime_ns
+
+    def mesmo_conteudo(self, chave: str, hash_entrada: str) -> bool:
+        """Arquivo tocado (mtime mudou) mas com o mesmo conteúdo já processado."""
+        registro = self._registros.get(chave)
+        return self._valido(registro, self.caminho.parent) and registro["hash"] == hash_entrada
+
+    def saida(self, chave: str) -> str | None:
+        registro = self._registros.get(chave)
+        return registro["saida"] if registro else None
+
+    def registrar(self, chave: str, assinatura: tuple[int, int], hash_entrada: str, saida: str):
+        """`assinatura` é a (tamanho, mtime_ns) lida junto com os bytes do hash (ler_arquivo)."""
+        tamanho, mtime_ns = assinatura
+        registro = {
+            "entrada": chave,
+            "tamanho": tamanho,
+            "mtime_ns": mtime_ns,
+            "hash": hash_entrada,
+            "opcoes": self.opcoes,
+            "saida": saida,
+            "concluido": round(time.time(), 3),
+        }
+        with self._lock:
+            self._registros[chave] = registro
+            with open(self.caminho, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Operações vetorizadas (NumPy) sobre máscaras alpha.
+"""
+
+import numpy as np
+from PIL import Image
+
+
+def _soma_janela(x: np.ndarray, r: int, eixo: int) -> np.ndarray:
+    """Soma numa janela de 2r+1 ao longo de `eixo` (zeros fora da imagem), só com fatias."""
+    pad = [(0, 0)] * x.ndim
+    pad[eixo] = (r + 1, r)
+    c = np.cumsum(np.pad(x, pad), axis=eixo)
+    n = x.shape[eixo]
+    fim = [slice(None)] * x.ndim
+    inicio = [slice(None)] * x.ndim
+    fim[eixo] = slice(2 * r + 1, 2 * r + 1 + n)
+    inicio[eixo] = slice(0, n)
+    return c[tuple(fim)] - c[tuple(inicio)]
+
+
+def media_caixa(x: np.ndarray, r: int) -> np.ndarray:
+    """
+    Média numa janela (2r+1)x(2r+1) via somas acumuladas; bordas usam só os pixels existentes.
+    Aceita (H, W) ou (H, W, ...) — a média é feita só nos dois primeiros eixos. A precisão
+    é a do dtype de entrada: use float64 em imagens grandes.
+    """
+    h, w = x.shape[:2]
+    soma = _soma_janela(_soma_janela(x, r, 0), r, 1)
+    linhas = np.minimum(np.arange(h) + r, h - 1) - np.maximum(np.arange(h) - r, 0) + 1
+    colunas = np.minimum(np.arange(w) + r, w - 1) - np.maximum(np.arange(w) - r, 0) + 1
+    area = np.outer(linhas, colunas).astype(x.dtype if x.dtype.kind == "f" else np.float64)
+    return soma / area.reshape(area.shape + (1,) * (x.ndim - 2))
+
+
+def _cinza(img: Image.Image) -> np.ndarray:
+    return np.asarray(img.convert("L"), dtype=np.float32) / 255.0
+
+
+def ampliar_alpha(
+    alpha: Image.Image,
+    guia_baixa: Image.Image,
+    guia_alta: Image.Image,
+    raio: int = 4,
+    eps: float = 1e-3,
+) -> Image.Image:
+    """
+    Amplia a máscara (L) para o tamanho de `guia_alta` seguindo as bordas da imagem.
+
+    Filtro guiado rápido (He & Sun, 2015): os coeficientes lineares a, b são
+    calculados na resolução da inferência e só eles são interpolados; na
+    resolução final resta uma multiplicação e uma soma por pixel.
+    """
+    p = np.asarray(alpha, dtype=np.float64) / 255.0
+    i = _cinza(guia_baixa).astype(np.float64)
+
+    media_i = media_caixa(i, raio)
+    media_p = media_caixa(p, raio)
+    cov_ip = media_caixa(i * p, raio) - media_i * media_p
+    var_i = media_caixa(i * i, raio) - media_i * media_i
+
+    a = cov_ip / (var_i + eps)
+    b = media_p - a * media_i
+    media_a = media_caixa(a, raio).astype(np.float32)
+    media_b = media_caixa(b, raio).astype(np.float32)
+
+    tamanho = guia_alta.size
+    a_alta = np.asarray(Image.fromarray(media_a, mode="F").resize(tamanho, Image.Resampling.BILINEAR))
+    b_alta = np.asarray(Image.fromarray(media_b, mode="F").resize(tamanho, Image.Resampling.BILINEAR))
+
+    q = a_alta * _cinza(guia_alta) + b_alta
+    return Image.fromarray((np.clip(q, 0, 1) * 255 + 0.5).astype(np.uint8), mode="L")
+
+
+def incerteza(alpha: np.ndarray, baixo: int = 32, alto: int = 224) -> float:
+    """
+    Quanto da máscara bruta o modelo deixou em dúvida: pixels com alpha entre `baixo` e
+    `alto` sobre os pixels do objeto (alpha > `baixo`). Uma borda limpa fica em poucos
+    por cento; cabelo, vidro ou fundo confuso passam bem disso. Máscara quase vazia ou
+    cobrindo quase a imagem toda, falhas típicas dos modelos leves, vale 1.
+    """
+    objeto = alpha > baixo
+    n_objeto = np.count_nonzero(objeto)
+    if not 0.001 * alpha.size < n_objeto < 0.98 * alpha.size:
+        return 1.0
+    return np.count_nonzero(objeto & (alpha < alto)) / n_objeto
+
+
+def caixa_objeto(alpha: np.ndarray, limiar: int = 8) -> tuple[int, int, int, int] | None:
+    """
+    Caixa (x0, y0, x1, y1), fim exclusivo, dos pixels com alpha > `limiar`; None se não há objeto.
+    O limiar ignora o resíduo quase transparente que o matting deixa longe do objeto.
+    """
+    objeto = alpha > limiar
+    colunas = np.flatnonzero(objeto.any(axis=0))
+    if colunas.size == 0:
+        return None
+    linhas = np.flatnonzero(objeto.any(axis=1))
+    return int(colunas[0]), int(linhas[0]), int(colunas[-1]) + 1, int(linhas[-1]) + 1
+
+
+def expandir_caixa(
+    caixa: tuple[int, int, int, int], margem: int, largura: int, altura: int
+) -> tuple[int, int, int, int]:
+    """Caixa com `margem` px de cada lado, limitada à imagem."""
+    x0, y0, x1, y1 = caixa
+    return max(x0 - margem, 0), max(y0 - margem, 0), min(x1 + margem, largura), min(y1 + margem, altura)
+
+
+def quantizar_alpha(alpha: np.ndarray, niveis: int = 256) -> np.ndarray:
+    """Alpha com só `niveis` valores igualmente espaçados em 0-255 (2 = binário, corte em 50%)."""
+    if niveis >= 256:
+        return alpha
+    passo = 255 / (max(niveis, 2) - 1)
+    return np.round(np.round(alpha / passo) * passo).astype(np.uint8)
+
+
+def rle(alpha: np.ndarray, niveis: int = 256) -> list[int]:
+    """
+    Alpha em carreiras (valor, comprimento), linha a linha: [v0, n0, v1, n1, ...] com os
+    valores em 0-255. Bordas suaves ficam como estão; `niveis` < 256 quantiza o alpha
+    antes (quantizar_alpha), o que junta as carreiras curtas da borda.
+    """
+    plano = quantizar_alpha(alpha, niveis).ravel()
+    if plano.size == 0:
+        return []
+    inicios = np.concatenate(([0], np.flatnonzero(plano[1:] != plano[:-1]) + 1))
+    comprimentos = np.diff(np.append(inicios, plano.size))
+    return np.column_stack((plano[inicios], comprimentos)).ravel().tolist()
+
+
+def contornos(
+    alpha: np.ndarray, tolerancia: float = 1.0, limiar: int = 127, origem: tuple[int, int] = (0, 0)
+) -> list[list[list[float]]]:
+    """
+    Polígonos [[x, y], ...] do contorno em alpha = `limiar` (marching squares do
+    scikit-image), simplificados por Douglas-Peucker com `tolerancia` px e deslocados
+    por `origem`. Contornos externos e de furos vêm juntos: preencha com a regra
+    par-ímpar (even-odd). O polígono é o corte binário: a borda suave se perde.
+    """
+    from skimage.measure import approximate_polygon, find_contours
+
+    # Borda de zeros: objetos encostados na borda também viram polígonos fechados
+    borda = np.pad(alpha, 1)
+    poligonos = []
+    for contorno in find_contours(borda, limiar + 0.5):
+        contorno = approximate_polygon(contorno, tolerancia) if tolerancia > 0 else contorno
+        if len(contorno) < 4:  # fechado: o primeiro ponto se repete no fim
+            continue
+        # (linha, coluna) no centro dos pixels da borda -> (x, y) nas arestas dos pixels:
+        # um objeto que ocupa as colunas 0..19 vai de x = 0 a x = 20, como a caixa
+        xy = contorno[:, ::-1] - 0.5 + origem
+        poligonos.append(np.round(xy, 1).tolist())
+    return poligonos
+
+
+def descrever_mascara(alpha: np.ndarray, representacao: str, tolerancia: float = 1.0, niveis: int = 256) -> dict:
+    """
+    Caixa do objeto e a máscara só dentro dela, em `representacao` "rle" (carreiras do
+    alpha, com `niveis` valores) ou "contornos" (polígonos binários em coordenadas da
+    imagem inteira).
+    """
+    altura, largura = alpha.shape
+    caixa = caixa_objeto(alpha)
+    descricao = {"largura": largura, "altura": altura, "caixa": list(caixa) if caixa else None}
+    if caixa is None:
+        descricao["mascara"] = None
+        return descricao
+
+    x0, y0, x1, y1 = caixa
+    dentro = alpha[y0:y1, x0:x1]
+    if representacao == "rle":
+        descricao["mascara"] = {
+            "formato": "rle",
+            "ordem": "linhas",
+            "niveis": min(niveis, 256),
+            "carreiras": rle(dentro, niveis),
+        }
+    else:
+        poligonos = contornos(dentro, tolerancia, origem=(x0, y0))
+        descricao["mascara"] = {"formato": "contornos", "limiar": 127, "poligonos": poligonos}
+    return descricao
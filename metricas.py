@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Métricas do serviço no formato texto do Prometheus (sem dependências).
+Contadores, histogramas e medidores com rótulos; contadores e medidores também podem
+ser lidos na hora da coleta (filas, cache, memória), sem ninguém precisar atualizá-los.
+"""
+
+import threading
+from pathlib import Path
+from typing import Callable, Iterable
+
+# Limites dos histogramas de tempo, em segundos
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LIMITES_MEGAPIXELS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 12.0, 24.0, 48.0, 100.0)
+LIMITES_BYTES = tuple(2**n * 1024 for n in range(2, 16, 2))  # 4 KB .. 32 MB
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(nomes: tuple[str, ...], valores: tuple, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos: dict) -> tuple:
+        return tuple(str(rotulos.get(n, "")) for n in self.rotulos)
+
+    def _linhas(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def texto(self) -> str:
+        cabecalho = f"# HELP {self.nome} {self.ajuda}\n# TYPE {self.nome} {self.tipo}\n"
+        return cabecalho + "".join(linha + "\n" for linha in self._linhas())
+
+
+class _MetricaSimples(_Metrica):
+    """
+    Um valor por combinação de rótulos. Com `coletar`, os valores são lidos na coleta
+    (a função devolve pares (rótulos, valor)) em vez de guardados aqui.
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        ajuda: str,
+        rotulos: tuple[str, ...] = (),
+        coletar: Callable[[], Iterable[tuple[dict, float]]] | None = None,
+    ):
+        super().__init__(nome, ajuda, rotulos)
+        self.coletar = coletar
+        self._valores: dict[tuple, float] = {}
+
+    def _somar(self, valor: float, rotulos: dict):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def _linhas(self):
+        if self.coletar is not None:
+            itens = [(self._chave(rotulos), valor) for rotulos, valor in self.coletar()]
+        else:
+            with self._lock:
+                itens = sorted(self._valores.items())
+        for chave, valor in itens:
+            yield f"{self.nome}{_rotulos(self.rotulos, chave)} {_numero(valor)}"
+
+
+class Contador(_MetricaSimples):
+    """Valor que só cresce (pedidos, acertos, carregamentos)."""
+
+    tipo = "counter"
+
+    def inc(self, valor: float = 1, **rotulos):
+        self._somar(valor, rotulos)
+
+
+class Medidor(_MetricaSimples):
+    """Valor que sobe e desce (pedidos em andamento, fila, memória)."""
+
+    tipo = "gauge"
+
+    def definir(self, valor: float, **rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def somar(self, valor: float, **rotulos):
+        self._somar(valor, rotulos)
+
+
+class Histograma(_Metrica):
+    """Distribuição em faixas cumulativas (latências, tamanhos), mais soma e contagem."""
+
+    tipo = "histogram"
+
+    def __init__(
+        self,
+        nome: str,
+        ajuda: str,
+        rotulos: tuple[str, ...] = (),
+        limites: tuple[float, ...] = LIMITES_SEGUNDOS,
+    ):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+        # Por rótulos: [contagem em cada faixa (não cumulativa) + acima do último, soma]
+        self._series: dict[tuple, list] = {}
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        i = next((i for i, limite in enumerate(self.limites) if valor <= limite), len(self.limites))
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.limites) + 1), 0.0]
+            serie[0][i] += 1
+            serie[1] += valor
+
+    def _linhas(self):
+        with self._lock:
+            itens = sorted((chave, (list(faixas), soma)) for chave, (faixas, soma) in self._series.items())
+        for chave, (faixas, soma) in itens:
+            acumulado = 0
+            for limite, n in zip(self.limites + (float("inf"),), faixas):
+                acumulado += n
+                le = 'le="' + _numero(limite) + '"'
+                yield f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}"
+            yield f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_numero(soma)}"
+            yield f"{self.nome}_count{_rotulos(self.rotulos, chave)} {acumulado}"
+
+
+class Registro:
+    """Conjunto de métricas exposto num único texto (GET /api/metrics)."""
+
+    TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metricas: list[_Metrica] = []
+
+    def adicionar(self, metrica: _Metrica) -> _Metrica:
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = (), coletar=None) -> Contador:
+        return self.adicionar(Contador(nome, ajuda, rotulos, coletar))
+
+    def medidor(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = (), coletar=None) -> Medidor:
+        return self.adicionar(Medidor(nome, ajuda, rotulos, coletar))
+
+    def histograma(
+        self, nome: str, ajuda: str, rotulos: tuple[str, ...] = (), limites: tuple[float, ...] = LIMITES_SEGUNDOS
+    ) -> Histograma:
+        return self.adicionar(Histograma(nome, ajuda, rotulos, limites))
+
+    def texto(self) -> str:
+        return "".join(m.texto() for m in self._metricas)
+
+
+def memoria_processo() -> dict[str, int]:
+    """RSS atual e pico do processo em bytes (Linux; vazio em outros sistemas)."""
+    memoria = {}
+    try:
+        for linha in Path("/proc/self/status").read_text().splitlines():
+            if linha.startswith("VmRSS:"):
+                memoria["rss"] = int(linha.split()[1]) * 1024
+            elif linha.startswith("VmHWM:"):
+                memoria["pico_rss"] = int(linha.split()[1]) * 1024
+    except OSError:
+        pass
+    return memoria
+
+
+class ResumoEtapas:
+    """Tempo acumulado por etapa de várias imagens e threads (resumo impresso pelo CLI)."""
+
+    def __init__(self):
+        self._etapas: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, tempos: dict[str, float]):
+        with self._lock:
+            for etapa, segundos in tempos.items():
+                self._etapas.setdefault(etapa, []).append(segundos)
+
+    def texto(self) -> str:
+        with self._lock:
+            etapas = {e: list(v) for e, v in self._etapas.items()}
+        total = sum(sum(v) for v in etapas.values()) or 1e-9
+        linhas = []
+        for etapa, valores in sorted(etapas.items(), key=lambda item: -sum(item[1])):
+            ordenados = sorted(valores)
+            p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+            linhas.append(
+                f"  {etapa:>18}  {sum(valores) / len(valores) * 1000:>9.1f} ms/img"
+                f"  p95 {p95 * 1000:>9.1f} ms  {sum(valores) / total:>6.1%}"
+            )
+        return "\n".join(linhas)
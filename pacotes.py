@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Lotes em ZIP: leitura preguiçosa dos arquivos enviados (soltos ou dentro de um .zip)
+e escrita de um ZIP em fluxo, entregue em pedaços conforme cada entrada fica pronta.
+"""
+
+import functools
+import zipfile
+from pathlib import PurePosixPath
+from typing import IO, Iterator
+
+EXTENSOES_IMAGEM = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".heic", ".heif", ".tif", ".tiff", ".avif")
+
+
+class ZipEmFluxo:
+    """
+    ZIP escrito num stream sem seek (o zipfile usa descritores de dados), com as
+    imagens armazenadas sem recompressão. `esvaziar()` devolve o que foi escrito
+    desde a última chamada, para ir mandando ao cliente.
+    """
+
+    def __init__(self):
+        self._pedacos: list[bytes] = []
+        self._zip = zipfile.ZipFile(self, "w", compression=zipfile.ZIP_STORED)
+        self._nomes: set[str] = set()
+
+    # Interface de arquivo usada pelo zipfile
+    def write(self, b) -> int:
+        self._pedacos.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def _nome_livre(self, nome: str) -> str:
+        """Caminho relativo seguro (sem "..") e sem repetição: foto.png, foto_2.png, ..."""
+        partes = [p for p in PurePosixPath(nome.replace("\\", "/")).parts if p not in ("/", ".", "..")]
+        caminho = PurePosixPath(*partes) if partes else PurePosixPath("imagem")
+        nome = str(caminho)
+        candidato, n = nome, 1
+        while candidato in self._nomes:
+            n += 1
+            candidato = str(caminho.with_name(f"{caminho.stem}_{n}{caminho.suffix}"))
+        self._nomes.add(candidato)
+        return candidato
+
+    def adicionar(self, nome: str, dados: bytes) -> str:
+        """Escreve a entrada e devolve o nome usado no ZIP."""
+        nome = self._nome_livre(nome)
+        self._zip.writestr(nome, dados)
+        return nome
+
+    def esvaziar(self) -> bytes:
+        dados = b"".join(self._pedacos)
+        self._pedacos.clear()
+        return dados
+
+    def fechar(self) -> bytes:
+        """Escreve o diretório central e devolve os últimos bytes."""
+        self._zip.close()
+        return self.esvaziar()
+
+
+def _eh_zip(nome: str, arquivo: IO[bytes]) -> bool:
+    if nome.lower().endswith(".zip"):
+        return True
+    posicao = arquivo.tell()
+    assinatura = arquivo.read(4)
+    arquivo.seek(posicao)
+    return assinatura == b"PK\x03\x04"
+
+
+def _tamanho_maximo(nome: str, tamanho: int, max_bytes: int | None):
+    if max_bytes is not None and tamanho > max_bytes:
+        raise ValueError(f"{nome}: {tamanho / 1024 / 1024:.1f} MB acima do limite de {max_bytes / 1024 / 1024:.0f} MB")
+
+
+def _ler(arquivo: IO[bytes], nome: str = "", max_bytes: int | None = None) -> bytes:
+    _tamanho_maximo(nome, arquivo.seek(0, 2), max_bytes)
+    arquivo.seek(0)
+    return arquivo.read()
+
+
+def _ler_do_zip(pacote: zipfile.ZipFile, info: zipfile.ZipInfo, max_bytes: int | None = None) -> bytes:
+    # Tamanho descompactado declarado no ZIP: recusa antes de descompactar (bomba de compressão)
+    _tamanho_maximo(info.filename, info.file_size, max_bytes)
+    return pacote.read(info)
+
+
+def entradas(
+    arquivos: list[tuple[str, IO[bytes]]], max_bytes: int | None = None
+) -> Iterator[tuple[str, functools.partial]]:
+    """
+    (nome, ler) de cada imagem enviada; um .zip é expandido nas imagens que contém.
+    `ler()` só traz os bytes quando chamado, então o lote não fica todo em memória, e
+    levanta ValueError se a imagem passar de `max_bytes`.
+    """
+    for nome, arquivo in arquivos:
+        if not _eh_zip(nome, arquivo):
+            yield nome, functools.partial(_ler, arquivo, nome, max_bytes)
+            continue
+        pacote = zipfile.ZipFile(arquivo)
+        for info in pacote.infolist():
+            caminho = PurePosixPath(info.filename)
+            if info.is_dir() or "__MACOSX" in caminho.parts or caminho.name.startswith("."):
+                continue
+            if caminho.suffix.lower() in EXTENSOES_IMAGEM:
+                yield info.filename, functools.partial(_ler_do_zip, pacote, info, max_bytes)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Pipeline em estágios para processar muitos arquivos.
+Cada estágio tem seu próprio pool de threads e os estágios são ligados por filas
+limitadas: leitura, inferência e gravação de arquivos diferentes se sobrepõem, e
+só poucas imagens ficam em memória ao mesmo tempo.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator
+
+_FIM = object()
+
+
+class Estagio:
+    """Função aplicada a cada item por `workers` threads."""
+
+    def __init__(self, nome: str, fn: Callable, workers: int = 1):
+        self.nome = nome
+        self.fn = fn
+        self.workers = max(1, workers)
+
+
+class Resultado:
+    """Item que saiu do pipeline: `valor` do último estágio ou `erro` (e em qual estágio)."""
+
+    __slots__ = ("item", "valor", "erro", "estagio")
+
+    def __init__(self, item, valor=None, erro: Exception | None = None, estagio: str | None = None):
+        self.item = item
+        self.valor = valor
+        self.erro = erro
+        self.estagio = estagio
+
+
+def executar(itens: Iterable, estagios: list[Estagio], capacidade: int | None = None) -> Iterator[Resultado]:
+    """
+    Passa cada item por todos os estágios e devolve os Resultados na ordem em que terminam.
+
+    `capacidade` limita cada fila entre estágios (padrão: 2x os workers do estágio seguinte).
+    Um erro num estágio não para o pipeline: o item segue direto para a saída com `erro`.
+    """
+    filas = [
+        queue.Queue(maxsize=capacidade or 2 * estagio.workers) for estagio in estagios
+    ] + [queue.Queue(maxsize=capacidade or 2 * estagios[-1].workers)]
+    threads: list[threading.Thread] = []
+    parar = threading.Event()
+
+    def alimentar():
+        try:
+            for item in itens:
+                if parar.is_set():
+                    break
+                filas[0].put(Resultado(item, valor=item))
+        finally:
+            for _ in range(estagios[0].workers):
+                filas[0].put(_FIM)
+
+    def trabalhar(i: int, restantes: list[int], lock: threading.Lock):
+        estagio, entrada, saida = estagios[i], filas[i], filas[i + 1]
+        while True:
+            res = entrada.get()
+            if res is _FIM:
+                break
+            if res.erro is None and not parar.is_set():
+                try:
+                    res.valor = estagio.fn(res.valor)
+                except Exception as e:
+                    res.valor, res.erro, res.estagio = None, e, estagio.nome
+            saida.put(res)
+        # A última thread do estágio avisa o próximo
+        with lock:
+            restantes[0] -= 1
+            ultima = restantes[0] == 0
+        if ultima:
+            proximos = estagios[i + 1].workers if i + 1 < len(estagios) else 1
+            for _ in range(proximos):
+                saida.put(_FIM)
+
+    threads.append(threading.Thread(target=alimentar, name="pipeline-entrada", daemon=True))
+    for i, estagio in enumerate(estagios):
+        restantes, lock = [estagio.workers], threading.Lock()
+        for n in range(estagio.workers):
+            threads.append(
+                threading.Thread(
+                    target=trabalhar, args=(i, restantes, lock), name=f"pipeline-{estagio.nome}-{n}", daemon=True
+                )
+            )
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            res = filas[-1].get()
+            if res is _FIM:
+                break
+            yield res
+    finally:
+        # Interrompido (Ctrl+C ou consumidor parou): esvazia as filas para as threads terminarem
+        parar.set()
+        for fila in filas:
+            try:
+                while True:
+                    fila.get_nowait()
+            except queue.Empty:
+                pass
+
+
+class Progresso:
+    """
+    Vazão (imagens/s) numa janela recente e ETA para o restante.
+
+    Sem `total` (varredura que anda junto com o processamento), quem varre chama
+    `encontrado()` a cada item e `varredura_concluida()` no fim: até lá o ETA conta só
+    o que já foi encontrado (um mínimo, mostrado como "ETA ≥"); depois vira o total.
+    """
+
+    def __init__(self, total: int | None, janela_s: float = 30.0):
+        self.total = total
+        self.janela_s = janela_s
+        self.inicio = time.perf_counter()
+        self.concluidos = 0
+        self.encontrados = 0
+        self._marcas: list[float] = []
+
+    def encontrado(self):
+        self.encontrados += 1
+
+    def varredura_concluida(self):
+        if self.total is None:
+            self.total = self.encontrados
+
+    def avancar(self):
+        agora = time.perf_counter()
+        self.concluidos += 1
+        self._marcas.append(agora)
+        while self._marcas and agora - self._marcas[0] > self.janela_s:
+            self._marcas.pop(0)
+
+    def vazao(self) -> float:
+        """Imagens/s nos últimos `janela_s` segundos (ou desde o início)."""
+        if len(self._marcas) < 2:
+            decorrido = time.perf_counter() - self.inicio
+            return self.concluidos / decorrido if decorrido > 0 else 0.0
+        return (len(self._marcas) - 1) / max(self._marcas[-1] - self._marcas[0], 1e-9)
+
+    def eta_s(self) -> float | None:
+        vazao = self.vazao()
+        total = self.total if self.total is not None else self.encontrados or None
+        if total is None or vazao <= 0:
+            return None
+        return max(total - self.concluidos, 0) / vazao
+
+    def posicao(self) -> str:
+        """"7/120"; com a varredura em andamento, "7/120+" (encontrados até agora)."""
+        if self.total is not None:
+            return f"{self.concluidos}/{self.total}"
+        if self.encontrados:
+            return f"{self.concluidos}/{self.encontrados}+"
+        return str(self.concluidos)
+
+    def texto(self) -> str:
+        eta = self.eta_s()
+        if eta is None:
+            return f"{self.vazao():.2f} img/s"
+        h, resto = divmod(int(eta), 3600)
+        m, s = divmod(resto, 60)
+        rotulo = "ETA" if self.total is not None else "ETA ≥"
+        tempo = f"{h}h{m:02d}m{s:02d}s" if h else f"{m}m{s:02d}s"
+        return f"{self.vazao():.2f} img/s, {rotulo} {tempo}"
+
+
+def configurar_threads_onnx(threads: int | None):
+    """
+    Threads por sessão ONNX. O rembg lê OMP_NUM_THREADS ao criar a sessão, então isto
+    precisa rodar antes do primeiro modelo ser carregado.
+    """
+    if threads:
+        os.environ["OMP_NUM_THREADS"] = str(threads)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Gera variantes quantizadas de um modelo e só aprova as que ficam perto do FP32.
+
+INT8 estático (QDQ, calibrado com fotos reais), INT8 dinâmico (só os pesos) ou FP16.
+A variante é comparada ao modelo FP32 numa pasta de fotos: IoU da máscara binária e
+erro médio absoluto do alpha. Abaixo do limite ela é descartada; aprovada, é gravada
+em REMOVEBG_VARIANTES_DIR e aparece como `modelo` na API, no app e na CLI
+(ex: `u2net-int8`) depois de reiniciar.
+
+Uso:
+    python quantizar.py u2net --calibracao fotos/
+    python quantizar.py isnet-general-use --calibracao fotos/ --tipo dinamico --iou-min 0.97
+    python quantizar.py --listar
+"""
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+from rembg.sessions import sessions
+
+import core
+from ingestao import abrir_imagem
+from pacotes import EXTENSOES_IMAGEM
+from variantes import descricao, pasta_variantes, variantes
+
+# Tipo -> sufixo do nome da variante
+SUFIXOS = {"estatico": "int8", "dinamico": "int8d", "fp16": "fp16"}
+
+
+def caminho_modelo(modelo: str) -> Path:
+    """Arquivo .onnx FP32 do modelo (baixado pelo rembg se ainda não estiver no disco)."""
+    return Path(sessions[modelo].download_models())
+
+
+def imagens_calibracao(pasta: Path, maximo: int, max_size: int = core.MAX_SIZE) -> list[Image.Image]:
+    arquivos = sorted(f for f in pasta.rglob("*") if f.is_file() and f.suffix.lower() in EXTENSOES_IMAGEM)
+    return [abrir_imagem(f, max_size) for f in arquivos[:maximo]]
+
+
+def _tensores(imgs: list[Image.Image], modelo: str) -> list[np.ndarray]:
+    mean, std, size, _ = core.PARAMS_MODELO[modelo]
+    return [core._normalizar(img, mean, std, size)[None] for img in imgs]
+
+
+def _sessao(caminho: Path) -> ort.InferenceSession:
+    return ort.InferenceSession(str(caminho), providers=["CPUExecutionProvider"])
+
+
+def gerar(modelo: str, tipo: str, destino: Path, calibracao: list[np.ndarray]):
+    """Escreve a variante `tipo` do modelo em `destino`."""
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    entrada = caminho_modelo(modelo)
+    with tempfile.TemporaryDirectory() as tmp:
+        if tipo == "fp16":
+            import onnx
+            from onnxruntime.transformers.float16 import convert_float_to_float16
+
+            # Entradas e saídas continuam float32: o resto do pipeline não muda
+            onnx.save(convert_float_to_float16(onnx.load(str(entrada)), keep_io_types=True), str(destino))
+            return
+
+        # Inferência de formas e fusões antes de quantizar (recomendado pelo ONNX Runtime)
+        preparado = Path(tmp) / "preparado.onnx"
+        try:
+            quant_pre_process(str(entrada), str(preparado))
+        except Exception:
+            preparado = entrada
+
+        if tipo == "dinamico":
+            # ConvInteger do CPU só aceita pesos uint8
+            quantize_dynamic(preparado, destino, weight_type=QuantType.QUInt8)
+            return
+
+        nome_entrada = _sessao(entrada).get_inputs()[0].name
+
+        class Leitor(CalibrationDataReader):
+            def __init__(self):
+                self._itens = iter(calibracao)
+
+            def get_next(self):
+                tensor = next(self._itens, None)
+                return None if tensor is None else {nome_entrada: tensor}
+
+        quantize_static(
+            preparado,
+            destino,
+            Leitor(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+
+
+def avaliar(modelo: str, variante: Path, imgs: list[Image.Image]) -> dict:
+    """IoU da máscara (alpha > 0.5) e erro médio do alpha da variante contra o FP32, e latência dos dois."""
+    sigmoid = core.PARAMS_MODELO[modelo][3]
+    tensores = _tensores(imgs, modelo)
+    referencia, candidata = _sessao(caminho_modelo(modelo)), _sessao(variante)
+    nome = referencia.get_inputs()[0].name
+
+    def rodar(sessao: ort.InferenceSession) -> tuple[list[np.ndarray], float]:
+        sessao.run(None, {nome: tensores[0]})  # aquecimento
+        alphas, tempos = [], []
+        for img, tensor in zip(imgs, tensores):
+            t0 = time.perf_counter()
+            pred = sessao.run(None, {nome: tensor})[0][0, 0]
+            tempos.append(time.perf_counter() - t0)
+            alphas.append(np.asarray(core._mascara_de_pred(pred, sigmoid, img.size), dtype=np.float32) / 255)
+        return alphas, float(np.median(tempos)) * 1000
+
+    alphas_fp32, ms_fp32 = rodar(referencia)
+    alphas, ms = rodar(candidata)
+
+    ious, maes = [], []
+    for a, b in zip(alphas_fp32, alphas):
+        frente_a, frente_b = a > 0.5, b > 0.5
+        uniao = np.logical_or(frente_a, frente_b).sum()
+        ious.append(np.logical_and(frente_a, frente_b).sum() / uniao if uniao else 1.0)
+        maes.append(float(np.abs(a - b).mean()))
+    return {
+        "iou": round(float(np.mean(ious)), 4),
+        "iou_pior": round(float(np.min(ious)), 4),
+        "mae": round(float(np.mean(maes)), 4),
+        "mae_pior": round(float(np.max(maes)), 4),
+        "ms_fp32": round(ms_fp32, 1),
+        "ms": round(ms, 1),
+    }
+
+
+def quantizar(
+    modelo: str,
+    tipo: str,
+    pasta_calibracao: Path,
+    iou_min: float = 0.95,
+    mae_max: float = 0.02,
+    max_imagens: int = 32,
+    nome: str | None = None,
+) -> tuple[bool, dict]:
+    """
+    Gera, avalia e (se aprovada) instala a variante. Devolve (aprovada, relatório).
+    Com 2 ou mais fotos, metade calibra e a outra metade avalia, para a nota não vir
+    das mesmas imagens usadas na calibração.
+    """
+    if modelo not in core.PARAMS_MODELO or modelo not in sessions:
+        raise ValueError(f"Modelo sem parâmetros de pré-processamento conhecidos: {modelo}")
+    imgs = imagens_calibracao(pasta_calibracao, max_imagens)
+    if not imgs:
+        raise ValueError(f"Nenhuma imagem em {pasta_calibracao}")
+    calibracao, avaliacao = (imgs[::2], imgs[1::2]) if len(imgs) >= 2 else (imgs, imgs)
+
+    nome = nome or f"{modelo}-{SUFIXOS[tipo]}"
+    pasta = pasta_variantes()
+    pasta.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=pasta) as tmp:
+        candidata = Path(tmp) / f"{nome}.onnx"
+        gerar(modelo, tipo, candidata, _tensores(calibracao, modelo) if tipo == "estatico" else [])
+        relatorio = {
+            "base": modelo,
+            "tipo": SUFIXOS[tipo],
+            "metodo": tipo,
+            **avaliar(modelo, candidata, avaliacao),
+            "imagens_calibracao": len(calibracao) if tipo == "estatico" else 0,
+            "imagens_avaliacao": len(avaliacao),
+            "mb": round(candidata.stat().st_size / 1e6, 1),
+            "mb_fp32": round(caminho_modelo(modelo).stat().st_size / 1e6, 1),
+            "criado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        aprovada = relatorio["iou"] >= iou_min and relatorio["mae"] <= mae_max
+        if aprovada:
+            shutil.move(str(candidata), pasta / f"{nome}.onnx")
+            (pasta / f"{nome}.json").write_text(json.dumps(relatorio, indent=2, ensure_ascii=False) + "\n")
+    return aprovada, {"nome": nome, **relatorio}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Variantes INT8/FP16 dos modelos, com verificação de qualidade")
+    parser.add_argument("modelo", nargs="?", choices=[m for m in core.PARAMS_MODELO if m in sessions], help="Modelo base (FP32)")
+    parser.add_argument("--calibracao", type=Path, help="Pasta com fotos representativas (calibração e avaliação)")
+    parser.add_argument(
+        "--tipo", choices=list(SUFIXOS), default="estatico",
+        help="estatico = INT8 calibrado (padrão), dinamico = INT8 só nos pesos, fp16 = meia precisão",
+    )
+    parser.add_argument("--iou-min", type=float, default=0.95, help="IoU mínimo da máscara contra o FP32")
+    parser.add_argument("--mae-max", type=float, default=0.02, help="Erro médio máximo do alpha (0-1)")
+    parser.add_argument("--max-imagens", type=int, default=32)
+    parser.add_argument("--nome", help="Nome da variante (padrão: <modelo>-int8, -int8d ou -fp16)")
+    parser.add_argument("--listar", action="store_true", help="Lista as variantes aprovadas e sai")
+    args = parser.parse_args()
+
+    if args.listar:
+        encontradas = variantes()
+        print(f"Variantes em {pasta_variantes()}:\n" if encontradas else f"Nenhuma variante em {pasta_variantes()}")
+        for nome, info in encontradas.items():
+            print(f"  {nome:28} {descricao(nome, info)}, {info['ms']} ms (FP32: {info['ms_fp32']} ms), {info['mb']} MB")
+        return 0
+    if not args.modelo or not args.calibracao:
+        parser.error("informe o modelo e --calibracao (ou use --listar)")
+
+    aprovada, relatorio = quantizar(
+        args.modelo, args.tipo, args.calibracao, args.iou_min, args.mae_max, args.max_imagens, args.nome
+    )
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    if not aprovada:
+        print(
+            f"\nRecusada: IoU {relatorio['iou']} (mínimo {args.iou_min}), erro do alpha {relatorio['mae']}"
+            f" (máximo {args.mae_max}).",
+            file=sys.stderr,
+        )
+        return 1
+    print(f"\n✓ Variante '{relatorio['nome']}' instalada em {pasta_variantes()} (reinicie a API/app para usar)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,17 +6,22 @@ Suporta: PNG, JPG, WEBP, HEIC (fotos do iPhone), etc.
 """
 
 import argparse
+import os
+import time
 from pathlib import Path
 
 from PIL import Image
 
-# Suporte a HEIC/HEIF (fotos do iPhone)
-try:
-    from pillow_heif import register_heif_opener
-    register_heif_opener()
-except ImportError:
-    pass  # pillow-heif não instalado, HEIC não suportado
-from rembg import remove, new_session
+import core
+import metricas
+import pipeline
+import sequencia
+import varredura
+import vigia
+from codificadores import CODIFICADORES
+from ingestao import abrir_imagem, redimensionar, registrar_heif
+from manifesto import Manifesto, hash_arquivo, ler_arquivo
+from variantes import descricao, variantes
 
 
 # Modelos disponíveis (do mais leve ao de maior qualidade)
@@ -28,6 +33,53 @@ MODELOS = {
     "bria-rmbg": "State-of-the-art - máxima qualidade",
     "u2net_human_seg": "Otimizado para fotos de pessoas",
 }
+# Variantes INT8/FP16 aprovadas por quantizar.py
+MODELOS.update({nome: descricao(nome, info) for nome, info in variantes().items()})
+
+
+def _remover_imagem(
+    img: Image.Image,
+    modelo: str,
+    alpha_matting: bool,
+    post_process: bool,
+    bgcolor: tuple[int, int, int, int] | None,
+    session,
+    tamanho_inferencia: int | None,
+) -> Image.Image:
+    """Remoção de fundo de uma imagem já carregada (estágio de inferência do lote)."""
+    if tamanho_inferencia:
+        # Inferência reduzida + máscara ampliada por filtro guiado sobre os pixels originais
+        return core.remover_fundo(
+            img,
+            modelo=modelo,
+            alpha_matting=alpha_matting,
+            bgcolor=bgcolor,
+            max_size=tamanho_inferencia,
+            tamanho_saida=0,
+        )
+
+    # Resolução original: mesma máscara e recorte da API (matting só na faixa do trimap)
+    if session is None:
+        mask = core.prever_mascara(img, modelo)
+    else:
+        with core.medir_etapa("inferencia"):
+            mask = session.predict(img)[0]
+    output = core.aplicar_mascara(img, mask, alpha_matting, post_process)
+    return output if bgcolor is None else core.etapa_composicao(output, bgcolor)
+
+
+def _medindo(fn, resumo: metricas.ResumoEtapas | None):
+    """`fn` com os tempos de cada etapa (core.medir_etapa) somados em `resumo`."""
+    if resumo is None:
+        return fn
+
+    def medido(*args, **kwargs):
+        with core.medindo_etapas() as tempos:
+            resultado = fn(*args, **kwargs)
+        resumo.registrar(tempos)
+        return resultado
+
+    return medido
 
 
 def remover_fundo(
@@ -38,6 +90,8 @@ def remover_fundo(
     post_process: bool = True,
     bgcolor: tuple[int, int, int, int] | None = None,
     session=None,
+    tamanho_inferencia: int | None = None,
+    formato: str = "png",
 ) -> Image.Image:
     """
     Remove o fundo de uma imagem com alta qualidade.
@@ -49,7 +103,10 @@ def remover_fundo(
         alpha_matting: Ativa suavização de bordas (recomendado para alta qualidade)
         post_process: Aplica pós-processamento na máscara
         bgcolor: Cor de fundo (R, G, B, A) - None = transparente
-        session: Sessão reutilizável (para processamento em lote)
+        session: Sessão rembg própria (opcional; sem ela usa as sessões e lotes do core)
+        tamanho_inferencia: Se definido, o modelo (e o alpha matting) roda com o lado maior
+            nesse tamanho e a máscara é ampliada para a resolução original (muito mais rápido)
+        formato: Formato do arquivo salvo (png, webp, webp-lossy, avif, mascara, rle, contornos)
 
     Returns:
         Imagem PIL com fundo removido
@@ -59,28 +116,18 @@ def remover_fundo(
         raise FileNotFoundError(f"Arquivo não encontrado: {entrada}")
 
     # Carregar imagem
-    img = Image.open(entrada).convert("RGB")
-
-    # Criar sessão se não fornecida
-    if session is None:
-        session = new_session(modelo)
+    with core.medir_etapa("decodificacao"):
+        img = abrir_imagem(entrada)  # RGB e já girada pela orientação EXIF
+    if CODIFICADORES[formato].so_mascara:
+        bgcolor = None  # só a máscara: o alpha precisa do recorte transparente
 
-    # Remover fundo com parâmetros de alta qualidade
-    output = remove(
-        img,
-        session=session,
-        alpha_matting=alpha_matting,
-        alpha_matting_foreground_threshold=270,
-        alpha_matting_background_threshold=20,
-        alpha_matting_erode_size=11,
-        post_process_mask=post_process,
-        bgcolor=bgcolor,
-    )
+    output = _remover_imagem(img, modelo, alpha_matting, post_process, bgcolor, session, tamanho_inferencia)
 
     if saida:
         saida = Path(saida)
         saida.parent.mkdir(parents=True, exist_ok=True)
-        output.save(saida, "PNG", compress_level=6)  # PNG com compressão balanceada
+        with core.medir_etapa("codificacao"):
+            CODIFICADORES[formato].salvar(output, saida)
 
     return output
 
@@ -90,39 +137,254 @@ def processar_pasta(
     pasta_saida: Path,
     modelo: str = "birefnet-general",
     extensoes: tuple[str, ...] = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".heic", ".heif"),
+    tamanho_inferencia: int | None = None,
+    formato: str = "png",
+    workers: int | None = None,
+    jobs: int = 1,
+    alpha_matting: bool = True,
+    post_process: bool = True,
+    refazer: bool = False,
+    vigiar: bool = False,
+    recursivo: bool = True,
+    incluir: tuple[str, ...] = (),
+    excluir: tuple[str, ...] = (),
+    shards: int = 0,
+    tempos: bool = False,
 ) -> int:
-    """Processa todas as imagens de uma pasta."""
+    """
+    Processa todas as imagens de uma pasta em pipeline: leitura (`workers` threads),
+    inferência (`jobs` threads, agrupadas em lotes pelo core) e codificação + gravação (`workers`
+    threads), ligadas por filas limitadas.
+
+    O manifesto na pasta de saída registra cada arquivo concluído: numa nova execução,
+    arquivos sem mudança (mesmo tamanho/mtime ou mesmo conteúdo, com o mesmo modelo e
+    opções) são pulados — execuções interrompidas continuam de onde pararam. `refazer`
+    ignora o manifesto. Com `vigiar`, depois da passada inicial a pasta continua sendo
+    observada e arquivos novos ou modificados são processados assim que chegam.
+
+    Subpastas são percorridas sob demanda (`recursivo`), filtradas pelos globs `incluir`
+    e `excluir`; a saída espelha as pastas da entrada ou, com `shards`, é distribuída em
+    `shards` subpastas numeradas. Com `tempos`, imprime o tempo médio de cada etapa.
+    """
     pasta_entrada = Path(pasta_entrada)
     pasta_saida = Path(pasta_saida)
     pasta_saida.mkdir(parents=True, exist_ok=True)
 
-    arquivos = [
-        f for f in pasta_entrada.iterdir()
-        if f.suffix.lower() in extensoes and f.is_file()
+    # Saída dentro da pasta de entrada não vira entrada de novo
+    filtro = varredura.Filtro(pasta_entrada, extensoes, incluir, excluir, ignorar=(pasta_saida,))
+
+    workers = workers or min(8, os.cpu_count() or 1)
+    codificador = CODIFICADORES[formato]
+    registro = Manifesto(
+        pasta_saida,
+        {
+            "modelo": modelo,
+            "alpha_matting": alpha_matting,
+            "post_process": post_process,
+            "tamanho_inferencia": tamanho_inferencia,
+            "formato": formato,
+        },
+    )
+
+    def chave(arquivo: Path) -> str:
+        return filtro.relativo(arquivo)
+
+    def carregar(arquivo: Path):
+        with core.medir_etapa("leitura"):
+            dados, assinatura = ler_arquivo(arquivo)
+            entrada = (hash_arquivo(dados), assinatura)
+        if not refazer and registro.mesmo_conteudo(chave(arquivo), entrada[0]):
+            return arquivo, entrada, None  # só o mtime mudou
+        with core.medir_etapa("decodificacao"):
+            return arquivo, entrada, abrir_imagem(dados)
+
+    def inferir(item):
+        arquivo, entrada, img = item
+        if img is None:
+            return item
+        output = _remover_imagem(img, modelo, alpha_matting, post_process, None, None, tamanho_inferencia)
+        return arquivo, entrada, output
+
+    def gravar(item):
+        arquivo, entrada, output = item
+        if output is None:
+            return entrada, None
+        saida = varredura.caminho_saida(
+            chave(arquivo), codificador.nome_arquivo(f"{arquivo.stem}_sem_fundo"), shards
+        ).as_posix()
+        destino = pasta_saida / saida
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        with core.medir_etapa("codificacao"):
+            codificador.salvar(output, destino)
+        return entrada, saida
+
+    # Cada estágio roda em threads próprias: as etapas são medidas em cada uma e somadas aqui
+    resumo = metricas.ResumoEtapas() if tempos else None
+    estagios = [
+        pipeline.Estagio("leitura", _medindo(carregar, resumo), workers),
+        pipeline.Estagio("inferencia", _medindo(inferir, resumo), jobs),
+        pipeline.Estagio("gravacao", _medindo(gravar, resumo), workers),
     ]
 
-    if not arquivos:
-        print(f"Nenhuma imagem encontrada em {pasta_entrada}")
-        return 0
+    def processar(arquivos, total: int | None = None) -> tuple[int, int]:
+        """Roda o pipeline sobre `arquivos` (lista ou gerador); devolve (vistos, processados)."""
+        vistos = pulados = 0
 
-    print(f"Processando {len(arquivos)} imagem(ns) com modelo '{modelo}'...")
-    session = new_session(modelo)
+        def pendentes():
+            # Roda na thread de entrada do pipeline: a varredura acontece junto com o processamento
+            nonlocal vistos, pulados
+            for f in arquivos:
+                vistos += 1
+                if refazer or not registro.inalterado(chave(f), f):
+                    progresso.encontrado()
+                    yield f
+                else:
+                    pulados += 1
+            progresso.varredura_concluida()
 
-    processados = 0
-    for i, arquivo in enumerate(arquivos, 1):
-        saida = pasta_saida / f"{arquivo.stem}_sem_fundo.png"
-        try:
-            remover_fundo(
-                arquivo,
-                saida,
-                modelo=modelo,
-                session=session,
-            )
+        progresso = pipeline.Progresso(total)
+        processados = 0
+        for res in pipeline.executar(pendentes(), estagios):
+            progresso.avancar()
+            posicao = progresso.posicao()
+            if res.erro is not None:
+                print(f"  [ERRO] {chave(res.item)} ({res.estagio}): {res.erro}")
+                continue
+            (hash_entrada, assinatura), saida = res.valor
+            if saida is None:
+                # Mesmo conteúdo: atualiza tamanho/mtime para a próxima execução pular sem ler
+                registro.registrar(chave(res.item), assinatura, hash_entrada, registro.saida(chave(res.item)))
+                print(f"  [{posicao}] {chave(res.item)} sem mudanças no conteúdo")
+                continue
+            registro.registrar(chave(res.item), assinatura, hash_entrada, saida)
             processados += 1
-            print(f"  [{i}/{len(arquivos)}] {arquivo.name} -> {saida.name}")
-        except Exception as e:
-            print(f"  [ERRO] {arquivo.name}: {e}")
+            print(f"  [{posicao}] {chave(res.item)} -> {saida}  ({progresso.texto()})")
+
+        if pulados:
+            print(f"  {pulados} imagem(ns) sem mudanças desde a última execução (puladas)")
+        if progresso.concluidos:
+            decorrido = time.perf_counter() - progresso.inicio
+            print(f"  {processados} imagem(ns) em {decorrido:.1f}s ({processados / max(decorrido, 1e-9):.2f} img/s)")
+        if resumo is not None and processados:
+            print("  Tempo por etapa (média por imagem, p95, fração do total):")
+            print(resumo.texto())
+        return vistos, processados
+
+    print(
+        f"Processando {pasta_entrada} com modelo '{modelo}' "
+        f"({workers} leitura/gravação, {jobs} inferência)..."
+    )
+    if not vigiar:
+        vistos, total = processar(varredura.varrer(filtro, recursivo))
+        if not vistos:
+            print(f"Nenhuma imagem encontrada em {pasta_entrada}")
+        return total
+
+    total = 0
+
+    def passada_inicial():
+        # Roda com a vigia já ligada: o que chegar durante a passada vira evento depois
+        # (e o manifesto pula o que a passada já processou)
+        nonlocal total
+        total = processar(varredura.varrer(filtro, recursivo))[1]
+        modo = "eventos do sistema" if vigia.Observer is not None else "varredura periódica"
+        print(f"\nVigiando {pasta_entrada} ({modo}). Ctrl+C para sair.")
+
+    def ao_chegar(novos: list[Path]):
+        nonlocal total
+        total += processar(novos, len(novos))[1]
+
+    try:
+        vigia.vigiar(
+            pasta_entrada,
+            filtro.arquivo,
+            ao_chegar,
+            recursivo=recursivo,
+            listar=lambda: varredura.varrer(filtro, recursivo),
+            inicio=passada_inicial,
+        )
+    except KeyboardInterrupt:
+        pass
+    return total
+
+
+def processar_sequencia(
+    fonte: Path,
+    pasta_saida: Path,
+    modelo: str = "birefnet-general",
+    tamanho_inferencia: int | None = None,
+    formato: str = "png",
+    workers: int | None = None,
+    alpha_matting: bool = True,
+    limiar: float = 0.02,
+    intervalo_chave: int = 30,
+    tempos: bool = False,
+) -> int:
+    """
+    Quadros de uma sequência (pasta em ordem natural, vídeo ou GIF) com reaproveitamento
+    da máscara entre quadros parecidos (sequencia.Sequenciador). A máscara de cada quadro
+    depende da anterior, então esse estágio roda numa thread só; recorte/matting e gravação
+    rodam em `workers` threads. O modelo roda com o lado maior em `tamanho_inferencia`
+    (padrão: core.MAX_SIZE) e a máscara é ampliada para a resolução do quadro.
+    """
+    pasta_saida = Path(pasta_saida)
+    pasta_saida.mkdir(parents=True, exist_ok=True)
+    workers = workers or min(8, os.cpu_count() or 1)
+    max_size = tamanho_inferencia or core.MAX_SIZE
+    codificador = CODIFICADORES[formato]
+    sequenciador = sequencia.Sequenciador(
+        lambda img: core.prever_mascara(img, modelo), limiar=limiar, intervalo_chave=intervalo_chave
+    )
+
+    def mascarar(item):
+        nome, quadro = item
+        inferencia = redimensionar(quadro, max_size)
+        mask, como = sequenciador.mascara(inferencia)
+        return nome, quadro, inferencia, mask, como
 
+    def recortar(item):
+        nome, quadro, inferencia, mask, como = item
+        recorte = core.aplicar_mascara(inferencia, mask, alpha_matting)
+        if quadro.width > inferencia.width:
+            recorte = core.etapa_saida(recorte, inferencia, quadro)
+        return nome, recorte, como
+
+    def gravar(item):
+        nome, recorte, como = item
+        destino = pasta_saida / codificador.nome_arquivo(f"{nome}_sem_fundo")
+        with core.medir_etapa("codificacao"):
+            codificador.salvar(recorte, destino)
+        return destino.name, como
+
+    resumo = metricas.ResumoEtapas() if tempos else None
+    estagios = [
+        pipeline.Estagio("mascara", _medindo(mascarar, resumo), 1),
+        pipeline.Estagio("recorte", _medindo(recortar, resumo), workers),
+        pipeline.Estagio("gravacao", _medindo(gravar, resumo), workers),
+    ]
+
+    print(f"Sequência {fonte} com modelo '{modelo}' (limiar {limiar}, quadro-chave a cada {intervalo_chave})...")
+    progresso = pipeline.Progresso(sequencia.contar_quadros(fonte))
+    processados = 0
+    for res in pipeline.executar(sequencia.quadros(fonte), estagios):
+        progresso.avancar()
+        if res.erro is not None:
+            print(f"  [ERRO] {res.item[0]} ({res.estagio}): {res.erro}")
+            continue
+        processados += 1
+        saida, como = res.valor
+        print(f"  [{progresso.concluidos}] {saida} ({como}, {progresso.texto()})")
+
+    stats = sequenciador.estatisticas()
+    if stats["quadros"]:
+        print(
+            f"  {stats['fracao_sem_inferencia']:.0%} dos quadros sem inferência"
+            f" ({stats['reaproveitada']} reaproveitados, {stats['deslocada']} deslocados);"
+            f" {stats['regiao']} só na região alterada, {stats['chave']} quadros-chave"
+        )
+    if resumo is not None and processados:
+        print("  Tempo por etapa (média por quadro, p95, fração do total):")
+        print(resumo.texto())
     return processados
 
 
@@ -155,6 +417,101 @@ def main():
         action="store_true",
         help="Desativa pós-processamento da máscara",
     )
+    parser.add_argument(
+        "--tamanho-inferencia",
+        type=int,
+        metavar="PX",
+        help="Roda o modelo com o lado maior em PX e amplia a máscara para a resolução original (rápido)",
+    )
+    parser.add_argument(
+        "-f", "--formato",
+        choices=list(CODIFICADORES),
+        default="png",
+        help=(
+            "Formato de saída (mascara = só o alpha, PNG de um canal;"
+            " rle/contornos = caixa do objeto + máscara em JSON). Padrão: png"
+        ),
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        metavar="N",
+        help="Pasta: threads de leitura e de gravação (padrão: núcleos, até 8)",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Pasta: inferências simultâneas (padrão: 1)",
+    )
+    parser.add_argument(
+        "--threads-onnx",
+        type=int,
+        metavar="N",
+        help="Threads de cada inferência ONNX (padrão: todos os núcleos). Ex: 32 núcleos = -j 4 --threads-onnx 8",
+    )
+    parser.add_argument(
+        "--refazer",
+        action="store_true",
+        help="Pasta: reprocessa tudo, ignorando o manifesto da execução anterior",
+    )
+    parser.add_argument(
+        "--watch", "--vigiar",
+        dest="vigiar",
+        action="store_true",
+        help="Pasta: depois de processar, continua observando e processa arquivos novos ou modificados",
+    )
+    parser.add_argument(
+        "--sem-subpastas",
+        action="store_true",
+        help="Pasta: só os arquivos do primeiro nível (padrão: percorre subpastas)",
+    )
+    parser.add_argument(
+        "--incluir",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Pasta: só arquivos que casam com o glob (caminho relativo ou nome). Pode repetir",
+    )
+    parser.add_argument(
+        "--excluir",
+        action="append",
+        default=[],
+        metavar="GLOB",
+        help="Pasta: ignora arquivos/pastas que casam com o glob, ex: --excluir 'miniaturas'. Pode repetir",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Pasta: distribui a saída em N subpastas (padrão: espelha as pastas da entrada)",
+    )
+    parser.add_argument(
+        "--sequencia",
+        action="store_true",
+        help="Quadros de vídeo/GIF ou pasta de frames em ordem: reaproveita a máscara entre quadros parecidos",
+    )
+    parser.add_argument(
+        "--limiar-mudanca",
+        type=float,
+        default=0.02,
+        metavar="X",
+        help="Sequência: diferença média (0-1) abaixo da qual a máscara anterior é reaproveitada (padrão: 0.02)",
+    )
+    parser.add_argument(
+        "--intervalo-chave",
+        type=int,
+        default=30,
+        metavar="N",
+        help="Sequência: inferência completa pelo menos a cada N quadros (padrão: 30)",
+    )
+    parser.add_argument(
+        "--tempos",
+        action="store_true",
+        help="Mostra o tempo de cada etapa (decodificação, inferência, matting, codificação...)",
+    )
     parser.add_argument(
         "--listar-modelos",
         action="store_true",
@@ -172,24 +529,57 @@ def main():
     if not args.entrada:
         parser.error("entrada é obrigatório (ou use --listar-modelos)")
 
+    pipeline.configurar_threads_onnx(args.threads_onnx)
+    # Suporte a HEIC/HEIF (fotos do iPhone), se o pillow-heif estiver instalado
+    registrar_heif()
+
     entrada = Path(args.entrada)
     if not entrada.exists():
         print(f"Erro: '{entrada}' não encontrado.")
         return 1
 
-    if entrada.is_file():
+    if args.sequencia:
+        if not sequencia.eh_sequencia(entrada):
+            print(f"Erro: '{entrada}' não é pasta, vídeo nem imagem animada.")
+            return 1
+        padrao = str(entrada) + "_output" if entrada.is_dir() else entrada.parent / f"{entrada.stem}_quadros"
+        saida = Path(args.saida or padrao)
+        try:
+            n = processar_sequencia(
+                entrada,
+                saida,
+                modelo=args.modelo,
+                tamanho_inferencia=args.tamanho_inferencia,
+                formato=args.formato,
+                workers=args.workers,
+                alpha_matting=not args.sem_alpha_matting,
+                limiar=args.limiar_mudanca,
+                intervalo_chave=args.intervalo_chave,
+                tempos=args.tempos,
+            )
+        except RuntimeError as e:
+            print(f"Erro: {e}")
+            return 1
+        print(f"\n✓ {n} quadro(s) processado(s) em {saida}")
+    elif entrada.is_file():
         # Processar arquivo único
-        saida = args.saida or entrada.parent / f"{entrada.stem}_sem_fundo.png"
+        saida = args.saida or entrada.parent / CODIFICADORES[args.formato].nome_arquivo(f"{entrada.stem}_sem_fundo")
         saida = Path(saida)
+        resumo = metricas.ResumoEtapas() if args.tempos else None
         try:
-            remover_fundo(
+            _medindo(remover_fundo, resumo)(
                 entrada,
                 saida,
                 modelo=args.modelo,
                 alpha_matting=not args.sem_alpha_matting,
                 post_process=not args.sem_post_process,
+                tamanho_inferencia=args.tamanho_inferencia,
+                formato=args.formato,
             )
             print(f"✓ Salvo em: {saida}")
+            if resumo is not None:
+                print("Tempo por etapa (média, p95, fração do total):")
+                print(resumo.texto())
         except Exception as e:
             print(f"Erro: {e}")
             return 1
@@ -200,6 +590,19 @@ def main():
             entrada,
             saida,
             modelo=args.modelo,
+            tamanho_inferencia=args.tamanho_inferencia,
+            formato=args.formato,
+            workers=args.workers,
+            jobs=args.jobs,
+            alpha_matting=not args.sem_alpha_matting,
+            post_process=not args.sem_post_process,
+            refazer=args.refazer,
+            vigiar=args.vigiar,
+            recursivo=not args.sem_subpastas,
+            incluir=tuple(args.incluir),
+            excluir=tuple(args.excluir),
+            shards=args.shards,
+            tempos=args.tempos,
         )
         print(f"\n✓ {n} imagem(ns) processada(s) em {saida}")
 
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Sequências de quadros (vídeo, giro de produto, pasta de frames).
+Quadros seguidos quase não mudam: a máscara do quadro anterior é reaproveitada
+(deslocada, se a câmera andou) e o modelo só roda em quadros-chave, quando a cena
+muda ou, se a mudança é localizada, só na região que mudou.
+"""
+
+import re
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from ingestao import abrir_imagem
+from pacotes import EXTENSOES_IMAGEM
+
+
+EXTENSOES_VIDEO = (".mp4", ".mov", ".avi", ".mkv", ".webm", ".m4v")
+
+# Lado maior da miniatura usada para comparar quadros
+LADO_MINIATURA = 96
+
+
+def miniatura(img: Image.Image) -> np.ndarray:
+    """Tons de cinza reduzidos (float32, 0-1): comparar quadros custa quase nada."""
+    w, h = img.size
+    escala = LADO_MINIATURA / max(w, h)
+    tamanho = (max(1, round(w * escala)), max(1, round(h * escala)))
+    return np.asarray(img.resize(tamanho, Image.Resampling.BOX).convert("L"), dtype=np.float32) / 255
+
+
+def deslocamento(anterior: np.ndarray, atual: np.ndarray, maximo: int) -> tuple[int, int]:
+    """(dx, dy) inteiro que leva `anterior` até `atual`, por correlação de fase; (0, 0) se passar de `maximo`."""
+    fa = np.fft.rfft2(anterior - anterior.mean())
+    fb = np.fft.rfft2(atual - atual.mean())
+    cruzado = fb * np.conj(fa)
+    cruzado /= np.abs(cruzado) + 1e-9
+    correlacao = np.fft.irfft2(cruzado, s=anterior.shape)
+    dy, dx = np.unravel_index(np.argmax(correlacao), correlacao.shape)
+    h, w = anterior.shape
+    dy = dy - h if dy > h // 2 else dy
+    dx = dx - w if dx > w // 2 else dx
+    if abs(dx) > maximo or abs(dy) > maximo:
+        return 0, 0
+    return int(dx), int(dy)
+
+
+def deslocar(arr: np.ndarray, dx: int, dy: int, fundo=0) -> np.ndarray:
+    """Cópia de `arr` movida (dx, dy); a faixa descoberta recebe `fundo`."""
+    if dx == 0 and dy == 0:
+        return arr
+    h, w = arr.shape[:2]
+    saida = np.full_like(arr, fundo)
+    if abs(dx) >= w or abs(dy) >= h:
+        return saida
+    saida[max(dy, 0) : h + min(dy, 0), max(dx, 0) : w + min(dx, 0)] = arr[
+        max(-dy, 0) : h + min(-dy, 0), max(-dx, 0) : w + min(-dx, 0)
+    ]
+    return saida
+
+
+def _diferenca_blocos(anterior: np.ndarray, atual: np.ndarray, grade: int) -> tuple[float, np.ndarray]:
+    """Diferença média global e por bloco (grade x grade); blocos sem pixel comparável valem 1."""
+    diff = np.abs(atual - anterior)
+    blocos = np.ones((grade, grade), dtype=np.float32)
+    for i, linhas in enumerate(np.array_split(diff, grade, axis=0)):
+        for j, bloco in enumerate(np.array_split(linhas, grade, axis=1)):
+            validos = bloco[~np.isnan(bloco)]
+            if validos.size:
+                blocos[i, j] = validos.mean()
+    validos = diff[~np.isnan(diff)]
+    return (float(validos.mean()) if validos.size else 1.0), blocos
+
+
+class Sequenciador:
+    """
+    Máscara de cada quadro, em ordem, rodando `prever(img) -> máscara L` o mínimo possível.
+
+    Por quadro: estima o deslocamento global contra o anterior (correlação de fase na
+    miniatura) e compara os dois já alinhados.
+      - diferença média <= `limiar` e nenhum bloco acima de 2x `limiar`: reaproveita a
+        máscara anterior (deslocada junto);
+      - blocos acima de 2x `limiar` em até `fracao_regiao` da imagem: roda o modelo só no recorte dessa região
+        e cola na máscara anterior, se a borda do recorte concordar com ela;
+      - senão, ou a cada `intervalo_chave` quadros sem inferência completa: quadro-chave.
+    """
+
+    def __init__(
+        self,
+        prever: Callable[[Image.Image], Image.Image],
+        limiar: float = 0.02,
+        intervalo_chave: int = 30,
+        fracao_regiao: float = 0.25,
+        grade: int = 8,
+    ):
+        self.prever = prever
+        self.limiar = limiar
+        self.intervalo_chave = max(1, intervalo_chave)
+        self.fracao_regiao = fracao_regiao
+        self.grade = grade
+        self._miniatura: np.ndarray | None = None
+        self._mascara: np.ndarray | None = None
+        self._desde_chave = 0
+        self.contagem = {"chave": 0, "regiao": 0, "reaproveitada": 0, "deslocada": 0}
+
+    def _chave(self, img: Image.Image, pequena: np.ndarray) -> tuple[Image.Image, str]:
+        mask = self.prever(img)
+        self._guardar(pequena, np.asarray(mask, dtype=np.uint8))
+        self._desde_chave = 0
+        return mask, "chave"
+
+    def _guardar(self, pequena: np.ndarray, mascara: np.ndarray):
+        self._miniatura, self._mascara = pequena, mascara
+
+    def mascara(self, img: Image.Image) -> tuple[Image.Image, str]:
+        """(máscara L do quadro, como foi obtida: chave, regiao, reaproveitada ou deslocada)."""
+        pequena = miniatura(img)
+        self._desde_chave += 1
+        if (
+            self._miniatura is None
+            or self._miniatura.shape != pequena.shape
+            or self._mascara.shape != (img.height, img.width)
+            or self._desde_chave >= self.intervalo_chave
+        ):
+            return self._contar(*self._chave(img, pequena))
+
+        dx, dy = deslocamento(self._miniatura, pequena, maximo=max(pequena.shape) // 4)
+        diferenca, blocos = _diferenca_blocos(deslocar(self._miniatura, dx, dy, np.nan), pequena, self.grade)
+        if dx or dy:
+            # Correlação de fase pode achar um pico falso em cenas sem textura: fica com o melhor alinhamento
+            parado, blocos_parado = _diferenca_blocos(self._miniatura, pequena, self.grade)
+            if parado <= diferenca:
+                dx = dy = 0
+                diferenca, blocos = parado, blocos_parado
+
+        escala = img.width / pequena.shape[1]
+        anterior = deslocar(self._mascara, round(dx * escala), round(dy * escala))
+
+        # Um objeto pequeno mudando quase não mexe na média: conta também o pior bloco
+        mudados = blocos > 2 * self.limiar
+        if diferenca <= self.limiar and not mudados.any():
+            if dx or dy:
+                self._guardar(pequena, anterior)
+            # Câmera parada: a referência continua sendo o último quadro inferido, para
+            # que mudanças lentas se acumulem até passar do limiar em vez de escaparem aos poucos
+            return self._contar(Image.fromarray(anterior), "deslocada" if dx or dy else "reaproveitada")
+
+        if mudados.any() and mudados.mean() <= self.fracao_regiao:
+            mask = self._regiao(img, anterior, mudados)
+            if mask is not None:
+                self._guardar(pequena, mask)
+                return self._contar(Image.fromarray(mask), "regiao")
+        return self._contar(*self._chave(img, pequena))
+
+    def _regiao(self, img: Image.Image, anterior: np.ndarray, mudados: np.ndarray) -> np.ndarray | None:
+        """Roda o modelo no retângulo dos blocos mudados (com um bloco de margem) e cola na máscara anterior."""
+        linhas, colunas = np.nonzero(mudados)
+        bloco_h, bloco_w = img.height / self.grade, img.width / self.grade
+        # Margem de um bloco; o recorte tem pelo menos 1/4 da imagem para o modelo ter contexto
+        x0, x1 = (colunas.min() - 1) * bloco_w, (colunas.max() + 2) * bloco_w
+        y0, y1 = (linhas.min() - 1) * bloco_h, (linhas.max() + 2) * bloco_h
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        meia_w, meia_h = max(x1 - x0, img.width / 4) / 2, max(y1 - y0, img.height / 4) / 2
+        caixa = (
+            int(max(0, cx - meia_w)),
+            int(max(0, cy - meia_h)),
+            int(min(img.width, cx + meia_w)),
+            int(min(img.height, cy + meia_h)),
+        )
+        parcial = np.asarray(self.prever(img.crop(caixa)), dtype=np.uint8)
+        x0, y0, x1, y1 = caixa
+
+        # A borda do recorte não mudou: se o modelo discorda da máscara anterior ali,
+        # a previsão parcial não é confiável (ex: recorte só de fundo) e vale um quadro-chave
+        faixa = max(2, int(min(bloco_w, bloco_h) / 2))
+        borda = np.ones(parcial.shape, dtype=bool)
+        borda[faixa:-faixa, faixa:-faixa] = False
+        for lado, encostado in ((np.s_[:, :faixa], x0 == 0), (np.s_[:, -faixa:], x1 == img.width),
+                                (np.s_[:faixa, :], y0 == 0), (np.s_[-faixa:, :], y1 == img.height)):
+            if encostado:
+                borda[lado] = False  # lado na borda da imagem: nada com que comparar
+        if borda.any():
+            erro = np.abs(parcial[borda].astype(np.float32) - anterior[y0:y1, x0:x1][borda]).mean() / 255
+            if erro > 0.1:
+                return None
+
+        mask = anterior.copy()
+        mask[y0:y1, x0:x1] = parcial
+        return mask
+
+    def _contar(self, mask: Image.Image, como: str) -> tuple[Image.Image, str]:
+        self.contagem[como] += 1
+        return mask, como
+
+    def estatisticas(self) -> dict:
+        total = sum(self.contagem.values())
+        sem_inferencia = self.contagem["reaproveitada"] + self.contagem["deslocada"]
+        return {
+            "quadros": total,
+            **self.contagem,
+            "fracao_sem_inferencia": round(sem_inferencia / total, 3) if total else 0.0,
+        }
+
+
+def _chave_natural(nome: str) -> list:
+    """quadro2 antes de quadro10."""
+    return [int(p) if p.isdigit() else p.lower() for p in re.split(r"(\d+)", nome)]
+
+
+def _quadros_video(caminho: Path) -> Iterator[tuple[str, Image.Image]]:
+    # Importados só ao ler vídeo: o PyAV e o OpenCV pesam na partida da CLI
+    try:
+        import av
+    except ImportError:  # PyAV não instalado: tenta OpenCV
+        av = None
+    if av is not None:
+        with av.open(str(caminho)) as container:
+            for i, quadro in enumerate(container.decode(video=0)):
+                yield f"{caminho.stem}_{i:06d}", quadro.to_image()
+        return
+    try:
+        import cv2
+    except ImportError:
+        cv2 = None
+    if cv2 is not None:
+        captura = cv2.VideoCapture(str(caminho))
+        try:
+            i = 0
+            while True:
+                ok, bgr = captura.read()
+                if not ok:
+                    break
+                yield f"{caminho.stem}_{i:06d}", Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+                i += 1
+        finally:
+            captura.release()
+        return
+    raise RuntimeError("Ler vídeo requer PyAV (pip install av) ou OpenCV (pip install opencv-python)")
+
+
+def eh_sequencia(caminho: Path) -> bool:
+    """Pasta, vídeo ou imagem animada (GIF, APNG, WebP) com mais de um quadro."""
+    if caminho.is_dir() or caminho.suffix.lower() in EXTENSOES_VIDEO:
+        return True
+    try:
+        with Image.open(caminho) as img:
+            return getattr(img, "n_frames", 1) > 1
+    except OSError:
+        return False
+
+
+def contar_quadros(fonte: Path, extensoes: tuple[str, ...] = EXTENSOES_IMAGEM) -> int | None:
+    """Total de quadros quando dá para saber sem decodificar (pasta ou imagem animada)."""
+    if fonte.is_dir():
+        return sum(1 for f in fonte.iterdir() if f.is_file() and f.suffix.lower() in extensoes)
+    if fonte.suffix.lower() in EXTENSOES_VIDEO:
+        return None
+    with Image.open(fonte) as img:
+        return getattr(img, "n_frames", 1)
+
+
+def quadros(fonte: Path, extensoes: tuple[str, ...] = EXTENSOES_IMAGEM) -> Iterator[tuple[str, Image.Image]]:
+    """
+    (nome, quadro RGB) em ordem: arquivos de uma pasta em ordem natural (só o primeiro
+    nível), quadros de um vídeo (PyAV ou OpenCV, opcionais) ou de uma imagem animada.
+    """
+    fonte = Path(fonte)
+    if fonte.is_dir():
+        arquivos = sorted(
+            (f for f in fonte.iterdir() if f.is_file() and f.suffix.lower() in extensoes),
+            key=lambda f: _chave_natural(f.name),
+        )
+        for arquivo in arquivos:
+            yield arquivo.stem, abrir_imagem(arquivo)
+    elif fonte.suffix.lower() in EXTENSOES_VIDEO:
+        yield from _quadros_video(fonte)
+    else:
+        with Image.open(fonte) as img:
+            for i, quadro in enumerate(ImageSequence.Iterator(img)):
+                yield f"{fonte.stem}_{i:06d}", quadro.convert("RGB")
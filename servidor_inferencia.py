@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Servidor de inferência: um conjunto fixo de processos com os modelos carregados,
+compartilhado por todos os processos HTTP (workers do uvicorn, app, CLI).
+
+Cada processo de inferência carrega só os modelos colocados nele, uma única vez. Os
+processos HTTP não carregam modelo nenhum: com REMOVEBG_INFERENCIA apontando para este
+servidor, core.prever_mascara escreve os pixels num bloco de memória compartilhada
+(multiprocessing.shared_memory), manda só o nome do bloco pelo socket e lê a máscara
+que o processo de inferência escreveu no mesmo bloco. Nenhum pixel passa por pickle.
+
+O socket fica numa pasta só do usuário (0700) e as conexões são autenticadas com
+REMOVEBG_INFERENCIA_CHAVE ou, sem ela, com uma chave aleatória gravada (0600) ao lado
+do socket, que os clientes do mesmo usuário leem.
+
+Uso:
+    python servidor_inferencia.py --workers 4
+    python servidor_inferencia.py --workers 3 --colocacao "birefnet-general=0,u2netp=1+2"
+    REMOVEBG_INFERENCIA=/tmp/removebg-$(id -u)/inferencia.sock uvicorn api:app --workers 4
+"""
+
+import argparse
+import os
+import queue
+import secrets
+import signal
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import get_context
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+from PIL import Image
+
+# Pasta do usuário, não /tmp direto: outro usuário não consegue nem chegar ao socket
+ENDERECO_PADRAO = os.path.join(tempfile.gettempdir(), f"removebg-{os.getuid()}", "inferencia.sock")
+
+
+def _endereco_trabalhador(endereco: str, i: int) -> str:
+    return f"{endereco}.{i}"
+
+
+def _arquivo_chave(endereco: str) -> str:
+    return f"{endereco}.chave"
+
+
+def _pasta_privada(endereco: str):
+    """Cria a pasta do socket com 0700, ou confere que a existente é só deste usuário."""
+    pasta = os.path.dirname(os.path.abspath(endereco))
+    os.makedirs(pasta, mode=0o700, exist_ok=True)
+    info = os.stat(pasta)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(
+            f"A pasta {pasta} do socket de inferência precisa ser deste usuário e ter permissão 0700"
+        )
+
+
+def _escutar(endereco: str, chave: bytes) -> Listener:
+    """Listener no socket Unix `endereco`, acessível só pelo dono (0600)."""
+    ouvinte = Listener(endereco, family="AF_UNIX", authkey=chave)
+    os.chmod(endereco, 0o600)
+    return ouvinte
+
+
+def _chave_do_cliente(endereco: str, chave: str | None = None) -> bytes:
+    """
+    Chave das conexões: `chave`, REMOVEBG_INFERENCIA_CHAVE ou a gravada pelo servidor ao
+    lado do socket. Lida a cada conexão nova: o servidor reiniciado pode ter outra.
+    """
+    chave = chave or os.environ.get("REMOVEBG_INFERENCIA_CHAVE")
+    if chave:
+        return chave.encode()
+    try:
+        return Path(_arquivo_chave(endereco)).read_bytes()
+    except OSError as e:
+        # ConnectionError: o cliente trata como servidor ainda subindo e tenta de novo
+        raise ConnectionError(
+            f"Sem REMOVEBG_INFERENCIA_CHAVE e sem {_arquivo_chave(endereco)} (servidor de inferência parado?)"
+        ) from e
+
+
+def ler_colocacao(valor: str | None, workers: int) -> dict[str, list[int]]:
+    """
+    'birefnet-general=0,u2netp=1+2' -> {"birefnet-general": [0], "u2netp": [1, 2]}.
+    Modelos fora da lista rodam em qualquer processo (carregados no primeiro uso).
+    """
+    colocacao = {}
+    for item in (valor or "").split(","):
+        if "=" not in item:
+            continue
+        modelo, indices = item.split("=", 1)
+        escolhidos = sorted({int(i) for i in indices.split("+") if i.strip()})
+        invalidos = [i for i in escolhidos if not 0 <= i < workers]
+        if invalidos:
+            raise ValueError(f"{modelo.strip()}: processo {invalidos[0]} não existe (há {workers})")
+        colocacao[modelo.strip()] = escolhidos
+    return colocacao
+
+
+# ---------------------------------------------------------------- processos de inferência
+
+
+def _abrir_bloco(nome: str) -> SharedMemory:
+    """
+    Abre o bloco criado pelo cliente sem registrá-lo no resource_tracker deste processo
+    (senão ele seria apagado, ou daria aviso de vazamento, quando o processo terminasse).
+    """
+    try:
+        return SharedMemory(name=nome, track=False)  # Python 3.13+
+    except TypeError:
+        from multiprocessing import resource_tracker
+
+        bloco = SharedMemory(name=nome)
+        resource_tracker.unregister(bloco._name, "shared_memory")
+        return bloco
+
+
+def _atender(conexao, core):
+    """Pedidos de um cliente, em ordem, até ele desconectar."""
+    with conexao:
+        while True:
+            try:
+                pedido = conexao.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                _, modelo, nome, largura, altura = pedido
+                n = largura * altura * 3
+                bloco = _abrir_bloco(nome)
+                try:
+                    with bloco.buf[:n] as pixels:
+                        img = Image.frombytes("RGB", (largura, altura), pixels)
+                    mask = core.prever_mascara(img, modelo)
+                    bloco.buf[n : n + largura * altura] = mask.tobytes()
+                finally:
+                    bloco.close()
+                conexao.send(("ok",))
+            except Exception as e:
+                conexao.send(("erro", f"{type(e).__name__}: {e}"))
+
+
+def _trabalhador(i: int, endereco: str, chave: bytes, modelos: list[str], threads: int | None):
+    """Processo de inferência `i`: pré-carrega `modelos` e atende cada conexão numa thread."""
+    # Este processo É a inferência: nunca repassar a outro servidor
+    os.environ.pop("REMOVEBG_INFERENCIA", None)
+    if threads:
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+    import core
+
+    # O socket só aparece depois da carga: quem conecta encontra os modelos prontos
+    core.pre_carregar(modelos)
+    with _escutar(endereco, chave) as ouvinte:
+        while True:
+            try:
+                conexao = ouvinte.accept()
+            except Exception:
+                # Falha de autenticação ou cliente que desistiu no meio do aperto de mão
+                continue
+            threading.Thread(target=_atender, args=(conexao, core), daemon=True).start()
+
+
+class ServidorInferencia:
+    """
+    Sobe `workers` processos de inferência (reiniciando os que morrerem) e responde no
+    endereço principal o mapa modelo -> endereços dos processos que o atendem.
+    """
+
+    def __init__(
+        self,
+        endereco: str = ENDERECO_PADRAO,
+        workers: int = 2,
+        colocacao: dict[str, list[int]] | None = None,
+        threads: int | None = None,
+        chave: str | None = None,
+    ):
+        self.endereco = endereco
+        self.workers = max(1, workers)
+        self.colocacao = colocacao or {}
+        # Threads ONNX por processo: os núcleos divididos entre os processos
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        # Sem chave configurada, uma aleatória por execução (gravada em servir() para os clientes)
+        chave = chave or os.environ.get("REMOVEBG_INFERENCIA_CHAVE")
+        self.chave = chave.encode() if chave else secrets.token_bytes(32)
+        self._ctx = get_context("spawn")
+        self._processos: dict[int, object] = {}
+        self._reinicios = 0
+        self._parar = threading.Event()
+
+    def modelos_do_processo(self, i: int) -> list[str]:
+        return [modelo for modelo, indices in self.colocacao.items() if i in indices]
+
+    def mapa(self) -> dict:
+        """Endereços por modelo ("*" = modelos sem colocação, em qualquer processo)."""
+        todos = [_endereco_trabalhador(self.endereco, i) for i in range(self.workers)]
+        return {
+            "*": todos,
+            **{m: [_endereco_trabalhador(self.endereco, i) for i in idx] for m, idx in self.colocacao.items()},
+        }
+
+    def _iniciar(self, i: int):
+        # Socket de um processo anterior que morreu: removido para "pronto" não mentir
+        if os.path.exists(_endereco_trabalhador(self.endereco, i)):
+            os.unlink(_endereco_trabalhador(self.endereco, i))
+        processo = self._ctx.Process(
+            target=_trabalhador,
+            args=(i, _endereco_trabalhador(self.endereco, i), self.chave, self.modelos_do_processo(i), self.threads),
+            name=f"inferencia-{i}",
+            daemon=True,
+        )
+        processo.start()
+        self._processos[i] = processo
+
+    def _vigiar(self):
+        while not self._parar.wait(1.0):
+            for i, processo in list(self._processos.items()):
+                if not processo.is_alive():
+                    print(f"Processo de inferência {i} terminou (código {processo.exitcode}); reiniciando", flush=True)
+                    self._reinicios += 1
+                    self._iniciar(i)
+
+    def estatisticas(self) -> dict:
+        return {
+            "workers": self.workers,
+            "threads_por_worker": self.threads,
+            "reinicios": self._reinicios,
+            "processos": {
+                i: {
+                    "pid": p.pid,
+                    "vivo": p.is_alive(),
+                    "pronto": p.is_alive() and os.path.exists(_endereco_trabalhador(self.endereco, i)),
+                    "modelos": self.modelos_do_processo(i),
+                }
+                for i, p in sorted(self._processos.items())
+            },
+        }
+
+    def _gravar_chave(self):
+        caminho = _arquivo_chave(self.endereco)
+        descritor = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.fchmod(descritor, 0o600)
+        with os.fdopen(descritor, "wb") as arquivo:
+            arquivo.write(self.chave)
+
+    def servir(self):
+        _pasta_privada(self.endereco)
+        self._gravar_chave()
+        for i in range(self.workers):
+            self._iniciar(i)
+        threading.Thread(target=self._vigiar, name="inferencia-vigia", daemon=True).start()
+
+        if os.path.exists(self.endereco):
+            os.unlink(self.endereco)
+        with _escutar(self.endereco, self.chave) as ouvinte:
+            while not self._parar.is_set():
+                try:
+                    conexao = ouvinte.accept()
+                except Exception:
+                    continue
+                with conexao:
+                    try:
+                        pedido = conexao.recv()
+                        conexao.send(self.mapa() if pedido == ("mapa",) else self.estatisticas())
+                    except (EOFError, OSError):
+                        pass
+
+    def parar(self):
+        self._parar.set()
+        for processo in self._processos.values():
+            processo.terminate()
+        for i in range(self.workers):
+            caminho = _endereco_trabalhador(self.endereco, i)
+            if os.path.exists(caminho):
+                os.unlink(caminho)
+        for caminho in (self.endereco, _arquivo_chave(self.endereco)):
+            if os.path.exists(caminho):
+                os.unlink(caminho)
+
+
+# ---------------------------------------------------------------- cliente (processos HTTP)
+
+
+class ClienteInferencia:
+    """
+    Lado dos processos HTTP. Busca o mapa no servidor na primeira chamada e manda cada
+    pedido ao processo do modelo com menos pedidos em andamento (deste cliente).
+    Conexões ociosas são reaproveitadas; cada thread usa uma de cada vez.
+    """
+
+    def __init__(self, endereco: str, chave: str | None = None, tentativas: int = 6):
+        self.endereco = endereco
+        self._chave = chave
+        self.tentativas = tentativas
+        self._mapa: dict[str, list[str]] | None = None
+        self._livres: dict[str, queue.SimpleQueue] = {}
+        self._em_andamento: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.pedidos = 0
+        self.erros = 0
+
+    def _pedir_ao_servidor(self, pedido: tuple):
+        chave = _chave_do_cliente(self.endereco, self._chave)
+        with Client(self.endereco, family="AF_UNIX", authkey=chave) as conexao:
+            conexao.send(pedido)
+            return conexao.recv()
+
+    def _escolher(self, modelo: str) -> str:
+        with self._lock:
+            if self._mapa is None:
+                self._mapa = self._pedir_ao_servidor(("mapa",))
+            candidatos = self._mapa.get(modelo) or self._mapa["*"]
+            destino = min(candidatos, key=lambda e: self._em_andamento.get(e, 0))
+            self._em_andamento[destino] = self._em_andamento.get(destino, 0) + 1
+            return destino
+
+    def _conexao(self, destino: str):
+        livres = self._livres.setdefault(destino, queue.SimpleQueue())
+        try:
+            return livres.get_nowait()
+        except queue.Empty:
+            return Client(destino, family="AF_UNIX", authkey=_chave_do_cliente(self.endereco, self._chave))
+
+    def prever(self, img: Image.Image, modelo: str) -> Image.Image:
+        """Máscara L de `img`, calculada num processo de inferência."""
+        img = img if img.mode == "RGB" else img.convert("RGB")
+        largura, altura = img.size
+        n = largura * altura * 3
+        bloco = SharedMemory(create=True, size=n + largura * altura)
+        try:
+            bloco.buf[:n] = img.tobytes()
+            for tentativa in range(self.tentativas):
+                destino = self._escolher(modelo)
+                try:
+                    conexao = self._conexao(destino)
+                    conexao.send(("prever", modelo, bloco.name, largura, altura))
+                    resposta = conexao.recv()
+                except (EOFError, OSError, ConnectionError):
+                    # Processo reiniciando (carregar o modelo leva alguns segundos): refaz o mapa e tenta de novo
+                    with self._lock:
+                        self._mapa = None
+                        self._livres.pop(destino, None)
+                    if tentativa == self.tentativas - 1:
+                        self.erros += 1
+                        raise
+                    time.sleep(min(0.5 * 2**tentativa, 4.0))
+                    continue
+                finally:
+                    with self._lock:
+                        self._em_andamento[destino] -= 1
+                self._livres.setdefault(destino, queue.SimpleQueue()).put(conexao)
+                break
+            self.pedidos += 1
+            if resposta[0] != "ok":
+                self.erros += 1
+                raise RuntimeError(f"Servidor de inferência: {resposta[1]}")
+            with bloco.buf[n:] as alpha:
+                return Image.frombytes("L", (largura, altura), alpha)
+        finally:
+            bloco.close()
+            bloco.unlink()
+
+    def estatisticas(self) -> dict:
+        try:
+            servidor = self._pedir_ao_servidor(("estado",))
+        except (OSError, EOFError, ConnectionError) as e:
+            servidor = {"erro": str(e)}
+        return {"endereco": self.endereco, "pedidos": self.pedidos, "erros": self.erros, "servidor": servidor}
+
+
+def cliente_do_ambiente() -> ClienteInferencia | None:
+    """REMOVEBG_INFERENCIA (socket do servidor; vazio = inferência no próprio processo) e REMOVEBG_INFERENCIA_CHAVE."""
+    endereco = os.environ.get("REMOVEBG_INFERENCIA")
+    return ClienteInferencia(endereco) if endereco else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Processos de inferência compartilhados pelos processos HTTP")
+    parser.add_argument(
+        "--endereco",
+        default=os.environ.get("REMOVEBG_INFERENCIA") or ENDERECO_PADRAO,
+        help=f"Socket Unix do servidor (padrão: REMOVEBG_INFERENCIA ou {ENDERECO_PADRAO})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("REMOVEBG_INFERENCIA_WORKERS", 0)) or max(1, (os.cpu_count() or 2) // 2),
+        help="Processos de inferência (padrão: REMOVEBG_INFERENCIA_WORKERS ou metade dos núcleos)",
+    )
+    parser.add_argument(
+        "--colocacao",
+        default=os.environ.get("REMOVEBG_INFERENCIA_COLOCACAO"),
+        help='Modelos por processo, ex: "birefnet-general=0,u2netp=1+2" (pré-carregados; os outros sob demanda)',
+    )
+    parser.add_argument("--threads", type=int, help="Threads ONNX por processo (padrão: núcleos / workers)")
+    args = parser.parse_args()
+
+    servidor = ServidorInferencia(
+        args.endereco, args.workers, ler_colocacao(args.colocacao, args.workers), args.threads
+    )
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(
+        f"Servidor de inferência em {args.endereco}: {servidor.workers} processo(s),"
+        f" {servidor.threads} thread(s) ONNX cada",
+        flush=True,
+    )
+    for i in range(servidor.workers):
+        print(f"  [{i}] {', '.join(servidor.modelos_do_processo(i)) or 'modelos sob demanda'}", flush=True)
+    try:
+        servidor.servir()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.parar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
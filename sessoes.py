@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Gerenciador das sessões de modelo (rembg/ONNX).
+Carga thread-safe, orçamento de memória com remoção LRU dos modelos ociosos,
+pré-carga com aquecimento e estatísticas de carga/remoção.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Memória de uma sessão ONNX carregada em relação ao tamanho do arquivo do modelo
+FATOR_MEMORIA = 1.5
+
+
+def _memoria_estimada(session) -> int:
+    """Estimativa em bytes da memória ocupada pela sessão, a partir do arquivo .onnx."""
+    caminho = getattr(getattr(session, "inner_session", None), "_model_path", None)
+    try:
+        return int(os.path.getsize(caminho) * FATOR_MEMORIA)
+    except (OSError, TypeError):
+        return 0
+
+
+class GerenciadorSessoes:
+    """
+    Mantém as sessões carregadas dentro de `orcamento_bytes` (0 = sem limite).
+
+    Ao passar do orçamento, remove os modelos usados há mais tempo que não estão
+    em uso nem em `fixos`. Duas threads pedindo o mesmo modelo ao mesmo tempo
+    esperam uma única carga.
+    """
+
+    def __init__(self, fabrica, orcamento_bytes: int = 0, fixos: tuple[str, ...] = ()):
+        self.fabrica = fabrica
+        self.orcamento_bytes = orcamento_bytes
+        self.fixos = set(fixos)
+        self._sessoes: OrderedDict[str, object] = OrderedDict()
+        self._memoria: dict[str, int] = {}
+        self._em_uso: dict[str, int] = {}
+        self._locks_carga: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = {}
+
+    def _stat(self, modelo: str) -> dict:
+        return self._stats.setdefault(
+            modelo, {"carregamentos": 0, "acertos": 0, "remocoes": 0, "tempo_carga_s": 0.0}
+        )
+
+    def __contains__(self, modelo: str) -> bool:
+        return modelo in self._sessoes
+
+    def __len__(self) -> int:
+        return len(self._sessoes)
+
+    def carregados(self) -> list[str]:
+        return list(self._sessoes)
+
+    def get(self, modelo: str):
+        """Sessão do modelo, carregando se preciso."""
+        with self._lock:
+            session = self._sessoes.get(modelo)
+            if session is not None:
+                self._sessoes.move_to_end(modelo)
+                self._stat(modelo)["acertos"] += 1
+                return session
+            lock_carga = self._locks_carga.setdefault(modelo, threading.Lock())
+
+        with lock_carga:
+            # Outra thread pode ter carregado enquanto esperávamos
+            with self._lock:
+                session = self._sessoes.get(modelo)
+                if session is not None:
+                    self._sessoes.move_to_end(modelo)
+                    self._stat(modelo)["acertos"] += 1
+                    return session
+
+            t0 = time.perf_counter()
+            session = self.fabrica(modelo)
+            duracao = time.perf_counter() - t0
+
+            with self._lock:
+                self._sessoes[modelo] = session
+                self._memoria[modelo] = _memoria_estimada(session)
+                stat = self._stat(modelo)
+                stat["carregamentos"] += 1
+                stat["tempo_carga_s"] = round(duracao, 3)
+                self._remover_excedente(manter=modelo)
+            return session
+
+    @contextmanager
+    def usar(self, modelo: str):
+        """Sessão marcada como em uso: não é removida enquanto o bloco roda."""
+        with self._lock:
+            self._em_uso[modelo] = self._em_uso.get(modelo, 0) + 1
+        try:
+            yield self.get(modelo)
+        finally:
+            with self._lock:
+                self._em_uso[modelo] -= 1
+
+    def _remover_excedente(self, manter: str):
+        """Remove modelos ociosos (mais antigos primeiro) até caber no orçamento. Chamar com _lock."""
+        if not self.orcamento_bytes:
+            return
+        for modelo in list(self._sessoes):
+            if sum(self._memoria.values()) <= self.orcamento_bytes:
+                break
+            if modelo == manter or modelo in self.fixos or self._em_uso.get(modelo, 0) > 0:
+                continue
+            del self._sessoes[modelo]
+            self._memoria.pop(modelo, None)
+            self._stat(modelo)["remocoes"] += 1
+
+    def descarregar(self, modelo: str) -> bool:
+        """Remove o modelo da memória (se não estiver em uso)."""
+        with self._lock:
+            if modelo not in self._sessoes or self._em_uso.get(modelo, 0) > 0:
+                return False
+            del self._sessoes[modelo]
+            self._memoria.pop(modelo, None)
+            self._stat(modelo)["remocoes"] += 1
+            return True
+
+    def pre_carregar(self, modelos, aquecer=None):
+        """Carrega os modelos e, se `aquecer(modelo)` for dado, roda uma inferência de teste."""
+        for modelo in modelos:
+            self.fixos.add(modelo)
+            self.get(modelo)
+            if aquecer is not None:
+                aquecer(modelo)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "orcamento_mb": round(self.orcamento_bytes / 1024 / 1024, 1),
+                "memoria_mb": round(sum(self._memoria.values()) / 1024 / 1024, 1),
+                "carregados": list(self._sessoes),
+                "modelos": {
+                    m: {
+                        **s,
+                        "carregado": m in self._sessoes,
+                        "em_uso": self._em_uso.get(m, 0),
+                        "memoria_mb": round(self._memoria.get(m, 0) / 1024 / 1024, 1),
+                    }
+                    for m, s in sorted(self._stats.items())
+                },
+            }
+
+
+def config_do_ambiente() -> dict:
+    """Lê REMOVEBG_MEMORIA_MODELOS_MB (0 = sem limite)."""
+    return {"orcamento_bytes": int(float(os.environ.get("REMOVEBG_MEMORIA_MODELOS_MB", 0)) * 1024 * 1024)}
+
+
+def modelos_para_precarregar() -> list[str]:
+    """Lê REMOVEBG_PRECARREGAR, ex: "u2netp,birefnet-general"."""
+    return [m.strip() for m in os.environ.get("REMOVEBG_PRECARREGAR", "").split(",") if m.strip()]
@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Fila persistente de tarefas assíncronas (SQLite + arquivos).
+O cliente envia a imagem, recebe um id e consulta depois; a fila sobrevive a
+reinícios e um laço de trabalho separado consome as tarefas em ordem de chegada.
+"""
+
+import asyncio
+import ipaddress
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from pathlib import Path
+from typing import IO
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS tarefas (
+    id TEXT PRIMARY KEY,
+    modelo TEXT NOT NULL,
+    opcoes TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    criada REAL NOT NULL,
+    iniciada REAL,
+    concluida REAL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    erro TEXT,
+    media_type TEXT,
+    nome_arquivo TEXT,
+    callback TEXT,
+    callback_estado TEXT,
+    dono TEXT,
+    renovada REAL
+);
+CREATE INDEX IF NOT EXISTS tarefas_fila ON tarefas (estado, criada);
+"""
+
+# Estados de uma tarefa
+NA_FILA = "na_fila"
+PROCESSANDO = "processando"
+CONCLUIDA = "concluida"
+ERRO = "erro"
+
+
+class FilaTarefas:
+    """
+    Tarefas em SQLite; a imagem enviada e o resultado ficam em arquivos na mesma pasta.
+
+    Várias instâncias (workers do uvicorn) podem abrir a mesma pasta. Quem pega uma tarefa
+    fica com ela (`dono`) enquanto renovar a posse a cada poucos segundos (`renovar`); só
+    tarefas sem renovação há mais de `prazo_s` (processo que morreu) voltam para a fila
+    (`recuperar`), até `max_tentativas` vezes: depois disso a tarefa, que derruba o worker,
+    vira erro.
+    """
+
+    def __init__(self, pasta: str | Path, prazo_s: float = 60.0, max_tentativas: int = 3):
+        self.pasta = Path(pasta)
+        self.prazo_s = prazo_s
+        self.max_tentativas = max(1, max_tentativas)
+        self.dono = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._lock_abertura = threading.Lock()
+        self._conexao: sqlite3.Connection | None = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """Abre o banco (e cria a pasta) no primeiro uso, não ao importar quem instancia a fila."""
+        if self._conexao is not None:
+            return self._conexao
+        with self._lock_abertura:
+            if self._conexao is None:
+                self.pasta.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(self.pasta / "tarefas.db", check_same_thread=False, isolation_level=None)
+                db.row_factory = sqlite3.Row
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(ESQUEMA)
+                # Bancos criados antes da posse das tarefas
+                colunas = {linha[1] for linha in db.execute("PRAGMA table_info(tarefas)")}
+                for coluna, tipo in (("dono", "TEXT"), ("renovada", "REAL")):
+                    if coluna not in colunas:
+                        db.execute(f"ALTER TABLE tarefas ADD COLUMN {coluna} {tipo}")
+                self._conexao = db
+        return self._conexao
+
+    def _arquivo(self, tarefa_id: str, tipo: str) -> Path:
+        return self.pasta / f"{tarefa_id}.{tipo}"
+
+    def enfileirar(
+        self, modelo: str, entrada: bytes | str | IO[bytes], opcoes: dict, callback: str | None = None
+    ) -> str:
+        """
+        `entrada` são os bytes da imagem, o caminho de um upload em disco (movido para a
+        fila) ou o arquivo aberto do upload (copiado do início).
+        """
+        tarefa_id = uuid.uuid4().hex
+        db = self._db  # garante a pasta antes de gravar a entrada
+        tmp = self._arquivo(tarefa_id, "entrada.tmp")
+        if isinstance(entrada, bytes):
+            tmp.write_bytes(entrada)
+        elif isinstance(entrada, str):
+            shutil.move(entrada, tmp)
+        else:
+            entrada.seek(0)
+            with open(tmp, "wb") as f:
+                shutil.copyfileobj(entrada, f, 1024 * 1024)
+        os.replace(tmp, self._arquivo(tarefa_id, "entrada"))
+        with self._lock:
+            db.execute(
+                "INSERT INTO tarefas (id, modelo, opcoes, estado, criada, callback) VALUES (?, ?, ?, ?, ?, ?)",
+                (tarefa_id, modelo, json.dumps(opcoes), NA_FILA, time.time(), callback),
+            )
+        return tarefa_id
+
+    def recuperar(self) -> list[dict]:
+        """
+        Devolve à fila as tarefas cujo dono parou de renovar a posse (processo morto).
+        As que já foram pegas `max_tentativas` vezes viram erro; essas voltam na lista
+        (id e callback) para o aviso ao cliente.
+        """
+        agora = time.time()
+        with self._lock:
+            abandonadas = [
+                dict(linha)
+                for linha in self._db.execute(
+                    """
+                    UPDATE tarefas SET estado = ?, concluida = ?, erro = ?, dono = NULL
+                    WHERE estado = ? AND (renovada IS NULL OR renovada < ?) AND tentativas >= ?
+                    RETURNING id, callback
+                    """,
+                    (
+                        ERRO,
+                        agora,
+                        f"abandonada após {self.max_tentativas} tentativa(s): o worker parou durante o processamento",
+                        PROCESSANDO,
+                        agora - self.prazo_s,
+                        self.max_tentativas,
+                    ),
+                ).fetchall()
+            ]
+            self._db.execute(
+                """
+                UPDATE tarefas SET estado = ?, iniciada = NULL, dono = NULL, renovada = NULL
+                WHERE estado = ? AND (renovada IS NULL OR renovada < ?)
+                """,
+                (NA_FILA, PROCESSANDO, agora - self.prazo_s),
+            )
+        for tarefa in abandonadas:
+            self._arquivo(tarefa["id"], "entrada").unlink(missing_ok=True)
+        return abandonadas
+
+    def proxima(self) -> dict | None:
+        """Marca a tarefa mais antiga da fila como em processamento por esta instância e a devolve."""
+        agora = time.time()
+        with self._lock:
+            linha = self._db.execute(
+                """
+                UPDATE tarefas SET estado = ?, iniciada = ?, tentativas = tentativas + 1, dono = ?, renovada = ?
+                WHERE id = (SELECT id FROM tarefas WHERE estado = ? ORDER BY criada LIMIT 1)
+                RETURNING *
+                """,
+                (PROCESSANDO, agora, self.dono, agora, NA_FILA),
+            ).fetchone()
+        if linha is None:
+            return None
+        tarefa = dict(linha)
+        tarefa["opcoes"] = json.loads(tarefa["opcoes"])
+        return tarefa
+
+    def renovar(self, tarefa_id: str) -> bool:
+        """Renova a posse da tarefa; False se ela já não é desta instância."""
+        with self._lock:
+            return self._db.execute(
+                "UPDATE tarefas SET renovada = ? WHERE id = ? AND estado = ? AND dono = ?",
+                (time.time(), tarefa_id, PROCESSANDO, self.dono),
+            ).rowcount == 1
+
+    def devolver(self, tarefa_id: str):
+        """
+        Volta a tarefa para a fila (ex: fila do modelo cheia, desligamento), mantendo a
+        posição; não conta como tentativa.
+        """
+        with self._lock:
+            self._db.execute(
+                """
+                UPDATE tarefas SET estado = ?, iniciada = NULL, dono = NULL, renovada = NULL,
+                    tentativas = tentativas - 1
+                WHERE id = ? AND dono = ?
+                """,
+                (NA_FILA, tarefa_id, self.dono),
+            )
+
+    def entrada(self, tarefa_id: str) -> str:
+        """Caminho da imagem enviada: quem processa lê do disco, sem trazê-la inteira para a memória."""
+        return str(self._arquivo(tarefa_id, "entrada"))
+
+    def concluir(self, tarefa_id: str, resultado: bytes, media_type: str, nome_arquivo: str) -> bool:
+        """
+        Grava o resultado. False (sem tocar em arquivos) se a posse foi perdida: outra
+        instância pegou a tarefa de volta e está com ela.
+        """
+        # Posse renovada agora: sobra `prazo_s` para gravar antes que alguém a pegue
+        if not self.renovar(tarefa_id):
+            return False
+        tmp = self._arquivo(tarefa_id, "resultado.tmp")
+        tmp.write_bytes(resultado)
+        os.replace(tmp, self._arquivo(tarefa_id, "resultado"))
+        with self._lock:
+            concluiu = self._db.execute(
+                """
+                UPDATE tarefas SET estado = ?, concluida = ?, media_type = ?, nome_arquivo = ?, dono = NULL
+                WHERE id = ? AND dono = ?
+                """,
+                (CONCLUIDA, time.time(), media_type, nome_arquivo, tarefa_id, self.dono),
+            ).rowcount == 1
+        if concluiu:
+            self._arquivo(tarefa_id, "entrada").unlink(missing_ok=True)
+        return concluiu
+
+    def falhar(self, tarefa_id: str, erro: str) -> bool:
+        """Marca o erro; False (a entrada fica) se a tarefa já não é desta instância."""
+        with self._lock:
+            falhou = self._db.execute(
+                "UPDATE tarefas SET estado = ?, concluida = ?, erro = ?, dono = NULL WHERE id = ? AND dono = ?",
+                (ERRO, time.time(), erro, tarefa_id, self.dono),
+            ).rowcount == 1
+        if falhou:
+            self._arquivo(tarefa_id, "entrada").unlink(missing_ok=True)
+        return falhou
+
+    def registrar_callback(self, tarefa_id: str, estado: str):
+        with self._lock:
+            self._db.execute("UPDATE tarefas SET callback_estado = ? WHERE id = ?", (estado, tarefa_id))
+
+    def obter(self, tarefa_id: str) -> dict | None:
+        """Tarefa com `posicao` (quantas estão na frente) quando ainda está na fila."""
+        with self._lock:
+            linha = self._db.execute("SELECT * FROM tarefas WHERE id = ?", (tarefa_id,)).fetchone()
+            if linha is None:
+                return None
+            tarefa = dict(linha)
+            if tarefa["estado"] == NA_FILA:
+                tarefa["posicao"] = self._db.execute(
+                    "SELECT COUNT(*) FROM tarefas WHERE estado = ? AND criada < ?", (NA_FILA, tarefa["criada"])
+                ).fetchone()[0]
+        tarefa["opcoes"] = json.loads(tarefa["opcoes"])
+        return tarefa
+
+    def resultado(self, tarefa_id: str) -> Path:
+        return self._arquivo(tarefa_id, "resultado")
+
+    def limpar(self, ttl_s: float) -> int:
+        """Remove tarefas terminadas há mais de ttl_s segundos (e seus arquivos)."""
+        limite = time.time() - ttl_s
+        with self._lock:
+            ids = [
+                r[0]
+                for r in self._db.execute(
+                    "SELECT id FROM tarefas WHERE estado IN (?, ?) AND concluida < ?", (CONCLUIDA, ERRO, limite)
+                )
+            ]
+            self._db.executemany("DELETE FROM tarefas WHERE id = ?", [(i,) for i in ids])
+        for tarefa_id in ids:
+            self._arquivo(tarefa_id, "resultado").unlink(missing_ok=True)
+        return len(ids)
+
+    def estatisticas(self) -> dict:
+        """Por modelo: tarefas em cada estado e tempos médios de espera e de execução (s)."""
+        agora = time.time()
+        with self._lock:
+            linhas = self._db.execute(
+                """
+                SELECT modelo,
+                       SUM(estado = ?) AS na_fila,
+                       SUM(estado = ?) AS processando,
+                       SUM(estado = ?) AS concluidas,
+                       SUM(estado = ?) AS erros,
+                       AVG(iniciada - criada) AS espera_media_s,
+                       AVG(CASE WHEN estado = ? THEN concluida - iniciada END) AS execucao_media_s,
+                       MAX(CASE WHEN estado = ? THEN ? - criada END) AS espera_mais_antiga_s
+                FROM tarefas GROUP BY modelo ORDER BY modelo
+                """,
+                (NA_FILA, PROCESSANDO, CONCLUIDA, ERRO, CONCLUIDA, NA_FILA, agora),
+            ).fetchall()
+        return {
+            linha["modelo"]: {
+                chave: round(valor, 3) if isinstance(valor, float) else (valor or 0)
+                for chave, valor in dict(linha).items()
+                if chave != "modelo"
+            }
+            for linha in linhas
+        }
+
+
+def validar_callback(url: str, hosts: frozenset[str] = frozenset(), rede_privada: bool = False):
+    """
+    ValueError se a URL de callback não é http(s) ou aponta para a rede interna (loopback,
+    privada, link-local...): sem isso qualquer cliente faz o servidor dar POST em serviços
+    internos (SSRF). Com `hosts`, só esses hosts são aceitos (e podem ser internos);
+    `rede_privada` desliga a checagem de endereço.
+    """
+    partes = urllib.parse.urlsplit(url)
+    if partes.scheme not in ("http", "https") or not partes.hostname:
+        raise ValueError("callback deve ser uma URL http(s)")
+    host = partes.hostname.lower()
+    if hosts:
+        if host not in hosts:
+            raise ValueError(f"host de callback não permitido: {host}")
+        return
+    if rede_privada:
+        return
+    try:
+        porta = partes.port or (443 if partes.scheme == "https" else 80)
+        enderecos = {info[4][0] for info in socket.getaddrinfo(host, porta, type=socket.SOCK_STREAM)}
+    except (OSError, ValueError) as e:
+        raise ValueError(f"host de callback inválido: {host}") from e
+    for endereco in enderecos:
+        ip = ipaddress.ip_address(endereco.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"callback para endereço interno não permitido: {host}")
+
+
+class _SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    """Um redirecionamento levaria o POST para um endereço que não passou por `validar_callback`."""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+_abridor = urllib.request.build_opener(_SemRedirecionar)
+
+
+def _notificar(url: str, corpo: dict, timeout: float = 10.0):
+    """POST JSON para a URL de callback do cliente (sem seguir redirecionamentos)."""
+    pedido = urllib.request.Request(
+        url,
+        data=json.dumps(corpo).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with _abridor.open(pedido, timeout=timeout) as resposta:
+        resposta.read()
+
+
+class TrabalhadorTarefas:
+    """
+    Laços que consomem a fila. `processar(tarefa, caminho)` é uma corrotina que recebe o
+    caminho da imagem enviada e devolve (bytes, media_type, nome_arquivo); `adiar` são
+    exceções que devolvem a tarefa à fila (ex: FilaCheia), com espera de `espera_adiada` s. `url_resultado(id)` entra
+    no corpo do callback; `callback_hosts` e `callback_rede_privada` vão para `validar_callback`.
+    """
+
+    def __init__(
+        self,
+        fila: FilaTarefas,
+        processar,
+        concorrencia: int = 1,
+        adiar: tuple[type[Exception], ...] = (),
+        espera_adiada: float = 5.0,
+        ttl_s: float = 24 * 3600,
+        url_resultado=None,
+        callback_hosts: frozenset[str] = frozenset(),
+        callback_rede_privada: bool = False,
+    ):
+        self.fila = fila
+        self.processar = processar
+        self.concorrencia = concorrencia
+        self.adiar = adiar
+        self.espera_adiada = espera_adiada
+        self.ttl_s = ttl_s
+        self.url_resultado = url_resultado
+        self.callback_hosts = callback_hosts
+        self.callback_rede_privada = callback_rede_privada
+        self._nova = asyncio.Event()
+        self._lacos: list[asyncio.Task] = []
+        # Referência aos callbacks em curso (o loop só guarda referência fraca às tasks)
+        self._callbacks: set[asyncio.Task] = set()
+
+    def validar_callback(self, url: str):
+        """ValueError se a URL não pode receber callbacks (bloqueia: resolve o host)."""
+        validar_callback(url, self.callback_hosts, self.callback_rede_privada)
+
+    def avisar(self):
+        """Acorda os laços ociosos (chamar após enfileirar)."""
+        self._nova.set()
+
+    def iniciar(self):
+        self._lacos = [asyncio.create_task(self._laco()) for _ in range(self.concorrencia)]
+        self._lacos.append(asyncio.create_task(self._limpeza()))
+
+    async def parar(self):
+        for laco in self._lacos:
+            laco.cancel()
+        await asyncio.gather(*self._lacos, return_exceptions=True)
+        self._lacos = []
+
+    async def _laco(self):
+        while True:
+            for abandonada in await asyncio.to_thread(self.fila.recuperar):
+                if abandonada["callback"]:
+                    self._agendar_callback(abandonada["id"], abandonada["callback"])
+            tarefa = await asyncio.to_thread(self.fila.proxima)
+            if tarefa is None:
+                self._nova.clear()
+                try:
+                    # Sem aviso, confere a fila de tempos em tempos (outro processo pode enfileirar)
+                    await asyncio.wait_for(self._nova.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._executar(tarefa)
+
+    async def _renovar(self, tarefa_id: str):
+        """Renova a posse enquanto a tarefa roda (outra instância não a pega de volta)."""
+        while True:
+            await asyncio.sleep(self.fila.prazo_s / 4)
+            await asyncio.to_thread(self.fila.renovar, tarefa_id)
+
+    async def _executar(self, tarefa: dict):
+        tarefa_id = tarefa["id"]
+        renovacao = asyncio.create_task(self._renovar(tarefa_id))
+        try:
+            entrada = self.fila.entrada(tarefa_id)
+            dados, media_type, nome_arquivo = await self.processar(tarefa, entrada)
+            terminou = await asyncio.to_thread(self.fila.concluir, tarefa_id, dados, media_type, nome_arquivo)
+        except self.adiar:
+            await asyncio.to_thread(self.fila.devolver, tarefa_id)
+            await asyncio.sleep(self.espera_adiada)
+            return
+        except asyncio.CancelledError:
+            # Desligando: a tarefa volta para a fila e roda no próximo início
+            await asyncio.to_thread(self.fila.devolver, tarefa_id)
+            raise
+        except Exception as e:
+            terminou = await asyncio.to_thread(self.fila.falhar, tarefa_id, str(e))
+        finally:
+            renovacao.cancel()
+
+        # Sem a posse, quem avisa o cliente é a instância que está com a tarefa
+        if terminou and tarefa["callback"]:
+            self._agendar_callback(tarefa_id, tarefa["callback"])
+
+    def _agendar_callback(self, tarefa_id: str, url: str):
+        envio = asyncio.create_task(self._callback(tarefa_id, url))
+        self._callbacks.add(envio)
+        envio.add_done_callback(self._callbacks.discard)
+
+    async def _callback(self, tarefa_id: str, url: str):
+        tarefa = await asyncio.to_thread(self.fila.obter, tarefa_id)
+        corpo = {"id": tarefa_id, "estado": tarefa["estado"], "erro": tarefa["erro"]}
+        if tarefa["estado"] == CONCLUIDA and self.url_resultado is not None:
+            corpo["resultado"] = self.url_resultado(tarefa_id)
+        try:
+            # De novo no envio: o DNS pode ter mudado desde a criação da tarefa
+            await asyncio.to_thread(self.validar_callback, url)
+            await asyncio.to_thread(_notificar, url, corpo)
+            estado = "enviado"
+        except Exception as e:
+            estado = f"falhou: {e}"
+        await asyncio.to_thread(self.fila.registrar_callback, tarefa_id, estado)
+
+    async def _limpeza(self):
+        while True:
+            await asyncio.to_thread(self.fila.limpar, self.ttl_s)
+            await asyncio.sleep(600)
+
+
+def _pasta_dados() -> Path:
+    """Pasta persistente de dados da aplicação ($XDG_DATA_HOME/removebg, padrão ~/.local/share/removebg)."""
+    return Path(os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share") / "removebg"
+
+
+def config_do_ambiente() -> dict:
+    """
+    REMOVEBG_TAREFAS_DIR (<dados do usuário>/removebg/tarefas: $XDG_DATA_HOME ou ~/.local/share; a fila
+    precisa sobreviver a reinícios, então em contêiner aponte para um volume), REMOVEBG_TAREFAS_CONCORRENCIA (2),
+    REMOVEBG_TAREFAS_TTL_H (24), REMOVEBG_TAREFAS_PRAZO_S (60, sem renovar a posse por mais que isso a tarefa
+    volta à fila) e REMOVEBG_TAREFAS_TENTATIVAS (3, vezes que uma tarefa volta à fila antes de virar erro).
+    Callbacks: REMOVEBG_TAREFAS_CALLBACK_HOSTS (hosts aceitos, separados por vírgula; vazio aceita
+    qualquer host público) e REMOVEBG_TAREFAS_CALLBACK_PRIVADO (0; 1 aceita endereços internos).
+    """
+    return {
+        "pasta": os.environ.get("REMOVEBG_TAREFAS_DIR") or _pasta_dados() / "tarefas",
+        "prazo_s": float(os.environ.get("REMOVEBG_TAREFAS_PRAZO_S", 60)),
+        "max_tentativas": int(os.environ.get("REMOVEBG_TAREFAS_TENTATIVAS", 3)),
+        "concorrencia": int(os.environ.get("REMOVEBG_TAREFAS_CONCORRENCIA", 2)),
+        "ttl_s": float(os.environ.get("REMOVEBG_TAREFAS_TTL_H", 24)) * 3600,
+        "callback_hosts": frozenset(
+            host.strip().lower() for host in os.environ.get("REMOVEBG_TAREFAS_CALLBACK_HOSTS", "").split(",") if host.strip()
+        ),
+        "callback_rede_privada": os.environ.get("REMOVEBG_TAREFAS_CALLBACK_PRIVADO", "0") == "1",
+    }
@@ -0,0 +1,11 @@
+"""Os módulos ficam na raiz do repositório (sem pacote): coloca a raiz no sys.path."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# api.py cria a fila de tarefas no import: os testes não tocam na pasta de dados do usuário
+os.environ.setdefault("REMOVEBG_TAREFAS_DIR", tempfile.mkdtemp(prefix="removebg_testes_"))
@@ -0,0 +1,131 @@
+import asyncio
+import io
+
+from PIL import Image
+
+from cache import CacheDisco, CacheLRU, CacheResultados, chave_de_hash, chave_resultado, novo_hash
+
+
+def test_chave_depende_do_conteudo_e_das_opcoes():
+    assert chave_resultado(b"abc", modelo="u2net") == chave_resultado(b"abc", modelo="u2net")
+    assert chave_resultado(b"abc", modelo="u2net") != chave_resultado(b"abd", modelo="u2net")
+    assert chave_resultado(b"abc", modelo="u2net") != chave_resultado(b"abc", modelo="u2netp")
+
+
+def test_chave_de_hash_nao_altera_o_hash_do_arquivo():
+    resumo = novo_hash()
+    resumo.update(b"abc")
+    antes = resumo.hexdigest()
+    assert chave_de_hash(resumo, modelo="u2net") == chave_resultado(b"abc", modelo="u2net")
+    assert resumo.hexdigest() == antes
+
+
+def test_lru_descarta_o_usado_ha_mais_tempo():
+    lru = CacheLRU(max_bytes=10)
+    lru.put("a", b"1234")
+    lru.put("b", b"1234")
+    lru.get("a")
+    lru.put("c", b"1234")
+    assert lru.get("b") is None
+    assert lru.get("a") == b"1234" and lru.get("c") == b"1234"
+    assert lru.bytes == 8
+    lru.put("grande", b"x" * 11)
+    assert lru.get("grande") is None
+
+
+def test_disco_persiste_e_respeita_o_limite(tmp_path):
+    disco = CacheDisco(tmp_path, max_bytes=10)
+    disco.put("a", b"1234")
+    disco.put("b", b"1234")
+    assert CacheDisco(tmp_path, max_bytes=10).get("a") == b"1234"
+    disco.put("c", b"1234")
+    assert disco.get("a") is None
+    assert disco.bytes == 8
+
+
+def _cache(disco=None):
+    return CacheResultados(CacheLRU(1 << 20), disco)
+
+
+def test_pedidos_iguais_simultaneos_calculam_uma_vez():
+    cache = _cache()
+    calculos = 0
+
+    async def calcular():
+        nonlocal calculos
+        calculos += 1
+        await asyncio.sleep(0.05)
+        return b"resultado"
+
+    async def rodar():
+        return await asyncio.gather(*(cache.obter_ou_calcular("k", calcular) for _ in range(3)))
+
+    resultados = asyncio.run(rodar())
+    assert calculos == 1
+    assert [v for v, _ in resultados] == [b"resultado"] * 3
+    assert sorted(o for _, o in resultados) == ["calculado", "compartilhado", "compartilhado"]
+    assert asyncio.run(cache.obter_ou_calcular("k", calcular)) == (b"resultado", "memoria")
+
+
+def test_pedidos_iguais_durante_a_leitura_do_disco_nao_recalculam(tmp_path):
+    disco = CacheDisco(tmp_path, max_bytes=1 << 20)
+    disco.put("k", b"do disco")
+    cache = _cache(disco)
+
+    async def calcular():
+        raise AssertionError("não devia calcular")
+
+    async def rodar():
+        return await asyncio.gather(*(cache.obter_ou_calcular("k", calcular) for _ in range(3)))
+
+    origens = sorted(o for _, o in asyncio.run(rodar()))
+    assert origens == ["compartilhado", "compartilhado", "disco"]
+
+
+def test_falha_ao_gravar_no_disco_nao_derruba_o_pedido(tmp_path, caplog):
+    disco = CacheDisco(tmp_path, max_bytes=1 << 20)
+
+    def put(chave, valor):
+        raise OSError("disco cheio")
+
+    disco.put = put
+    cache = _cache(disco)
+
+    async def calcular():
+        return b"resultado"
+
+    assert asyncio.run(cache.obter_ou_calcular("k", calcular)) == (b"resultado", "calculado")
+    assert "cache em disco" in caplog.text
+    assert not cache._em_andamento
+
+
+def test_etag_e_if_none_match(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import api
+
+    chamadas = []
+
+    def processar(contents, modelo, **opcoes):
+        chamadas.append(modelo)
+        return b"png", {}, 0.0
+
+    monkeypatch.setattr(api, "_processar", processar)
+    png = io.BytesIO()
+    Image.new("RGB", (7, 5), (1, 2, 3)).save(png, format="PNG")
+    arquivos = {"file": ("x.png", png.getvalue(), "image/png")}
+    cliente = TestClient(api.app)
+
+    primeira = cliente.post("/api/remove", files=arquivos, data={"modelo": "u2netp"})
+    assert primeira.status_code == 200
+    etag = primeira.headers["ETag"]
+
+    repetida = cliente.post(
+        "/api/remove", files=arquivos, data={"modelo": "u2netp"}, headers={"If-None-Match": etag}
+    )
+    assert repetida.status_code == 304
+    assert repetida.headers["ETag"] == etag
+
+    outra_opcao = cliente.post("/api/remove", files=arquivos, data={"modelo": "u2netp", "formato": "webp"})
+    assert outra_opcao.headers["ETag"] != etag
+    assert len(chamadas) == 2
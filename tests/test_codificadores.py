@@ -0,0 +1,33 @@
+import pytest
+
+from codificadores import CODIFICADORES, negociar
+
+
+@pytest.mark.parametrize(
+    "accept, esperado",
+    [
+        (None, "png"),
+        ("", "png"),
+        ("image/webp", "webp"),
+        ("image/png, image/webp", "png"),
+        ("image/png;q=0.5, image/webp", "webp"),
+        ("image/*", "png"),
+        ("image/*;q=0.8, image/png;q=0.1", "webp"),
+        ("*/*", "png"),
+        ("application/json", "png"),
+        ("text/html, image/webp;q=0.9, */*;q=0.1", "webp"),
+        ("image/webp;q=abc", "png"),
+    ],
+)
+def test_negociacao_pelo_accept(accept, esperado):
+    assert negociar(None, accept).nome == esperado
+
+
+@pytest.mark.parametrize("accept", ["image/png;q=0", "image/*;q=0", "image/webp;q=0, image/png;q=0"])
+def test_accept_que_exclui_todos_os_formatos_da_406(accept):
+    assert negociar(None, accept) is None
+
+
+def test_formato_explicito_ganha_do_accept():
+    assert negociar("WEBP-LOSSY", "image/png") is CODIFICADORES["webp-lossy"]
+    assert negociar("jpeg", "image/png") is None
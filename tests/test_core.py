@@ -0,0 +1,36 @@
+import io
+import time
+
+import pytest
+from PIL import Image
+
+import core
+
+
+@pytest.fixture(autouse=True)
+def sem_modelo(monkeypatch):
+    monkeypatch.setattr(core, "etapa_recorte", lambda inferencia, modelo, alpha_matting: inferencia.convert("RGBA"))
+
+
+def _girada() -> Image.Image:
+    exif = Image.Exif()
+    exif[0x0112] = 6  # girar 90° no sentido horário
+    saida = io.BytesIO()
+    Image.new("RGB", (400, 200)).save(saida, format="JPEG", exif=exif)
+    return Image.open(saida)
+
+
+def test_inferencia_e_saida_orientadas():
+    assert core.preparar_inferencia(_girada(), 100).size == (50, 100)
+    assert core.remover_fundo(_girada(), max_size=100).size == (50, 100)
+    assert core.remover_fundo(_girada(), max_size=100, tamanho_saida=0).size == (200, 400)
+
+
+def test_redimensionamento_nao_conta_em_dobro():
+    img = Image.effect_noise((1600, 1200), 40).convert("RGB")
+    with core.medindo_etapas() as tempos:
+        t0 = time.perf_counter()
+        core.remover_fundo(img, max_size=400, tamanho_saida=800)
+        total = time.perf_counter() - t0
+    assert tempos["redimensionamento"] > 0
+    assert sum(tempos.values()) <= total
@@ -0,0 +1,43 @@
+import io
+import json
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import api
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setattr(api, "remover_fundo", lambda img, **opcoes: img.convert("RGBA"))
+    return TestClient(api.app)
+
+
+def _png() -> bytes:
+    saida = io.BytesIO()
+    Image.new("RGB", (9, 4), "red").save(saida, format="PNG")
+    return saida.getvalue()
+
+
+def test_arquivo_que_nao_e_imagem_da_400_sem_detalhes_internos(cliente):
+    resposta = cliente.post("/api/remove", files={"file": ("x.png", b"nao sou imagem", "image/png")})
+    assert resposta.status_code == 400
+    assert resposta.json()["detail"] == "Imagem inválida: formato de imagem não reconhecido"
+
+
+def test_lote_registra_erro_limpo_por_arquivo(cliente):
+    arquivos = [
+        ("files", ("ruim.png", b"nao sou imagem", "image/png")),
+        ("files", ("boa.png", _png(), "image/png")),
+    ]
+    resposta = cliente.post("/api/remove/batch", files=arquivos, data={"modelo": "u2netp"})
+    assert resposta.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(resposta.content)) as pacote:
+        manifesto = json.loads(pacote.read("manifesto.json"))
+    itens = {item["arquivo"]: item for item in manifesto["arquivos"]}
+    assert itens["boa.png"]["status"] == "ok"
+    assert itens["ruim.png"]["status"] == "erro"
+    assert itens["ruim.png"]["erro"] == "Imagem inválida: formato de imagem não reconhecido"
+    assert manifesto["erros"] == 1
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+import pytest
+
+from executor import ExecutorInferencia, FilaCheia, _ler_limites
+
+
+def test_ler_limites():
+    assert _ler_limites("birefnet-general=1, u2netp=4,lixo,x=0") == {"birefnet-general": 1, "u2netp": 4, "x": 1}
+    assert _ler_limites(None) == {}
+
+
+def test_capacidade_e_limite_vezes_lote():
+    executor = ExecutorInferencia(limites={"m": 2}, lote=4)
+    assert executor.limite("m") == 2
+    assert executor.capacidade("m") == 8
+    assert executor.capacidade("desconhecido") == 4
+
+
+def test_processos_recusam_micro_lotes():
+    with pytest.raises(ValueError):
+        ExecutorInferencia(tipo="process", lote=2)
+
+
+def test_admissao_respeita_capacidade_e_fila():
+    executor = ExecutorInferencia(limites={"m": 1}, lote=2, fila_max=1, workers=4)
+    liberar = threading.Event()
+
+    async def rodar():
+        rodando = [asyncio.create_task(executor.executar("m", liberar.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        esperando = asyncio.create_task(executor.executar("m", liberar.wait))
+        await asyncio.sleep(0.05)
+        stats = executor.estatisticas()["m"]
+        with pytest.raises(FilaCheia) as erro:
+            await executor.executar("m", liberar.wait)
+        # Outro modelo tem a própria capacidade
+        assert await executor.executar("outro", lambda: 42) == 42
+        liberar.set()
+        await asyncio.gather(*rodando, esperando)
+        return stats, erro.value
+
+    try:
+        stats, erro = asyncio.run(rodar())
+    finally:
+        liberar.set()
+        executor.fechar()
+    assert stats == {"rodando": 2, "na_fila": 1, "limite": 1, "capacidade": 2}
+    assert erro.modelo == "m" and erro.retry_after == executor.retry_after
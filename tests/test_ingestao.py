@@ -0,0 +1,56 @@
+import io
+
+import pytest
+from PIL import Image
+
+from ingestao import ImagemGrandeDemais, abrir_com_dimensoes, abrir_imagem, tamanho_reduzido, verificar_dimensoes
+
+
+def _codificada(tamanho, formato="JPEG", **opcoes) -> bytes:
+    saida = io.BytesIO()
+    Image.new("RGB", tamanho, (200, 30, 30)).save(saida, format=formato, **opcoes)
+    return saida.getvalue()
+
+
+def test_tamanho_reduzido():
+    assert tamanho_reduzido(4000, 3000, 1000) == (1000, 750)
+    assert tamanho_reduzido(800, 600, 1000) == (800, 600)
+    assert tamanho_reduzido(800, 600, None) == (800, 600)
+
+
+def test_acima_do_limite_de_pixels_falha_so_pelo_cabecalho():
+    png = _codificada((3000, 2000), "PNG")
+    with pytest.raises(ImagemGrandeDemais):
+        verificar_dimensoes(png, max_pixels=5_000_000)
+    assert verificar_dimensoes(png, max_pixels=6_000_000) == (3000, 2000)
+
+
+def test_jpeg_reduzido_na_decodificacao_passa_do_limite_de_pixels():
+    jpeg = _codificada((4000, 3000))
+    with pytest.raises(ImagemGrandeDemais):
+        abrir_imagem(jpeg, max_pixels=4_000_000)
+    # Com max_size o draft decodifica em 1/4: 1000x750 cabe no limite
+    img, original = abrir_com_dimensoes(jpeg, max_size=1000, max_pixels=4_000_000)
+    assert original == (4000, 3000)
+    assert img.size == (1000, 750) and img.mode == "RGB"
+
+
+def test_png_sem_reducao_na_decodificacao_continua_limitado():
+    png = _codificada((3000, 2000), "PNG")
+    with pytest.raises(ImagemGrandeDemais, match="sem redução"):
+        abrir_imagem(png, max_size=500, max_pixels=5_000_000)
+
+
+def test_bomba_de_descompressao_vira_imagem_grande_demais(monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(ImagemGrandeDemais):
+        abrir_imagem(_codificada((100, 100), "PNG"))
+
+
+def test_orientacao_exif_aplicada():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # girar 90° no sentido horário
+    jpeg = _codificada((400, 200), exif=exif)
+    img, original = abrir_com_dimensoes(jpeg)
+    assert original == (400, 200)
+    assert img.size == (200, 400)
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lotes import AgendadorLotes
+
+
+def test_pedidos_simultaneos_viram_um_lote():
+    tamanhos = []
+
+    def fn_lote(entradas, modelo):
+        tamanhos.append(len(entradas))
+        return [e * 2 for e in entradas]
+
+    agendador = AgendadorLotes(fn_lote, max_lote=4, espera_ms=200)
+    with ThreadPoolExecutor(4) as pool:
+        saidas = list(pool.map(lambda e: agendador.prever("m", e), range(4)))
+
+    assert saidas == [0, 2, 4, 6]
+    assert tamanhos == [4]
+    assert agendador.estatisticas() == {"lotes": 1, "imagens": 4, "media_por_lote": 4.0}
+
+
+def test_lote_nao_passa_de_max_lote():
+    tamanhos = []
+
+    def fn_lote(entradas, modelo):
+        tamanhos.append(len(entradas))
+        return entradas
+
+    agendador = AgendadorLotes(fn_lote, max_lote=2, espera_ms=100)
+    with ThreadPoolExecutor(5) as pool:
+        assert sorted(pool.map(lambda e: agendador.prever("m", e), range(5))) == list(range(5))
+    assert max(tamanhos) <= 2 and sum(tamanhos) == 5
+
+
+def test_paralelos_limita_lotes_simultaneos_do_modelo():
+    rodando = pico = 0
+    lock = threading.Lock()
+
+    def fn_lote(entradas, modelo):
+        nonlocal rodando, pico
+        with lock:
+            rodando += 1
+            pico = max(pico, rodando)
+        time.sleep(0.05)
+        with lock:
+            rodando -= 1
+        return entradas
+
+    agendador = AgendadorLotes(fn_lote, max_lote=2, espera_ms=0, paralelos=lambda modelo: 2)
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda e: agendador.prever("m", e), range(8)))
+    assert pico == 2
+
+
+def test_saidas_a_menos_falham_todos_os_pedidos_do_lote():
+    agendador = AgendadorLotes(lambda entradas, modelo: entradas[:1], max_lote=3, espera_ms=200)
+    with ThreadPoolExecutor(3) as pool:
+        futuros = [pool.submit(agendador.prever, "m", e) for e in range(3)]
+        for futuro in futuros:
+            with pytest.raises(RuntimeError):
+                futuro.result(timeout=5)
+
+
+def test_erro_no_lote_chega_a_cada_pedido_e_o_laco_continua():
+    falhar = True
+
+    def fn_lote(entradas, modelo):
+        if falhar:
+            raise ValueError("quebrou")
+        return entradas
+
+    agendador = AgendadorLotes(fn_lote, max_lote=2, espera_ms=0)
+    with pytest.raises(ValueError):
+        agendador.prever("m", 1)
+    falhar = False
+    assert agendador.prever("m", 2) == 2
@@ -0,0 +1,66 @@
+import os
+
+from PIL import Image
+
+import remove_bg
+from manifesto import NOME_ARQUIVO, Manifesto, hash_arquivo, ler_arquivo
+
+
+def test_manifesto_sobrevive_a_linha_cortada(tmp_path):
+    entrada = tmp_path / "a.png"
+    entrada.write_bytes(b"a")
+    (tmp_path / "a_sem_fundo.png").write_bytes(b"saida")
+    dados, assinatura = ler_arquivo(entrada)
+    Manifesto(tmp_path, {"modelo": "u2net"}).registrar("a.png", assinatura, hash_arquivo(dados), "a_sem_fundo.png")
+    with open(tmp_path / NOME_ARQUIVO, "a", encoding="utf-8") as f:
+        f.write('{"entrada": "b.png", "tama')  # interrupção no meio da gravação
+
+    manifesto = Manifesto(tmp_path, {"modelo": "u2net"})
+    assert len(manifesto) == 1
+    assert manifesto.inalterado("a.png", entrada)
+    assert not Manifesto(tmp_path, {"modelo": "u2netp"}).inalterado("a.png", entrada)
+
+    (tmp_path / "a_sem_fundo.png").unlink()
+    assert not manifesto.inalterado("a.png", entrada)
+
+
+def _pasta(tmp_path, monkeypatch):
+    processadas = []
+
+    def remover(img, modelo, *args):
+        processadas.append(img.size)
+        return img.convert("RGBA")
+
+    monkeypatch.setattr(remove_bg, "_remover_imagem", remover)
+    entrada = tmp_path / "entrada"
+    (entrada / "sub").mkdir(parents=True)
+    Image.new("RGB", (8, 8), "red").save(entrada / "a.png")
+    Image.new("RGB", (6, 6), "blue").save(entrada / "sub" / "b.png")
+    return entrada, tmp_path / "saida", processadas
+
+
+def test_pasta_retoma_sem_reprocessar(tmp_path, monkeypatch):
+    entrada, saida, processadas = _pasta(tmp_path, monkeypatch)
+
+    def processar(**opcoes):
+        return remove_bg.processar_pasta(entrada, saida, modelo="u2netp", workers=2, **opcoes)
+
+    assert processar() == 2
+    assert (saida / "a_sem_fundo.png").exists() and (saida / "sub" / "b_sem_fundo.png").exists()
+    assert processar() == 0
+
+    # Só o mtime mudou: o conteúdo é o mesmo, a inferência não roda
+    st = (entrada / "a.png").stat()
+    os.utime(entrada / "a.png", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert processar() == 0
+    assert len(processadas) == 2
+
+    Image.new("RGB", (8, 8), "green").save(entrada / "a.png")
+    assert processar() == 1
+
+    (saida / "sub" / "b_sem_fundo.png").unlink()
+    assert processar() == 1
+
+    assert processar(formato="webp") == 2
+    assert processar(refazer=True, formato="webp") == 2
+    assert len(processadas) == 8
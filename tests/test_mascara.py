@@ -0,0 +1,75 @@
+import numpy as np
+
+from mascara import caixa_objeto, contornos, descrever_mascara, quantizar_alpha, rle
+
+
+def _quadrado() -> np.ndarray:
+    """Objeto opaco nas colunas 10..29 e linhas 5..14 de uma imagem 40x20."""
+    alpha = np.zeros((20, 40), np.uint8)
+    alpha[5:15, 10:30] = 255
+    return alpha
+
+
+def _decodificar_rle(carreiras: list[int], forma) -> np.ndarray:
+    valores, comprimentos = carreiras[0::2], carreiras[1::2]
+    return np.repeat(np.array(valores, np.uint8), comprimentos).reshape(forma)
+
+
+def test_rle_mantem_a_borda_suave():
+    alpha = _quadrado()
+    alpha[8, 15] = 0  # furo
+    alpha[5:15, 9] = 90  # borda semitransparente
+    alpha[5:15, 30] = 200
+    carreiras = rle(alpha)
+    assert sum(carreiras[1::2]) == alpha.size
+    assert (_decodificar_rle(carreiras, alpha.shape) == alpha).all()
+
+
+def test_rle_junta_pixels_iguais():
+    assert rle(np.full((2, 3), 255, np.uint8)) == [255, 6]
+    assert rle(np.array([[0, 0, 7], [7, 7, 0]], np.uint8)) == [0, 2, 7, 3, 0, 1]
+    assert rle(np.zeros((0, 3), np.uint8)) == []
+
+
+def test_niveis_quantizam_o_alpha():
+    alpha = np.array([[0, 60, 127, 128, 200, 255]], np.uint8)
+    assert quantizar_alpha(alpha, 2).tolist() == [[0, 0, 0, 255, 255, 255]]
+    assert set(np.unique(quantizar_alpha(np.arange(256, dtype=np.uint8), 16))) <= set(range(0, 256, 17))
+    assert quantizar_alpha(alpha, 256) is alpha
+    assert rle(alpha, niveis=2) == [0, 3, 255, 3]
+
+
+def test_caixa_ignora_residuo_quase_transparente():
+    alpha = _quadrado()
+    alpha[0, 0] = 5
+    assert caixa_objeto(alpha) == (10, 5, 30, 15)
+    assert caixa_objeto(np.zeros((4, 4), np.uint8)) is None
+
+
+def test_contorno_do_quadrado_nas_arestas_dos_pixels():
+    # Sem simplificação: os cantos saem chanfrados em meio pixel, os lados ficam nas arestas
+    (poligono,) = contornos(_quadrado(), tolerancia=0)
+    xs = [x for x, _ in poligono]
+    ys = [y for _, y in poligono]
+    assert (min(xs), max(xs)) == (10, 30)
+    assert (min(ys), max(ys)) == (5, 15)
+    assert poligono[0] == poligono[-1]
+
+
+def test_descrever_mascara_so_dentro_da_caixa():
+    alpha = _quadrado()
+    descricao = descrever_mascara(alpha, "rle")
+    assert descricao["caixa"] == [10, 5, 30, 15]
+    assert descricao["mascara"]["carreiras"] == [255, 200]
+    assert descricao["mascara"]["niveis"] == 256
+
+    descricao = descrever_mascara(alpha, "contornos")
+    xs = [x for poligono in descricao["mascara"]["poligonos"] for x, _ in poligono]
+    assert 10 <= min(xs) <= 10.5 and 29.5 <= max(xs) <= 30
+
+    assert descrever_mascara(np.zeros((3, 3), np.uint8), "rle") == {
+        "largura": 3,
+        "altura": 3,
+        "caixa": None,
+        "mascara": None,
+    }
@@ -0,0 +1,46 @@
+import threading
+import time
+
+from pipeline import Estagio, executar
+
+
+def test_todos_os_itens_passam_por_todos_os_estagios():
+    estagios = [Estagio("dobro", lambda x: x * 2, workers=3), Estagio("mais_um", lambda x: x + 1, workers=2)]
+    resultados = list(executar(range(50), estagios))
+    assert sorted(r.valor for r in resultados) == [2 * i + 1 for i in range(50)]
+    assert all(r.erro is None for r in resultados)
+
+
+def test_erro_nao_para_o_pipeline():
+    vistos = []
+
+    def falhar_no_tres(x):
+        if x == 3:
+            raise ValueError("três")
+        return x
+
+    estagios = [Estagio("checar", falhar_no_tres, workers=2), Estagio("anotar", vistos.append)]
+    resultados = {r.item: r for r in executar(range(6), estagios)}
+    assert len(resultados) == 6
+    assert isinstance(resultados[3].erro, ValueError) and resultados[3].estagio == "checar"
+    assert sorted(vistos) == [0, 1, 2, 4, 5]
+
+
+def test_filas_limitadas_seguram_a_leitura():
+    lidos = 0
+
+    def itens():
+        nonlocal lidos
+        for i in range(100):
+            lidos += 1
+            yield i
+
+    liberar = threading.Event()
+    saida = executar(itens(), [Estagio("lento", lambda x: liberar.wait() and x)], capacidade=2)
+    primeiro = threading.Thread(target=lambda: next(saida))
+    primeiro.start()
+    time.sleep(0.1)
+    assert lidos <= 5
+    liberar.set()
+    primeiro.join()
+    saida.close()
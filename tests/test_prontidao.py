@@ -0,0 +1,31 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import api
+import core
+from sessoes import GerenciadorSessoes
+
+
+def test_ready_sem_precarregar_espera_o_modelo_padrao(monkeypatch):
+    monkeypatch.delenv("REMOVEBG_PRECARREGAR", raising=False)
+    aquecidos = []
+    monkeypatch.setattr(core, "_sessions", GerenciadorSessoes(lambda modelo: object()))
+    monkeypatch.setattr(core, "aquecer", aquecidos.append)
+    monkeypatch.setattr(api, "prontidao", api.Prontidao())
+    cliente = TestClient(api.app)
+
+    carregando = cliente.get("/api/ready")
+    assert carregando.status_code == 503
+    assert carregando.json()["modelos"] == [core.MODELO_PADRAO]
+
+    asyncio.run(api.prontidao.carregar())
+    pronto = cliente.get("/api/ready")
+    assert pronto.status_code == 200
+    assert pronto.json()["carregados"] == [core.MODELO_PADRAO]
+    assert aquecidos == [core.MODELO_PADRAO]
+
+
+def test_ready_com_precarregar(monkeypatch):
+    monkeypatch.setenv("REMOVEBG_PRECARREGAR", "u2net, birefnet-general")
+    assert core.modelos_iniciais() == ["u2net", "birefnet-general"]
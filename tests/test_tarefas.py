@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from tarefas import CONCLUIDA, ERRO, NA_FILA, PROCESSANDO, FilaTarefas, validar_callback
+
+
+@pytest.fixture
+def filas(tmp_path):
+    """Duas instâncias (dois workers) dividindo a mesma pasta, com prazo curto de posse."""
+    return (
+        FilaTarefas(tmp_path, prazo_s=0.2, max_tentativas=2),
+        FilaTarefas(tmp_path, prazo_s=0.2, max_tentativas=2),
+    )
+
+
+def test_tarefa_com_posse_nao_e_pega_por_outra_instancia(filas):
+    a, b = filas
+    tarefa_id = a.enfileirar("u2net", b"imagem", {"max_size": 10})
+    tarefa = a.proxima()
+    assert tarefa["id"] == tarefa_id
+    assert b.proxima() is None
+    time.sleep(0.15)
+    assert a.renovar(tarefa_id)
+    time.sleep(0.1)
+    assert b.proxima() is None
+
+    assert a.concluir(tarefa_id, b"png", "image/png", "x.png")
+    assert a.obter(tarefa_id)["estado"] == CONCLUIDA
+    assert a.resultado(tarefa_id) is not None
+
+
+def test_posse_vencida_volta_para_a_fila_e_o_dono_antigo_nao_grava(filas):
+    a, b = filas
+    tarefa_id = a.enfileirar("u2net", b"imagem", {})
+    a.proxima()
+    time.sleep(0.3)
+    assert b.recuperar() == []
+    assert b.proxima()["id"] == tarefa_id
+
+    assert not a.concluir(tarefa_id, b"png", "image/png", "x.png")
+    assert not a.falhar(tarefa_id, "erro")
+    assert not a.renovar(tarefa_id)
+    assert a.obter(tarefa_id)["estado"] == PROCESSANDO
+    with open(a.entrada(tarefa_id), "rb") as f:
+        assert f.read() == b"imagem"
+
+    assert b.concluir(tarefa_id, b"png", "image/png", "x.png")
+    assert b.obter(tarefa_id)["estado"] == CONCLUIDA
+
+
+def test_tarefa_que_derruba_o_worker_vira_erro_apos_max_tentativas(filas):
+    a, b = filas
+    tarefa_id = a.enfileirar("u2net", b"imagem", {}, callback="https://exemplo.com/cb")
+    a.proxima()
+    time.sleep(0.3)
+    b.recuperar()
+    b.proxima()
+    time.sleep(0.3)
+    abandonadas = a.recuperar()
+    assert abandonadas == [{"id": tarefa_id, "callback": "https://exemplo.com/cb"}]
+    tarefa = a.obter(tarefa_id)
+    assert tarefa["estado"] == ERRO and "2 tentativa" in tarefa["erro"]
+    assert a.proxima() is None
+
+
+def test_devolver_mantem_a_posicao_e_nao_conta_tentativa(filas):
+    a, _ = filas
+    primeira = a.enfileirar("u2net", b"1", {})
+    a.enfileirar("u2net", b"2", {})
+    a.proxima()
+    a.devolver(primeira)
+    tarefa = a.obter(primeira)
+    assert tarefa["estado"] == NA_FILA and tarefa["tentativas"] == 0
+    assert a.proxima()["id"] == primeira
+
+
+@pytest.mark.parametrize(
+    "url",
+    ["ftp://exemplo.com/cb", "http://127.0.0.1/cb", "http://10.0.0.1/cb", "http://169.254.169.254/", "http://[::1]/"],
+)
+def test_callback_recusa_esquemas_e_enderecos_internos(url):
+    with pytest.raises(ValueError):
+        validar_callback(url)
+
+
+def test_callback_com_lista_de_hosts():
+    validar_callback("http://interno.local/cb", frozenset({"interno.local"}))
+    with pytest.raises(ValueError):
+        validar_callback("http://outro.local/cb", frozenset({"interno.local"}))
+    validar_callback("http://10.0.0.1/cb", rede_privada=True)
@@ -0,0 +1,68 @@
+import io
+import tempfile
+
+import pytest
+from PIL import Image
+
+from cache import chave_resultado
+from ingestao import abrir_imagem, verificar_dimensoes
+from tarefas import FilaTarefas
+from uploads import UploadGrandeDemais, ler_upload
+
+
+def _spool(dados: bytes, max_size: int = 1024):
+    """Como o Starlette guarda cada arquivo do formulário."""
+    arquivo = tempfile.SpooledTemporaryFile(max_size=max_size)
+    arquivo.write(dados)
+    return arquivo
+
+
+def _jpeg(tamanho=(300, 200)) -> bytes:
+    saida = io.BytesIO()
+    Image.effect_noise(tamanho, 50).convert("RGB").save(saida, format="JPEG", quality=95)
+    return saida.getvalue()
+
+
+def test_pequeno_fica_em_memoria():
+    entrada = ler_upload(_spool(b"abc"), max_bytes=100, em_memoria=10)
+    assert entrada.fonte == b"abc" and entrada.tamanho == 3
+    assert entrada.chave(modelo="m") == chave_resultado(b"abc", modelo="m")
+
+
+def test_grande_vai_para_um_temporario(tmp_path):
+    dados = b"x" * 5000
+    entrada = ler_upload(_spool(dados), max_bytes=10_000, em_memoria=10, pasta=str(tmp_path))
+    assert isinstance(entrada.fonte, str) and entrada.bytes() == dados
+    entrada.descartar()
+    assert not list(tmp_path.iterdir())
+
+
+def test_acima_do_limite_nao_deixa_temporario(tmp_path):
+    with pytest.raises(UploadGrandeDemais):
+        ler_upload(_spool(b"x" * 5000), max_bytes=4000, em_memoria=10, pasta=str(tmp_path))
+    assert not list(tmp_path.iterdir())
+
+
+def test_upload_ja_em_disco_e_usado_sem_copia(tmp_path):
+    dados = _jpeg()
+    arquivo = _spool(dados)
+    entrada = ler_upload(arquivo, max_bytes=len(dados), em_memoria=10, pasta=str(tmp_path), usar_arquivo=True)
+    assert entrada.fonte is arquivo
+    assert not list(tmp_path.iterdir())
+    assert entrada.chave(modelo="m") == chave_resultado(dados, modelo="m")
+
+    # Lido do início a cada abertura, como a API faz (cabeçalho, depois a imagem)
+    assert verificar_dimensoes(entrada.fonte) == (300, 200)
+    assert abrir_imagem(entrada.fonte).size == (300, 200)
+    assert entrada.bytes() == dados
+
+    fila = FilaTarefas(tmp_path / "fila")
+    tarefa_id = fila.enfileirar("u2net", entrada.fonte, {})
+    with open(fila.entrada(tarefa_id), "rb") as f:
+        assert f.read() == dados
+
+
+def test_upload_em_memoria_no_starlette_continua_copiado():
+    dados = b"x" * 500
+    entrada = ler_upload(_spool(dados), max_bytes=1000, em_memoria=1000, usar_arquivo=True)
+    assert entrada.fonte == dados
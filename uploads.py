@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Arquivos enviados à API sem carregar tudo na memória.
+O corpo do pedido é limitado enquanto chega (413 antes de terminar o upload) e cada
+arquivo é lido em pedaços: o hash do cache sai na mesma passada, uploads pequenos
+ficam em memória e os grandes vão para um arquivo temporário no disco (ou, se o
+Starlette já os passou para o disco, são usados direto de lá).
+"""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import IO
+
+from starlette.exceptions import HTTPException
+
+from cache import chave_de_hash, novo_hash
+
+PEDACO = 1024 * 1024
+
+
+class UploadGrandeDemais(Exception):
+    """Arquivo ou corpo do pedido acima do limite configurado."""
+
+    def __init__(self, limite: int):
+        super().__init__(f"Arquivo acima do limite de {limite / 1024 / 1024:.0f} MB")
+        self.limite = limite
+
+
+class Entrada:
+    """
+    Arquivo recebido: `fonte` são os bytes (uploads pequenos), o caminho de um arquivo
+    temporário ou o próprio arquivo do upload já em disco, todos aceitos por
+    ingestao.abrir_imagem. Só bytes e caminhos passam para o executor de processos.
+    """
+
+    def __init__(self, fonte: bytes | str | IO[bytes], tamanho: int, resumo):
+        self.fonte = fonte
+        self.tamanho = tamanho
+        self._resumo = resumo
+
+    def chave(self, **opcoes) -> str:
+        """Mesma chave que cache.chave_resultado daria para os bytes do arquivo."""
+        return chave_de_hash(self._resumo, **opcoes)
+
+    def bytes(self) -> bytes:
+        if isinstance(self.fonte, bytes):
+            return self.fonte
+        if isinstance(self.fonte, str):
+            return Path(self.fonte).read_bytes()
+        self.fonte.seek(0)
+        return self.fonte.read()
+
+    def descartar(self):
+        # O arquivo do upload é do Starlette, que o fecha no fim do pedido
+        if isinstance(self.fonte, str):
+            Path(self.fonte).unlink(missing_ok=True)
+
+
+def ler_upload(
+    arquivo: IO[bytes], max_bytes: int, em_memoria: int, pasta: str | None = None, usar_arquivo: bool = False
+) -> Entrada:
+    """
+    Lê `arquivo` em pedaços de 1 MB calculando o hash; passa de `max_bytes` = UploadGrandeDemais.
+    Até `em_memoria` bytes devolve os bytes; acima disso copia para um temporário em `pasta`.
+
+    Com `usar_arquivo`, um upload que o Starlette já passou para o disco é a própria fonte:
+    só o hash é lido, sem a segunda cópia. A fonte é então um arquivo aberto, que só serve
+    a quem lê no mesmo processo (executor de threads, fila de tarefas).
+    """
+    arquivo.seek(0)
+    # SpooledTemporaryFile que passou do limite em memória (o Starlette consulta o mesmo atributo)
+    direto = usar_arquivo and getattr(arquivo, "_rolled", False)
+    resumo = novo_hash()
+    tamanho = 0
+    partes: list[bytes] = []
+    destino = None
+    try:
+        while pedaco := arquivo.read(PEDACO):
+            tamanho += len(pedaco)
+            if tamanho > max_bytes:
+                raise UploadGrandeDemais(max_bytes)
+            resumo.update(pedaco)
+            if direto:
+                continue
+            if destino is None and tamanho > em_memoria:
+                destino = tempfile.NamedTemporaryFile(prefix="removebg_upload_", dir=pasta, delete=False)
+                destino.writelines(partes)
+                partes.clear()
+            if destino is not None:
+                destino.write(pedaco)
+            else:
+                partes.append(pedaco)
+    except BaseException:
+        if destino is not None:
+            destino.close()
+            Path(destino.name).unlink(missing_ok=True)
+        raise
+    if direto:
+        arquivo.seek(0)
+        return Entrada(arquivo, tamanho, resumo)
+    if destino is not None:
+        destino.close()
+        return Entrada(destino.name, tamanho, resumo)
+    return Entrada(b"".join(partes), tamanho, resumo)
+
+
+def entrada_em_disco(caminho: str) -> Entrada:
+    """Entrada para um arquivo que já está em disco (ex: tarefa da fila), com o hash lido em pedaços."""
+    resumo = novo_hash()
+    tamanho = 0
+    with open(caminho, "rb") as f:
+        while pedaco := f.read(PEDACO):
+            tamanho += len(pedaco)
+            resumo.update(pedaco)
+    return Entrada(caminho, tamanho, resumo)
+
+
+class LimiteCorpo:
+    """
+    Middleware ASGI: recusa com 413 pedidos cujo corpo passa do limite da rota, pelo
+    Content-Length ou contando os bytes enquanto chegam (uploads sem Content-Length).
+    `limites` = {prefixo da rota: bytes}; o prefixo mais longo que casar vale.
+    """
+
+    def __init__(self, app, limites: dict[str, int], ao_recusar=None):
+        self.app = app
+        self.limites = sorted(limites.items(), key=lambda item: -len(item[0]))
+        self.ao_recusar = ao_recusar
+
+    def _limite(self, caminho: str) -> int | None:
+        return next((limite for prefixo, limite in self.limites if caminho.startswith(prefixo)), None)
+
+    async def _recusar(self, send, limite: int):
+        if self.ao_recusar is not None:
+            self.ao_recusar()
+        corpo = json.dumps({"detail": str(UploadGrandeDemais(limite))}, ensure_ascii=False).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": corpo})
+
+    async def __call__(self, scope, receive, send):
+        limite = self._limite(scope["path"]) if scope["type"] == "http" else None
+        if limite is None:
+            return await self.app(scope, receive, send)
+
+        declarado = dict(scope["headers"]).get(b"content-length")
+        if declarado is not None and declarado.isdigit() and int(declarado) > limite:
+            return await self._recusar(send, limite)
+
+        recebidos = 0
+
+        async def receber():
+            nonlocal recebidos
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                recebidos += len(mensagem.get("body", b""))
+                if recebidos > limite:
+                    if self.ao_recusar is not None:
+                        self.ao_recusar()
+                    # Levantada durante a leitura do formulário: o FastAPI responde o 413
+                    raise HTTPException(413, str(UploadGrandeDemais(limite)))
+            return mensagem
+
+        await self.app(scope, receber, send)
+
+
+def config_do_ambiente() -> dict:
+    """
+    REMOVEBG_UPLOAD_MAX_MB (25, por arquivo e por pedido), REMOVEBG_UPLOAD_LOTE_MAX_MB
+    (512, corpo de /api/remove/batch), REMOVEBG_UPLOAD_MEMORIA_MB (1, acima disso vai
+    para o disco), REMOVEBG_UPLOAD_DIR (pasta temporária do sistema) e
+    REMOVEBG_MAX_MEGAPIXELS (40, pixels decodificados por imagem).
+    """
+    mb = 1024 * 1024
+    return {
+        "max_bytes": int(float(os.environ.get("REMOVEBG_UPLOAD_MAX_MB", 25)) * mb),
+        "max_bytes_lote": int(float(os.environ.get("REMOVEBG_UPLOAD_LOTE_MAX_MB", 512)) * mb),
+        "em_memoria": int(float(os.environ.get("REMOVEBG_UPLOAD_MEMORIA_MB", 1)) * mb),
+        "pasta": os.environ.get("REMOVEBG_UPLOAD_DIR") or None,
+        "max_pixels": int(float(os.environ.get("REMOVEBG_MAX_MEGAPIXELS", 40)) * 1_000_000),
+    }
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Variantes quantizadas dos modelos (INT8 / FP16), geradas por quantizar.py.
+Cada variante aprovada fica em REMOVEBG_VARIANTES_DIR como `<nome>.onnx` + `<nome>.json`
+(modelo base, tipo, IoU e erro contra o FP32) e vira mais um valor de `modelo`.
+"""
+
+import json
+import os
+from pathlib import Path
+
+
+def pasta_variantes() -> Path:
+    """REMOVEBG_VARIANTES_DIR (padrão: `variantes` dentro da pasta de modelos do rembg)."""
+    padrao = Path(os.environ.get("U2NET_HOME", "~/.u2net")).expanduser() / "variantes"
+    return Path(os.environ.get("REMOVEBG_VARIANTES_DIR", padrao)).expanduser()
+
+
+def variantes(pasta: str | Path | None = None) -> dict[str, dict]:
+    """Variantes aprovadas: nome -> metadados (`base`, `tipo`, `iou`, `mae`, ...)."""
+    pasta = Path(pasta) if pasta is not None else pasta_variantes()
+    encontradas = {}
+    if not pasta.is_dir():
+        return encontradas
+    for meta in sorted(pasta.glob("*.json")):
+        try:
+            info = json.loads(meta.read_text())
+        except (OSError, json.JSONDecodeError):
+            continue
+        # O modelo base só é conferido no rembg ao abrir a sessão: importar o rembg aqui custaria segundos
+        if (pasta / f"{meta.stem}.onnx").exists() and isinstance(info.get("base"), str):
+            encontradas[meta.stem] = {**info, "caminho": str(pasta / f"{meta.stem}.onnx")}
+    return encontradas
+
+
+def descricao(nome: str, info: dict) -> str:
+    return f"{info['base']} {info['tipo']} (IoU {info['iou']:.3f} contra o FP32)"
+
+
+def nova_sessao(modelo: str, *args, **kwargs):
+    """
+    new_session do rembg que também abre as variantes: a sessão é da mesma classe
+    do modelo base (mesmo pré e pós-processamento), só o arquivo .onnx muda.
+    """
+    import onnxruntime as ort
+    from rembg import new_session
+    from rembg.sessions import sessions
+
+    info = variantes().get(modelo)
+    if info is None:
+        return new_session(modelo, *args, **kwargs)
+
+    if info["base"] not in sessions:
+        raise ValueError(f"Variante {modelo}: modelo base desconhecido pelo rembg ({info['base']})")
+    base = sessions[info["base"]]
+    caminho = info["caminho"]
+
+    class Variante(base):
+        @classmethod
+        def download_models(cls, *a, **k):
+            return caminho
+
+    # Mesmas threads que new_session configura a partir de OMP_NUM_THREADS
+    sess_opts = kwargs.pop("sess_opts", None) or ort.SessionOptions()
+    if "OMP_NUM_THREADS" in os.environ:
+        threads = int(os.environ["OMP_NUM_THREADS"])
+        sess_opts.inter_op_num_threads = sess_opts.inter_op_num_threads or threads
+        sess_opts.intra_op_num_threads = sess_opts.intra_op_num_threads or threads
+    return Variante(info["base"], sess_opts, *args, **kwargs)
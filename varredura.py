@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Varredura recursiva e preguiçosa de árvores de imagens (os.scandir).
+Os arquivos são entregues conforme são encontrados: o processamento começa na hora
+e a memória não cresce com o tamanho da árvore.
+"""
+
+import hashlib
+import os
+from fnmatch import fnmatchcase
+from pathlib import Path, PurePosixPath
+from typing import Iterator
+
+
+class Filtro:
+    """
+    Decide quais arquivos e pastas entram na varredura.
+
+    `incluir`/`excluir` são globs comparados com o caminho relativo à raiz (ex: `fotos/*.jpg`,
+    `*/miniaturas/*`) e também só com o nome (ex: `*.jpg`, `miniaturas`). Uma pasta excluída
+    não é percorrida. `ignorar` são pastas puladas sempre (ex: a pasta de saída).
+    """
+
+    def __init__(
+        self,
+        raiz: str | Path,
+        extensoes: tuple[str, ...],
+        incluir: tuple[str, ...] = (),
+        excluir: tuple[str, ...] = (),
+        ignorar: tuple[str | Path, ...] = (),
+    ):
+        self.raiz = Path(raiz)
+        self.extensoes = tuple(e.lower() for e in extensoes)
+        self.incluir = tuple(incluir)
+        self.excluir = tuple(excluir)
+        self.ignorar = {Path(p).resolve() for p in ignorar}
+
+    def relativo(self, caminho: Path) -> str:
+        return caminho.relative_to(self.raiz).as_posix()
+
+    @staticmethod
+    def _casa(relativo: str, padroes: tuple[str, ...]) -> bool:
+        nome = relativo.rsplit("/", 1)[-1]
+        return any(fnmatchcase(relativo, p) or fnmatchcase(nome, p) for p in padroes)
+
+    def pasta(self, caminho: Path) -> bool:
+        if caminho.resolve() in self.ignorar:
+            return False
+        return not self._casa(self.relativo(caminho), self.excluir)
+
+    def arquivo(self, caminho: Path) -> bool:
+        """Filtro completo de um arquivo, inclusive pelas pastas acima dele (usado nos eventos do --watch)."""
+        try:
+            relativo = self.relativo(caminho)
+        except ValueError:
+            return False
+        if caminho.suffix.lower() not in self.extensoes:
+            return False
+        partes = PurePosixPath(relativo).parts
+        for i in range(1, len(partes)):
+            if not self.pasta(self.raiz.joinpath(*partes[:i])):
+                return False
+        return self._aceita_nome(relativo)
+
+    def _aceita_nome(self, relativo: str) -> bool:
+        if self.incluir and not self._casa(relativo, self.incluir):
+            return False
+        return not self._casa(relativo, self.excluir)
+
+
+def varrer(filtro: Filtro, recursivo: bool = True) -> Iterator[Path]:
+    """Arquivos aceitos pelo filtro, em profundidade, sem montar a lista inteira."""
+    pilha = [filtro.raiz]
+    while pilha:
+        pasta = pilha.pop()
+        try:
+            it = os.scandir(pasta)
+        except OSError:
+            continue  # sem permissão ou removida durante a varredura
+        with it:
+            for entrada in it:
+                caminho = Path(entrada.path)
+                try:
+                    if entrada.is_dir(follow_symlinks=False):
+                        if recursivo and filtro.pasta(caminho):
+                            pilha.append(caminho)
+                    elif (
+                        entrada.is_file()
+                        and caminho.suffix.lower() in filtro.extensoes
+                        and filtro._aceita_nome(filtro.relativo(caminho))
+                    ):
+                        yield caminho
+                except OSError:
+                    continue
+
+
+def caminho_saida(relativo: str, nome: str, shards: int = 0) -> PurePosixPath:
+    """
+    Caminho relativo do arquivo de saída. Sem shards espelha as pastas da entrada;
+    com shards, distribui por `shards` subpastas numeradas (hash do caminho de entrada)
+    e acrescenta um pedaço do hash ao nome para não colidir arquivos de pastas diferentes.
+    """
+    if not shards:
+        return PurePosixPath(relativo).parent / nome
+    h = hashlib.blake2b(relativo.encode(), digest_size=8).hexdigest()
+    shard = int(h, 16) % shards
+    base, ponto, extensao = nome.rpartition(".")
+    return PurePosixPath(f"{shard:0{len(str(shards - 1))}d}") / f"{base}_{h[:8]}{ponto}{extensao}"
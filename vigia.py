@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Pasta "quente": avisa quando arquivos novos ou modificados terminam de chegar.
+Usa eventos do sistema (inotify via watchdog) se disponível; senão, varre a pasta
+periodicamente comparando tamanho e mtime.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog não instalado: só varredura periódica
+    Observer = None
+
+
+def _assinatura(caminho: Path) -> tuple[int, int] | None:
+    try:
+        st = caminho.stat()
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class _Eventos(FileSystemEventHandler if Observer is not None else object):
+    """Guarda o instante do último evento de cada arquivo."""
+
+    def __init__(self, aceitar: Callable[[Path], bool]):
+        super().__init__()
+        self.aceitar = aceitar
+        self.ultimos: dict[Path, float] = {}
+        self.lock = threading.Lock()
+
+    def _marcar(self, caminho: str):
+        p = Path(caminho)
+        if self.aceitar(p):
+            with self.lock:
+                self.ultimos[p] = time.monotonic()
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._marcar(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._marcar(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._marcar(event.dest_path)
+
+
+def _primeiro_nivel(pasta: Path, aceitar: Callable[[Path], bool]) -> Iterator[Path]:
+    with os.scandir(pasta) as it:
+        for entrada in it:
+            p = Path(entrada.path)
+            if entrada.is_file() and aceitar(p):
+                yield p
+
+
+def _assinaturas(arquivos: Iterable[Path]) -> dict[Path, tuple[int, int]]:
+    estado = {}
+    for p in arquivos:
+        assinatura = _assinatura(p)
+        if assinatura is not None:
+            estado[p] = assinatura
+    return estado
+
+
+def vigiar(
+    pasta: str | Path,
+    aceitar: Callable[[Path], bool],
+    ao_chegar: Callable[[list[Path]], None],
+    intervalo: float = 2.0,
+    estabilizar: float = 1.0,
+    parar: threading.Event | None = None,
+    recursivo: bool = False,
+    listar: Callable[[], Iterable[Path]] | None = None,
+    inicio: Callable[[], None] | None = None,
+):
+    """
+    Chama `ao_chegar(arquivos)` com os arquivos novos/modificados que passaram
+    `estabilizar` segundos sem mudar — na varredura, uma passada inteira (`intervalo`) —
+    para que cópias em andamento não sejam lidas pela metade.
+    Roda até `parar` ser sinalizado ou Ctrl+C. Na varredura, `listar()` dá os arquivos
+    a comparar (padrão: os do primeiro nível aceitos por `aceitar`).
+    `inicio()` roda depois que a vigia começou (observador ligado ou primeira foto da
+    pasta tirada), então arquivos que chegam durante ele (ex: a passada inicial de um
+    lote) também são avisados.
+    """
+    pasta = Path(pasta)
+    parar = parar or threading.Event()
+
+    if Observer is not None:
+        eventos = _Eventos(aceitar)
+        observador = Observer()
+        observador.schedule(eventos, str(pasta), recursive=recursivo)
+        observador.start()
+        try:
+            if inicio is not None:
+                inicio()
+            while not parar.wait(min(intervalo, estabilizar) / 2):
+                agora = time.monotonic()
+                with eventos.lock:
+                    prontos = [p for p, t in eventos.ultimos.items() if agora - t >= estabilizar]
+                    for p in prontos:
+                        del eventos.ultimos[p]
+                prontos = [p for p in prontos if _assinatura(p) is not None]
+                if prontos:
+                    ao_chegar(sorted(prontos))
+        finally:
+            observador.stop()
+            observador.join()
+        return
+
+    # Varredura: um arquivo é processado quando a assinatura se repete entre duas passadas
+    listar = listar or (lambda: _primeiro_nivel(pasta, aceitar))
+    conhecidos = _assinaturas(listar())
+    if inicio is not None:
+        inicio()
+    candidatos: dict[Path, tuple[int, int]] = {}
+    while not parar.wait(intervalo):
+        atual = _assinaturas(listar())
+        prontos = [p for p, assinatura in candidatos.items() if atual.get(p) == assinatura]
+        candidatos = {p: a for p, a in atual.items() if conhecidos.get(p) != a and p not in prontos}
+        for p in prontos:
+            conhecidos[p] = atual[p]
+        if prontos:
+            ao_chegar(sorted(prontos))